@@ -0,0 +1,85 @@
+"""
+Front matter parse and stringify, with PyYAML's python loader and dumper
+versus libyaml's, which parse_front_matter and stringify_front_matter use
+when available
+
+    python benchmarks/front_matter.py [--repeat 3]
+
+Authors with accented names are written double quoted, these are checked to
+fit the line before libyaml emits them, so their stringify includes that
+walk over the data.
+"""
+
+import argparse
+import timeit
+from contextlib import contextmanager
+
+from jtex import utils
+from jtex.DocModel import DocModel
+
+
+def make_front_matter(authors: int, accented: bool):
+    name = "Zoë Müller" if accented else "Jane Smith"
+    return DocModel(
+        dict(
+            title="A Large Collaboration",
+            authors=[
+                dict(
+                    name=f"{name} {idx}",
+                    email=f"author{idx}@example.org",
+                    affiliation=f"Institute {idx % 50}",
+                )
+                for idx in range(authors)
+            ],
+        )
+    ).to_dict()
+
+
+@contextmanager
+def python_yaml():
+    loader, dumper = utils.CFullLoader, utils.CDumper
+    utils.CFullLoader, utils.CDumper = None, None
+    try:
+        yield
+    finally:
+        utils.CFullLoader, utils.CDumper = loader, dumper
+
+
+def best(func, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"libyaml: {utils.CFullLoader is not None and utils.CDumper is not None}")
+    print(
+        f"{'authors':>8} {'names':>9} {'':>10} {'python':>10} {'libyaml':>10} {'speedup':>8}"
+    )
+    for authors in [10, 1000, 10000]:
+        for accented in [False, True]:
+            data = make_front_matter(authors, accented)
+            text = utils.stringify_front_matter(data) + "content\n"
+            with python_yaml():
+                assert utils.stringify_front_matter(data) + "content\n" == text
+                assert utils.parse_front_matter(text)[0] == data
+            assert utils.parse_front_matter(text)[0] == data
+
+            functions = dict(
+                parse=lambda: utils.parse_front_matter(text),
+                stringify=lambda: utils.stringify_front_matter(data),
+            )
+            for name, func in functions.items():
+                with python_yaml():
+                    slow = best(func, args.repeat)
+                fast = best(func, args.repeat)
+                print(
+                    f"{authors:>8} {'accented' if accented else 'ascii':>9} {name:>10}"
+                    f" {slow * 1000:>8.1f}ms {fast * 1000:>8.1f}ms {slow / fast:>7.1f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Content transform scaling, applying N transforms one pass each versus fused
+into a single pass by the TransformEngine
+
+    python benchmarks/transforms.py [--lines 20000] [--every 20]
+
+The fused scan costs about the same however many transforms are active, while
+sequential passes grow linearly. Each match costs a python call in the fused
+engine though, so with matches on nearly every line (--every 1) and only a few
+transforms the sequential passes, which substitute entirely in C, are faster.
+"""
+
+import argparse
+import timeit
+
+from jtex.options import RegexTransform
+from jtex.TransformEngine import TransformEngine
+
+
+def make_transforms(count: int):
+    return [RegexTransform(rf"\\cmd{idx}{{", rf"\\new{idx}{{") for idx in range(count)]
+
+
+def make_content(lines: int, every: int) -> str:
+    """
+    Prose with a command for one of the transforms on every `every` lines
+    """
+    return "".join(
+        (
+            f"Some text with \\cmd{i % 7}{{arg}} in line {i}.\n"
+            if i % every == 0
+            else f"Some text with \\emph{{words}} and \\citep{{ref{i}}} in line {i}.\n"
+        )
+        for i in range(lines)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--every", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_content(args.lines, args.every)
+    print(f"content: {len(content) / 1024:.0f} KiB")
+    print(f"{'transforms':>10} {'sequential':>12} {'fused':>12} {'speedup':>8}")
+    for count in [1, 2, 4, 8, 16, 32]:
+        transforms = make_transforms(count)
+        engine = TransformEngine(transforms)
+
+        def sequential():
+            text = content
+            for transform in transforms:
+                text = transform(text)
+            return text
+
+        assert engine(content) == sequential()
+        seq = min(timeit.repeat(sequential, number=1, repeat=args.repeat))
+        fused = min(
+            timeit.repeat(lambda: engine(content), number=1, repeat=args.repeat)
+        )
+        print(
+            f"{count:>10} {seq * 1000:>10.1f}ms {fused * 1000:>10.1f}ms {seq / fused:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Front matter validation, pykwalify's Core as DocModel used it versus the
+compiled SchemaValidator, on documents with growing author lists
+
+    python benchmarks/validation.py [--repeat 3]
+
+Core is built for each document, so its time includes loading the schema,
+as it did for every DocModel.
+"""
+
+import argparse
+import copy
+import timeit
+
+from mergedeep import merge
+from pykwalify.core import Core
+
+from jtex.DocModel import DEFAULTS, FRONTMATTER_SCHEMA
+from jtex.SchemaValidator import get_validator
+
+
+def make_front_matter(authors: int):
+    return merge(
+        copy.deepcopy(DEFAULTS),
+        dict(
+            title="A Large Collaboration",
+            date=dict(year=2022, month=1, day=1),
+            tags=["physics", "detectors"],
+            authors=[
+                dict(
+                    name=f"Author {idx}",
+                    email=f"author{idx}@example.org",
+                    affiliation=f"Institute {idx % 50}",
+                    is_corresponding=idx == 0,
+                )
+                for idx in range(authors)
+            ],
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    validator = get_validator(FRONTMATTER_SCHEMA)
+    assert validator is not None
+    print(f"{'authors':>8} {'pykwalify':>12} {'compiled':>12} {'speedup':>8}")
+    for authors in [10, 1000, 10000]:
+        data = make_front_matter(authors)
+
+        def pykwalify():
+            Core(source_data=data, schema_files=[FRONTMATTER_SCHEMA]).validate()
+
+        def compiled():
+            validator.validate(data)
+
+        slow = min(timeit.repeat(pykwalify, number=1, repeat=args.repeat))
+        fast = min(timeit.repeat(compiled, number=1, repeat=args.repeat))
+        print(
+            f"{authors:>8} {slow * 1000:>10.2f}ms {fast * 1000:>10.2f}ms {slow / fast:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import logging
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .DefBuilder import DefBuilder
+from .DocModel import DocModel
+from .FileSystem import DiskFileSystem
+from .LatexBuilder import LatexBuilder
+from .PublicTemplateLoader import PublicTemplateLoader
+from .RendererRegistry import registry
+from .TemplateArchive import is_archive
+from .TemplateLoader import DEFAULT_TEMPLATE_PATH, TEMPLATE_ONLY_FILES, TemplateLoader
+from .TemplateOptions import TemplateOptions
+from .TemplateRenderer import TemplateRenderer, UndefinedPolicy
+
+
+class BatchItem:
+    """
+    A document to build, written to its own target folder
+    """
+
+    def __init__(
+        self,
+        docmodel: DocModel,
+        content: Union[str, List[str]],
+        target_folder: str,
+        tagged: Optional[Dict[str, str]] = None,
+        bibtex: Optional[str] = None,
+        name: Optional[str] = None,
+    ):
+        self.docmodel = docmodel
+        # a list of chunks is built as chapters by templates with a book layout
+        self.content = [content] if isinstance(content, str) else content
+        self.target_folder = target_folder
+        self.tagged = tagged if tagged is not None else {}
+        self.bibtex = bibtex
+        self.name = name if name is not None else target_folder
+
+
+class BatchResult:
+    def __init__(
+        self, name: str, target_folder: str, seconds: float, error: Optional[str]
+    ):
+        self.name = name
+        self.target_folder = target_folder
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self) -> Dict:
+        return dict(
+            name=self.name,
+            target_folder=self.target_folder,
+            seconds=self.seconds,
+            error=self.error,
+        )
+
+
+class BatchState:
+    """
+    Everything loaded once per process and shared by the documents it builds
+    """
+
+    def __init__(
+        self,
+        staging_folder: str,
+        options: TemplateOptions,
+        renderer: TemplateRenderer,
+    ):
+        self.staging_folder = staging_folder
+        self.options = options
+        self.renderer = renderer
+        self.def_builder = DefBuilder()
+
+    def builder_for(
+        self, target_folder: str, input_paths: Optional[List[str]] = None
+    ) -> LatexBuilder:
+        """
+        Copy the template assets into target_folder and return a builder writing there
+        """
+        DiskFileSystem().copy_tree(
+            self.staging_folder, target_folder, exclude=TEMPLATE_ONLY_FILES
+        )
+        # documents are already built in parallel, so chapters are written in-process
+        return LatexBuilder(
+            self.options,
+            self.renderer,
+            target_folder,
+            self.def_builder,
+            jobs=1,
+            input_paths=input_paths,
+        )
+
+    @staticmethod
+    def from_staging(
+        staging_folder: str,
+        template_location: Optional[str],
+        undefined_policy: UndefinedPolicy,
+    ) -> "BatchState":
+        """
+        State for assets staged in staging_folder and the template found at
+        template_location, or the builtin template if None
+        """
+        if template_location is None:
+            options = TemplateOptions(DEFAULT_TEMPLATE_PATH)
+            renderer = registry.get_builtin(undefined_policy)
+        else:
+            options = TemplateOptions(template_location)
+            renderer = (
+                registry.get_archive(template_location, undefined_policy)
+                if is_archive(template_location)
+                else registry.get_folder(template_location, undefined_policy)
+            )
+        return BatchState(staging_folder, options, renderer)
+
+
+BatchTask = Callable[[BatchState, Any], None]
+
+# state of a pool worker, loaded once by _init_worker
+_worker_state: Optional[BatchState] = None
+
+
+def _init_worker(
+    staging_folder: str, template_location: Optional[str], undefined_policy: str
+):
+    global _worker_state
+    _worker_state = BatchState.from_staging(
+        staging_folder, template_location, UndefinedPolicy(undefined_policy)
+    )
+
+
+def _run_in_worker(task: BatchTask, item: Any) -> BatchResult:
+    if _worker_state is None:
+        raise ValueError("Batch worker not initialized")
+    return run_task(task, _worker_state, item)
+
+
+def run_task(task: BatchTask, state: BatchState, item: Any) -> BatchResult:
+    """
+    Run task for one item, timing it and turning any failure into the result
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        task(state, item)
+    except Exception as err:  # isolate failures to the document
+        logging.error("Could not build %s: %s", item.name, err)
+        error = f"{type(err).__name__}: {err}"
+    return BatchResult(
+        item.name, item.target_folder, time.perf_counter() - start, error
+    )
+
+
+def build_item(state: BatchState, item: BatchItem):
+    """
+    Build one document from the loaded template
+    """
+    builder = state.builder_for(item.target_folder)
+    builder.build(
+        item.docmodel,
+        item.content,
+        item.tagged,
+        bibtex=item.bibtex,
+        raise_if_invalid=item.docmodel.get("jtex.strict", bool, False),
+        stream=True,
+    )
+
+
+class BatchBuilder:
+    """
+    Builds many documents against one template
+
+    The template is fetched or copied once into a staging folder, and the
+    TemplateOptions, renderer and defs are loaded once per process, then each
+    document is built into its own target folder. With jobs > 1 documents are
+    built across a pool of worker processes. A failing document is reported in
+    its BatchResult and does not stop the rest of the batch.
+    """
+
+    def __init__(
+        self,
+        template_path: Optional[str] = None,
+        template_name: Optional[str] = None,
+        jobs: int = 1,
+        staging_folder: Optional[str] = None,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+    ):
+        self.template_path = template_path
+        self.template_name = template_name
+        self.jobs = max(1, jobs)
+        self.undefined_policy = UndefinedPolicy(undefined_policy)
+        self._owns_staging = staging_folder is None
+        self.staging_folder = (
+            staging_folder
+            if staging_folder is not None
+            else tempfile.mkdtemp(prefix="jtex-batch-")
+        )
+        self._state: Optional[BatchState] = None
+        self._template_location: Optional[str] = None
+        self._loader: Optional[TemplateLoader] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._loader is not None:
+            self._loader.close()
+            self._loader = None
+        if self._owns_staging:
+            shutil.rmtree(self.staging_folder, ignore_errors=True)
+
+    @property
+    def builtin(self):
+        return self.template_path is None and self.template_name is None
+
+    def load(self) -> BatchState:
+        """
+        Fetch the template into the staging folder, once
+        """
+        if self._state is not None:
+            return self._state
+        if self.builtin:
+            TemplateLoader(
+                self.staging_folder, undefined_policy=self.undefined_policy
+            ).initialise_with_builtin_template()
+        elif self.template_path is not None:
+            loader = TemplateLoader(
+                self.staging_folder, undefined_policy=self.undefined_policy
+            )
+            loader.initialise_from_path(self.template_path)
+            self._template_location = loader.template_location
+        elif self.template_name is not None:
+            loader = PublicTemplateLoader(
+                self.staging_folder, undefined_policy=self.undefined_policy
+            )
+            loader.initialise_from_template_api(self.template_name)
+            self._template_location = loader.template_location
+            # the template is read from in place until the batch is closed
+            self._loader = loader
+        self._state = BatchState.from_staging(
+            self.staging_folder, self._template_location, self.undefined_policy
+        )
+        return self._state
+
+    def run(
+        self, task: BatchTask, items: List[Any]
+    ) -> Iterator[Tuple[int, BatchResult]]:
+        """
+        Run task for every item, yielding (index, result) pairs as they complete
+
+        task must be a module level function so it can be sent to worker processes,
+        items must have a name and a target_folder.
+        """
+        state = self.load()
+        if self.jobs == 1 or len(items) <= 1:
+            for idx, item in enumerate(items):
+                yield idx, run_task(task, state, item)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_worker,
+            initargs=(
+                self.staging_folder,
+                self._template_location,
+                self.undefined_policy.value,
+            ),
+        ) as executor:
+            futures = {
+                executor.submit(_run_in_worker, task, item): idx
+                for idx, item in enumerate(items)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    result = future.result()
+                except Exception as err:  # e.g. a worker process died
+                    item = items[idx]
+                    result = BatchResult(
+                        item.name,
+                        item.target_folder,
+                        0.0,
+                        f"{type(err).__name__}: {err}",
+                    )
+                yield idx, result
+
+    def build(self, items: List[BatchItem]) -> List[BatchResult]:
+        """
+        Build every document, returning results in the order of items
+        """
+        results: List[Optional[BatchResult]] = [None] * len(items)
+        for idx, result in self.run(build_item, items):
+            logging.info(
+                "Built %s in %.3fs%s",
+                result.name,
+                result.seconds,
+                "" if result.ok else f" - FAILED {result.error}",
+            )
+            results[idx] = result
+        return [r for r in results if r is not None]
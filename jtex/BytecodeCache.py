@@ -0,0 +1,130 @@
+import fnmatch
+import hashlib
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import jinja2
+from jinja2 import Environment
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+from .utils import get_cache_dir
+from .version import __version__
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# environment settings that change the code jinja generates for a given source
+SYNTAX_SETTINGS = [
+    "block_start_string",
+    "block_end_string",
+    "variable_start_string",
+    "variable_end_string",
+    "comment_start_string",
+    "comment_end_string",
+    "line_statement_prefix",
+    "line_comment_prefix",
+    "trim_blocks",
+    "lstrip_blocks",
+    "newline_sequence",
+    "keep_trailing_newline",
+]
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    On-disk cache of compiled templates, shared between processes and builds
+
+    Entries are keyed on the template source, the jtex and jinja versions and the
+    custom delimiter configuration of the environment, so a change to any of
+    these produces a miss rather than stale code. The directory is kept under
+    max_size bytes by evicting the least recently used entries.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory, "__jtex_%s.cache")
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(environment: Environment, name: str, source: str) -> str:
+        syntax = [repr(getattr(environment, s, None)) for s in SYNTAX_SETTINGS]
+        hasher = hashlib.sha1()
+        hasher.update(f"{__version__}|{jinja2.__version__}|{name}|".encode("utf-8"))
+        hasher.update("|".join(syntax).encode("utf-8"))
+        hasher.update(source.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get_bucket(
+        self,
+        environment: Environment,
+        name: str,
+        filename: Optional[str],
+        source: str,
+    ) -> Bucket:
+        key = self.get_key(environment, name, source)
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket: Bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            # record the hit so eviction is least recently used
+            try:
+                os.utime(self._get_cache_filename(bucket))
+            except OSError:
+                pass
+
+    def dump_bytecode(self, bucket: Bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as err:
+            logging.warning("Could not write template bytecode cache: %s", err)
+            return
+        self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for filename in fnmatch.filter(
+            os.listdir(self.directory), self.pattern % ("*",)
+        ):
+            full_path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, full_path))
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_size
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, full_path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(full_path)
+                logging.info("Evicted %s from template bytecode cache", full_path)
+            except OSError:
+                pass
+            total -= size
+
+
+def get_default_bytecode_cache() -> Optional[TemplateBytecodeCache]:
+    """
+    The bytecode cache used by templates loaded through a TemplateLoader
+
+    Lives in JTEX_CACHE_DIR/bytecode, size is set by JTEX_BYTECODE_CACHE_SIZE (bytes)
+    and caching is disabled entirely by setting JTEX_NO_CACHE
+    """
+    if os.getenv("JTEX_NO_CACHE"):
+        return None
+    max_size = int(os.getenv("JTEX_BYTECODE_CACHE_SIZE", DEFAULT_MAX_SIZE))
+    try:
+        return TemplateBytecodeCache(get_cache_dir("bytecode"), max_size)
+    except OSError as err:
+        logging.warning("Template bytecode cache unavailable: %s", err)
+        return None
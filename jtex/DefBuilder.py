@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Callable, Dict, List, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import pkg_resources
 
+from .DefStore import def_store
+from .FileSystem import DiskFileSystem, FileSystem
 from .options import (
     AsideSchemaOption,
     BibstyleSchemaOption,
@@ -20,12 +22,17 @@ from .options import (
     StringSchemaOption,
 )
 from .TemplateOptions import TemplateOptions
-from .utils import just_log_errors, log_and_raise_errors
+from .Timings import timed
+from .TransformEngine import TransformEngine
+from .utils import content_digest, just_log_errors, log_and_raise_errors
+
+DEFS_PATH = pkg_resources.resource_filename("jtex", "defs")
+
+BASE_DEFS = ["passopts-base.def", "package-base.def", "setup-base.def"]
 
 
 def get_def_file_path(filename: str):
-    def_path = pkg_resources.resource_filename("jtex", "defs")
-    return os.path.join(def_path, filename)
+    return os.path.join(DEFS_PATH, filename)
 
 
 def get_def_template_file_path(template_location: str, filename: str):
@@ -34,14 +41,12 @@ def get_def_template_file_path(template_location: str, filename: str):
 
 @just_log_errors(lambda *args: f"Could not open def file at {args[0]}, skipping...")
 def get_def_from_pkg(filename: str):
-    with open(get_def_file_path(filename), "r") as file:
-        return file.read()
+    return def_store.read(get_def_file_path(filename))
 
 
 @just_log_errors(lambda *args: f"Could not open def file at {args[0]}, skipping...")
 def read_from_file(fullpath: str):
-    with open(fullpath, "r") as file:
-        return file.read()
+    return def_store.read(fullpath)
 
 
 class DefBuilder:
@@ -53,6 +58,10 @@ class DefBuilder:
             str, Union[StringSchemaOption, BooleanSchemaOption]
         ] = {}
         self.defs_path: str = ""
+        # resolved and serialized defs for the last options built, reused for repeated builds
+        self._resolved_for: Optional[TemplateOptions] = None
+        self._resolved: List[Union[SchemaOptionDefs, CustomTemplateDefs]] = []
+        def_store.load_folder(DEFS_PATH)
 
         self.schema_options["aside"] = AsideSchemaOption()
         self.schema_options["callout"] = CalloutSchemaOption()
@@ -64,10 +73,33 @@ class DefBuilder:
         self.schema_options["bibstyle"] = BibstyleSchemaOption()
         self.schema_options["citestyle"] = CitestyleSchemaOption()
 
-    def build(self, options: TemplateOptions, target_path: str):
-        def_paths = self.compose(options)
-        def_contents = self.serialize(*def_paths)
-        self.write(target_path, *def_contents)
+    def build(
+        self,
+        options: TemplateOptions,
+        target_path: str,
+        fs: Optional[FileSystem] = None,
+    ) -> Tuple[List[str], Dict[str, str]]:
+        return self.write(target_path, *self.prepare(options), fs=fs)
+
+    def prepare(self, options: TemplateOptions) -> Tuple[str, str, str]:
+        """
+        Compose and serialize the defs for options
+
+        Serialized defs are shared through the def store between builds and
+        builders with the same set of def files, and reused while none of the
+        files have changed.
+        """
+        with timed("defs.compose"):
+            def_paths = self.compose(options)
+        with timed("defs.serialize"):
+            paths = [get_def_file_path(b) for b in BASE_DEFS] + [
+                p for kind in def_paths for p in kind
+            ]
+            return def_store.bundle(
+                tuple(tuple(kind) for kind in def_paths),
+                paths,
+                lambda: self.serialize(*def_paths),
+            )
 
     def _resolve_options(
         self, template_options: TemplateOptions
@@ -75,6 +107,8 @@ class DefBuilder:
         # iterate over registered options, check to see if the
         # option has been set in the template options, if not
         # use the default
+        if self._resolved_for is template_options:
+            return self._resolved
         defs_list: List[Union[SchemaOptionDefs, CustomTemplateDefs]] = []
         logging.info("Iterating over %s options", len(self.schema_options))
         for name, schema_option in self.schema_options.items():
@@ -93,6 +127,8 @@ class DefBuilder:
                 )
             defs_list.append(defs)
 
+        self._resolved_for = template_options
+        self._resolved = defs_list
         return defs_list
 
     def compose(self, template_options: TemplateOptions):
@@ -121,10 +157,11 @@ class DefBuilder:
                     )
                     setup_paths.append(full_path)
 
-        # dedupe - don't care about ordering
-        passopts_paths = list(set(passopts_paths))
-        packages_paths = list(set(packages_paths))
-        setup_paths = list(set(setup_paths))
+        # dedupe keeping the first occurrence, so defs stay in the order the
+        # options are registered and declare them and the output is byte stable
+        passopts_paths = list(dict.fromkeys(passopts_paths))
+        packages_paths = list(dict.fromkeys(packages_paths))
+        setup_paths = list(dict.fromkeys(setup_paths))
 
         logging.info("passopts %s\n", passopts_paths)
         logging.info("packages %s\n", packages_paths)
@@ -148,15 +185,23 @@ class DefBuilder:
                 list_of_transforms += defs.transforms
         return list_of_transforms
 
+    def get_transform_engine(
+        self, template_options: TemplateOptions
+    ) -> TransformEngine:
+        """
+        The content transforms for the options, combined to run in a single pass
+        """
+        return TransformEngine(self.get_content_transforms(template_options))
+
     def serialize(self, passopts_paths, packages_paths, setup_paths):
         """
         Load defs from files and concatenate
         """
 
         # base configuration
-        base_passopts = get_def_from_pkg("passopts-base.def")
-        base_packages = get_def_from_pkg("package-base.def")
-        base_setup = get_def_from_pkg("setup-base.def")
+        base_passopts, base_packages, base_setup = [
+            get_def_from_pkg(b) for b in BASE_DEFS
+        ]
 
         # read contents from def files
         passopts_paths = [read_from_file(p) for p in passopts_paths]
@@ -174,20 +219,45 @@ class DefBuilder:
 
         return passopts, packages, setup
 
-    @log_and_raise_errors(lambda *args: f"Could not write defs to: {args[0]}")
-    def write(self, target_path: str, passopts: str, packages: str, setup: str):
-        with open(
-            os.path.join(target_path, "curvenote.passopts.def"), "w"
-        ) as defs_file:
-            defs_file.write(passopts)
-        with open(
-            os.path.join(target_path, "curvenote.packages.def"), "w"
-        ) as defs_file:
-            defs_file.write(packages)
-        with open(os.path.join(target_path, "curvenote.setup.def"), "w") as defs_file:
-            defs_file.write(setup)
-        with open(os.path.join(target_path, "curvenote.def"), "w") as defs_file:
-            defs_file.write(
+    def files(self, options: TemplateOptions) -> Dict[str, str]:
+        """
+        Def files for options by filename, without writing them
+        """
+        return self.def_files(*self.prepare(options))
+
+    @staticmethod
+    def def_files(passopts: str, packages: str, setup: str) -> Dict[str, str]:
+        return {
+            "curvenote.passopts.def": passopts,
+            "curvenote.packages.def": packages,
+            "curvenote.setup.def": setup,
+            "curvenote.def": (
                 "% Start Curvenote Definitions\n\\input{curvenote.passopts.def}\n"
                 "\\input{curvenote.packages.def}\n\\input{curvenote.setup.def}\n% End Curvenote Definitions\n"
-            )
+            ),
+        }
+
+    @log_and_raise_errors(lambda *args: f"Could not write defs to: {args[0]}")
+    def write(
+        self,
+        target_path: str,
+        passopts: str,
+        packages: str,
+        setup: str,
+        fs: Optional[FileSystem] = None,
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Write the def files, skipping any already up to date, and return the
+        paths of those actually written along with the sha256 of every def file
+        by filename, stable across runs
+        """
+        fs = fs if fs is not None else DiskFileSystem()
+        changed = []
+        digests = {}
+        with timed("defs.write"):
+            for filename, content in self.def_files(passopts, packages, setup).items():
+                digests[filename] = content_digest(content)
+                path = os.path.join(target_path, filename)
+                if fs.write_if_changed(path, content):
+                    changed.append(path)
+        return changed, digests
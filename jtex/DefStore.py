@@ -0,0 +1,109 @@
+import os
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from .TemplateArchive import archive_signature, read_file, split_archive_path
+from .utils import LRUCache
+
+T = TypeVar("T")
+
+DEFAULT_MAX_BUNDLES = 64
+
+Signature = Optional[Tuple[int, int]]
+
+
+def signature(path: str) -> Signature:
+    """
+    mtime and size of a file, or of the template archive it is in, None if it
+    cannot be read
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        in_archive = split_archive_path(path)
+        return archive_signature(in_archive[0]) if in_archive is not None else None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DefStore:
+    """
+    Process wide store of def file contents and the def bundles built from them
+
+    Paths into a template archive, `template.zip/code.def`, are read from the
+    archive and revalidated by the archive's mtime and size.
+
+    File contents are kept after the first read and reused while the file's
+    mtime and size are unchanged. Bundles, the serialized defs for a set of
+    def files, are kept by key in a bounded LRU and reused while none of their
+    files have changed, so a repeated configuration costs a stat per file and
+    no reads.
+    """
+
+    def __init__(self, max_bundles: int = DEFAULT_MAX_BUNDLES):
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[Signature, str]] = {}
+        self._loaded_folders: Set[str] = set()
+        self._bundles = LRUCache(max_bundles)
+        self.reads = 0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            files=len(self._files), reads=self.reads, bundles=self._bundles.stats
+        )
+
+    def load_folder(self, folder: str):
+        """
+        Read every def file in folder, once per process
+        """
+        if folder in self._loaded_folders:
+            return
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".def"):
+                self.read(os.path.join(folder, filename))
+        self._loaded_folders.add(folder)
+
+    def read(self, path: str) -> str:
+        current = signature(path)
+        cached = self._files.get(path)
+        if current is not None and cached is not None and cached[0] == current:
+            return cached[1]
+        content = read_file(path).decode("utf-8")
+        with self._lock:
+            self.reads += 1
+            self._files[path] = (current, content)
+        return content
+
+    def bundle(
+        self, key: Hashable, paths: Iterable[str], factory: Callable[[], T]
+    ) -> T:
+        """
+        The bundle stored for key, built with factory if it is missing or any
+        of the files in paths changed since it was built
+        """
+        signatures = tuple(signature(path) for path in paths)
+        cached = self._bundles.get(key)
+        if cached is not None and cached[0] == signatures:
+            return cached[1]
+        value = factory()
+        self._bundles.put(key, (signatures, value))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._loaded_folders.clear()
+        self._bundles.clear()
+
+
+def_store = DefStore(int(os.getenv("JTEX_MAX_DEF_BUNDLES", DEFAULT_MAX_BUNDLES)))
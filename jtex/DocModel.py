@@ -1,10 +1,11 @@
 import os
-from typing import Any, Dict, NewType, Type, cast
+from typing import Any, Dict, List, NewType, Optional, Type, cast
 
-from mergedeep import merge
 from pykwalify.core import Core
 
+from .SchemaValidator import get_validator
 from .TemplateOptions import SCHEMA_PATH
+from .Timings import timed
 
 DEFAULTS = dict(
     jtex=dict(
@@ -18,6 +19,44 @@ DEFAULTS = dict(
     )
 )
 
+FRONTMATTER_SCHEMA = os.path.join(SCHEMA_PATH, "frontmatter.schema.yml")
+
+
+def resolve_layers(layers: List[Dict], copy_base: bool = False) -> Dict:
+    """
+    Merge layers of nested dicts, later layers taking precedence, as a deep
+    merge would but sharing structure with the layers
+
+    New dicts are only made where a key holds a dict in more than one layer,
+    any other value, large lists of authors say, is the layer's own object.
+    With copy_base, dicts that come from the first layer alone are copied too,
+    so it can be shared between models without being exposed to them.
+    """
+    if len(layers) == 1 and not copy_base:
+        return layers[0]
+    stacks: Dict[Any, List[Any]] = {}
+    from_base: Dict[Any, bool] = {}
+    for idx, layer in enumerate(layers):
+        for key, value in layer.items():
+            stack = stacks.get(key)
+            if (
+                stack is not None
+                and isinstance(value, dict)
+                and isinstance(stack[-1], dict)
+            ):
+                stack.append(value)
+            else:
+                stacks[key] = [value]
+                from_base[key] = idx == 0
+    resolved = {}
+    for key, stack in stacks.items():
+        copy = copy_base and from_base[key]
+        if len(stack) > 1 or (copy and isinstance(stack[0], dict)):
+            resolved[key] = resolve_layers(stack, copy)
+        else:
+            resolved[key] = stack[0]
+    return resolved
+
 
 class DocModel:
     @staticmethod
@@ -30,20 +69,39 @@ class DocModel:
             rv = rv[key]
         return rv
 
-    def __init__(self, data: Dict, ensure_defaults=True):
-        self.model = self.ensure_defaults(data) if ensure_defaults else data
-        self._parser = Core(
-            source_data=self.model,
-            schema_files=[
-                os.path.join(SCHEMA_PATH, "frontmatter.schema.yml"),
-            ],
-        )
-        self._parser.validate(raise_exception=True)
-
-    def ensure_defaults(self, data: Dict):
-        x = DEFAULTS.copy()
-        merge(x, data)
-        return x
+    def __init__(
+        self,
+        data: Dict,
+        ensure_defaults=True,
+        overrides: Optional[Dict] = None,
+    ):
+        """
+        A document's data, the defaults, then the front matter in data, then
+        any overrides, such as those given on the command line
+
+        The layers are not copied or modified, the model is resolved from them
+        sharing whatever it can, so values read from a DocModel must be treated
+        as read only.
+        """
+        layers = [DEFAULTS] if ensure_defaults else []
+        layers += [data] + ([overrides] if overrides else [])
+        self.model = resolve_layers(layers, copy_base=ensure_defaults)
+        # the schema is compiled once per process, pykwalify is only used
+        # directly if the schema outgrows what the compiled validator supports
+        validator = get_validator(FRONTMATTER_SCHEMA)
+        with timed("docmodel_validation"):
+            if validator is not None:
+                validator.validate(self.model)
+            else:
+                Core(
+                    source_data=self.model, schema_files=[FRONTMATTER_SCHEMA]
+                ).validate(raise_exception=True)
+
+    def with_overrides(self, overrides: Dict) -> "DocModel":
+        """
+        A new DocModel with overrides layered over this one's data
+        """
+        return DocModel(self.model, ensure_defaults=False, overrides=overrides)
 
     def get(self, path: str, type: Type = Any, default: Any = None):
         """
@@ -59,4 +117,7 @@ class DocModel:
             return default
 
     def to_dict(self) -> Dict:
-        return cast(Dict, self.model).copy()
+        """
+        The resolved data, a new dict at the top level sharing nested values
+        """
+        return dict(cast(Dict, self.model))
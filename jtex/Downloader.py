@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+
+# progress(received, total) is called after each chunk, total is None when
+# the server does not send a length
+Progress = Callable[[int, Optional[int]], None]
+
+STREAM_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+def chunk_size_for(length: Optional[int]) -> int:
+    """
+    Read size for a download, an eighth of its length within bounds, so small
+    files arrive in a few reads and large ones without buffering too much
+    """
+    if length is None:
+        return DEFAULT_CHUNK_SIZE
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, length // 8))
+
+
+class DownloadResult:
+    """
+    Outcome of a download, status is 304 when a conditional request found the
+    file unchanged and nothing was written
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        sha256: Optional[str] = None,
+        size: int = 0,
+        resumed_from: int = 0,
+    ):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.sha256 = sha256
+        self.size = size
+        self.resumed_from = resumed_from
+
+
+class Downloader:
+    """
+    Downloads over a pooled session, resuming partial downloads
+
+    Files are streamed into `<save_path>.part` and moved into place once
+    complete and, if a sha256 is given, verified. An interrupted download is
+    retried with a Range request from where it stopped, guarded by If-Range
+    so a file that changed meanwhile starts over, and a `.part` left by an
+    earlier process is resumed in the same way.
+    """
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        pool_size: int = 8,
+    ):
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        # retries are made by download, resuming from where an attempt stopped,
+        # so the adapter itself does not retry
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._stats = dict(requests=0, downloads=0, resumed=0, bytes=0)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def get_json(self, url: str, timeout=None) -> Any:
+        self._count("requests")
+        resp = self.session.get(url, timeout=timeout or self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def download(
+        self,
+        url: str,
+        save_path: str,
+        sha256: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        progress: Optional[Progress] = None,
+    ) -> DownloadResult:
+        """
+        Download url to save_path, sending any extra headers, such as
+        If-None-Match, with each request
+        """
+        attempt = 0
+        while True:
+            try:
+                result = self._download(url, save_path, headers or {}, progress)
+                break
+            except STREAM_ERRORS as err:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                logging.warning("Download of %s interrupted, resuming: %s", url, err)
+
+        if result.status == 304:
+            return result
+        part_path = f"{save_path}.part"
+        if sha256 is not None and result.sha256 != sha256:
+            self._discard(part_path)
+            raise ValueError(
+                f"Checksum mismatch for {url}, expected {sha256} got {result.sha256}"
+            )
+        os.replace(part_path, save_path)
+        self._discard_meta(part_path)
+        self._count("downloads")
+        return result
+
+    def _download(
+        self,
+        url: str,
+        save_path: str,
+        headers: Dict[str, str],
+        progress: Optional[Progress],
+    ) -> DownloadResult:
+        part_path = f"{save_path}.part"
+        offset = 0
+        # byte ranges and lengths are of the encoded body, keep it unencoded
+        request_headers = {"Accept-Encoding": "identity", **headers}
+        validator = self._read_meta(part_path, url)
+        if validator is not None and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+            if offset > 0:
+                request_headers["Range"] = f"bytes={offset}-"
+                request_headers["If-Range"] = validator
+
+        self._count("requests")
+        with self.session.get(
+            url, headers=request_headers, stream=True, timeout=self.timeout
+        ) as resp:
+            if resp.status_code == 304:
+                return DownloadResult(url, 304, dict(resp.headers))
+            if offset > 0 and (
+                resp.status_code == 416
+                or resp.status_code == 206
+                and self._range_start(resp) != offset
+            ):
+                # the partial file does not fit the current one, start over
+                self._discard(part_path)
+                return self._download(url, save_path, headers, progress)
+            if resp.status_code == 206 and offset > 0:
+                mode = "ab"
+                self._count("resumed")
+            elif resp.status_code == 200:
+                offset = 0
+                mode = "wb"
+            else:
+                raise ValueError(f"Download of {url} failed - {resp.status_code}")
+
+            self._write_meta(part_path, url, resp)
+            hasher = hashlib.sha256()
+            if offset > 0:
+                self._hash_file(part_path, hasher)
+            length = resp.headers.get("Content-Length")
+            total = offset + int(length) if length is not None else None
+            received = offset
+            with open(part_path, mode) as file:
+                for chunk in resp.iter_content(chunk_size=chunk_size_for(total)):
+                    file.write(chunk)
+                    hasher.update(chunk)
+                    received += len(chunk)
+                    self._count("bytes", len(chunk))
+                    if progress is not None:
+                        progress(received, total)
+            if total is not None and received < total:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Received {received} of {total} bytes"
+                )
+            return DownloadResult(
+                url,
+                resp.status_code,
+                dict(resp.headers),
+                hasher.hexdigest(),
+                received,
+                offset,
+            )
+
+    @staticmethod
+    def _range_start(resp: requests.Response) -> Optional[int]:
+        content_range = resp.headers.get("Content-Range", "")
+        try:
+            return int(content_range.split(" ")[1].split("-")[0])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _hash_file(path: str, hasher):
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(DEFAULT_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+
+    @staticmethod
+    def _read_meta(part_path: str, url: str) -> Optional[str]:
+        """
+        The validator to resume part_path with, if it was a download of url
+        """
+        try:
+            with open(f"{part_path}.json", "r") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta.get("validator")
+
+    @staticmethod
+    def _write_meta(part_path: str, url: str, resp: requests.Response):
+        validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        # weak etags cannot be used to resume
+        if validator is None or validator.startswith("W/"):
+            Downloader._discard_meta(part_path)
+            return
+        with open(f"{part_path}.json", "w") as file:
+            json.dump(dict(url=url, validator=validator), file)
+
+    @staticmethod
+    def _discard_meta(part_path: str):
+        try:
+            os.remove(f"{part_path}.json")
+        except OSError:
+            pass
+
+    @staticmethod
+    def _discard(part_path: str):
+        Downloader._discard_meta(part_path)
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+
+_downloader: Optional[Downloader] = None
+_downloader_pid: Optional[int] = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    """
+    The downloader shared within this process, pooled connections are not
+    carried over into forked workers
+    """
+    global _downloader, _downloader_pid
+    with _downloader_lock:
+        if _downloader is None or _downloader_pid != os.getpid():
+            _downloader = Downloader()
+            _downloader_pid = os.getpid()
+        return _downloader
@@ -0,0 +1,308 @@
+import hashlib
+import io
+import os
+import shutil
+import zipfile
+from typing import BinaryIO, Dict, Iterable, List, Union
+
+from .utils import ChangeTrackingWriter, copy_if_changed, write_if_changed
+
+
+class FileSystem:
+    """
+    Where a build writes its outputs
+
+    Builders write through a FileSystem rather than calling open directly, so
+    the same build can go to a folder on disk, to memory or into a zip stream.
+    Sources, templates and content assets, are always read from disk.
+    """
+
+    def exists(self, path: str) -> bool:
+        raise TypeError("Implement in derived class")
+
+    def read(self, path: str) -> bytes:
+        raise TypeError("Implement in derived class")
+
+    def write(self, path: str, data: bytes):
+        raise TypeError("Implement in derived class")
+
+    def open_writer(self, path: str, buffering: int = -1):
+        """
+        Writer for text streamed to path, with write(text), close() and, once
+        closed, a `changed` flag and the `digest` of the content written
+        """
+        raise TypeError("Implement in derived class")
+
+    def remove(self, path: str):
+        raise TypeError("Implement in derived class")
+
+    def rmtree(self, path: str):
+        raise TypeError("Implement in derived class")
+
+    def makedirs(self, path: str):
+        pass
+
+    def listdir(self, path: str) -> List[str]:
+        raise TypeError("Implement in derived class")
+
+    def write_if_changed(self, path: str, content: str) -> bool:
+        """
+        Write content unless path already holds it, returns True if written
+        """
+        data = content.encode("utf-8")
+        if self.exists(path) and self.read(path) == data:
+            return False
+        self.write(path, data)
+        return True
+
+    def copy_file(self, src: str, path: str) -> bool:
+        """
+        Copy the file at src on disk to path, returns True if copied
+        """
+        with open(src, "rb") as file:
+            data = file.read()
+        if self.exists(path) and self.read(path) == data:
+            return False
+        self.write(path, data)
+        return True
+
+    def copy_tree(self, src: str, path: str, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Copy the folder src on disk to path, skipping top level entries named
+        in exclude, and return the paths copied
+        """
+        copied = []
+        excluded = set(exclude)
+        for root, dirs, files in os.walk(src):
+            rel_root = os.path.relpath(root, src)
+            if rel_root == ".":
+                dirs[:] = [d for d in dirs if d not in excluded]
+                files = [f for f in files if f not in excluded]
+                rel_root = ""
+            self.makedirs(os.path.join(path, rel_root))
+            for filename in files:
+                dest = os.path.join(path, rel_root, filename)
+                if self.copy_file(os.path.join(root, filename), dest):
+                    copied.append(dest)
+        return copied
+
+
+class DiskFileSystem(FileSystem):
+    """
+    Paths are paths on disk, unchanged files are not rewritten
+    """
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def read(self, path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+    def write(self, path: str, data: bytes):
+        with open(path, "wb") as file:
+            file.write(data)
+
+    def open_writer(self, path: str, buffering: int = -1):
+        return ChangeTrackingWriter(path, buffering=buffering)
+
+    def remove(self, path: str):
+        os.remove(path)
+
+    def rmtree(self, path: str):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def makedirs(self, path: str):
+        os.makedirs(path, exist_ok=True)
+
+    def listdir(self, path: str) -> List[str]:
+        return os.listdir(path) if os.path.isdir(path) else []
+
+    def write_if_changed(self, path: str, content: str) -> bool:
+        return write_if_changed(path, content)
+
+    def copy_file(self, src: str, path: str) -> bool:
+        return copy_if_changed(src, path)
+
+
+def normalize(path: str) -> str:
+    """
+    Key for a path in a virtual filesystem, relative and with / separators
+    """
+    normalized = os.path.normpath(path).replace(os.sep, "/").lstrip("/")
+    return "" if normalized == "." else normalized
+
+
+class MemoryWriter:
+    def __init__(self, fs: "MemoryFileSystem", path: str):
+        self.path = path
+        self.changed = False
+        self.digest = ""
+        self._fs = fs
+        self._buffer = io.BytesIO()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+
+    def write(self, text: str):
+        self._buffer.write(text.encode("utf-8"))
+
+    def close(self):
+        data = self._buffer.getvalue()
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.changed = not (
+            self._fs.exists(self.path) and self._fs.read(self.path) == data
+        )
+        if self.changed:
+            self._fs.write(self.path, data)
+
+
+class MemoryFileSystem(FileSystem):
+    """
+    Files held in memory, `files` maps each relative path to its bytes
+    """
+
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+
+    def exists(self, path: str) -> bool:
+        key = normalize(path)
+        return key in self.files or any(f.startswith(f"{key}/") for f in self.files)
+
+    def read(self, path: str) -> bytes:
+        try:
+            return self.files[normalize(path)]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+    def write(self, path: str, data: bytes):
+        self.files[normalize(path)] = data
+
+    def open_writer(self, path: str, buffering: int = -1):
+        return MemoryWriter(self, path)
+
+    def remove(self, path: str):
+        self.read(path)
+        del self.files[normalize(path)]
+
+    def rmtree(self, path: str):
+        prefix = f"{normalize(path)}/"
+        for key in [f for f in self.files if f.startswith(prefix)]:
+            del self.files[key]
+
+    def listdir(self, path: str) -> List[str]:
+        prefix = normalize(path)
+        prefix = f"{prefix}/" if prefix else ""
+        return sorted(
+            {f[len(prefix) :].split("/")[0] for f in self.files if f.startswith(prefix)}
+        )
+
+
+class ZipWriter:
+    def __init__(self, fs: "ZipFileSystem", path: str):
+        self.path = path
+        self.changed = True
+        self.digest = ""
+        self._hasher = hashlib.sha256()
+        self._file = fs._open_entry(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self._hasher.update(data)
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+        self.digest = self._hasher.hexdigest()
+
+
+class ZipFileSystem(FileSystem):
+    """
+    Files written one after another into a zip archive
+
+    The archive can be a path or any writable binary stream, seekable or not,
+    and is complete once the filesystem is closed. Entries cannot be read back,
+    replaced or removed once written, a second write to the same path raises a
+    ValueError.
+    """
+
+    def __init__(
+        self,
+        file: Union[str, BinaryIO],
+        compression: int = zipfile.ZIP_DEFLATED,
+    ):
+        self._zip = zipfile.ZipFile(file, "w", compression=compression)
+        self._written: List[str] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._written)
+
+    def _open_entry(self, path: str):
+        key = normalize(path)
+        if key in self._written:
+            raise ValueError(f"{key} has already been written to the zip")
+        self._written.append(key)
+        return self._zip.open(key, "w", force_zip64=True)
+
+    def exists(self, path: str) -> bool:
+        key = normalize(path)
+        return key in self._written or any(
+            f.startswith(f"{key}/") for f in self._written
+        )
+
+    def read(self, path: str) -> bytes:
+        raise ValueError("Files written to a zip cannot be read back")
+
+    def write(self, path: str, data: bytes):
+        with self._open_entry(path) as entry:
+            entry.write(data)
+
+    def open_writer(self, path: str, buffering: int = -1):
+        return ZipWriter(self, path)
+
+    def remove(self, path: str):
+        raise ValueError("Files written to a zip cannot be removed")
+
+    def rmtree(self, path: str):
+        if self.exists(path):
+            raise ValueError("Files written to a zip cannot be removed")
+
+    def listdir(self, path: str) -> List[str]:
+        prefix = normalize(path)
+        prefix = f"{prefix}/" if prefix else ""
+        return sorted(
+            {
+                f[len(prefix) :].split("/")[0]
+                for f in self._written
+                if f.startswith(prefix)
+            }
+        )
+
+    def write_if_changed(self, path: str, content: str) -> bool:
+        self.write(path, content.encode("utf-8"))
+        return True
+
+    def copy_file(self, src: str, path: str) -> bool:
+        with open(src, "rb") as file, self._open_entry(path) as entry:
+            shutil.copyfileobj(file, entry)
+        return True
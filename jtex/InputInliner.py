@@ -0,0 +1,96 @@
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .TemplateArchive import file_exists, read_file
+
+INPUT_COMMAND = re.compile(r"\\(input|include)\{([^}]*)\}")
+COMMENT_START = re.compile(r"(?<!\\)%")
+MAX_DEPTH = 16
+
+
+def include_block(content: str) -> str:
+    """
+    content as inlined for an `\\include`, which starts and ends it on a new page
+    """
+    content = content[:-1] if content.endswith("\n") else content
+    return f"\\clearpage\n{content}\n\\clearpage"
+
+
+class InputInliner:
+    """
+    Replaces `\\input{...}` and `\\include{...}` commands with the content they
+    refer to
+
+    Inputs are resolved against the named files given, such as the def files,
+    then local .tex files found in the search paths, which are passed through
+    transform as the content around them is. Inputs that cannot be resolved
+    are left as they are with a warning, those in comments are left alone.
+    Inlined content is itself inlined, up to MAX_DEPTH levels. `resolved`
+    maps each inlined name to the search path and file it was read from.
+    """
+
+    def __init__(
+        self,
+        files: Dict[str, str],
+        search_paths: List[str],
+        transform: Optional[Callable[[str], str]] = None,
+    ):
+        self.files = files
+        self.search_paths = search_paths
+        self.transform = transform
+        self.inlined: List[str] = []
+        self.unresolved: List[str] = []
+        self.resolved: Dict[str, Tuple[str, str]] = {}
+
+    def _resolve(self, name: str) -> Optional[str]:
+        if name in self.files:
+            return self.files[name]
+        candidates = [name] if os.path.splitext(name)[1] else [f"{name}.tex", name]
+        for search_path in self.search_paths:
+            for candidate in candidates:
+                path = os.path.join(search_path, candidate)
+                if not os.path.isdir(path) and file_exists(path):
+                    self.resolved[name] = (search_path, candidate)
+                    content = read_file(path).decode("utf-8")
+                    return (
+                        content if self.transform is None else self.transform(content)
+                    )
+        return None
+
+    def _inline_line(self, line: str, stack: List[str]) -> str:
+        comment = COMMENT_START.search(line)
+        code, rest = (
+            (line[: comment.start()], line[comment.start() :])
+            if comment
+            else (line, "")
+        )
+        if "\\input" not in code and "\\include" not in code:
+            return line
+
+        def replace(match: re.Match) -> str:
+            command, name = match.group(1), match.group(2).strip()
+            if name in stack or len(stack) >= MAX_DEPTH:
+                logging.warning(
+                    "Not inlining \\%s{%s}, nested too deeply", command, name
+                )
+                return match.group(0)
+            content = self._resolve(name)
+            if content is None:
+                logging.warning("Could not find \\%s{%s} to inline", command, name)
+                self.unresolved.append(name)
+                return match.group(0)
+            self.inlined.append(name)
+            inlined = self.inline(content, stack + [name])
+            if command == "include":
+                return include_block(inlined)
+            return inlined[:-1] if inlined.endswith("\n") else inlined
+
+        return INPUT_COMMAND.sub(replace, code) + rest
+
+    def inline(self, text: str, stack: Optional[List[str]] = None) -> str:
+        stack = stack if stack is not None else []
+        return "".join(
+            self._inline_line(line, stack) for line in text.splitlines(keepends=True)
+        )
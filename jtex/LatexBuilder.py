@@ -1,24 +1,128 @@
+import fnmatch
 import logging
 import os
-import shutil
-from typing import Any, Dict, List, NewType, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NewType,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from .DefBuilder import DefBuilder
 from .DocModel import DocModel
+from .FileSystem import DiskFileSystem, FileSystem
+from .InputInliner import InputInliner, include_block
+from .TemplateLoader import TEMPLATE_ONLY_FILES
 from .TemplateOptions import TemplateOptions
-from .TemplateRenderer import TemplateRenderer
-from .utils import log_and_raise_errors, stringify_front_matter
+from .TemplateRenderer import COMPILED_FOLDER, TemplateRenderer
+from .Timings import timed, timed_call, timed_iter
+from .utils import (
+    content_digest,
+    fingerprint,
+    log_and_raise_errors,
+    stringify_front_matter,
+)
 
 logger = logging.getLogger()
 
+WRITE_BUFFER_SIZE = 1024 * 1024
+# characters transformed and written at a time when streaming
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def apply_transforms(text: str, transforms: List[Callable[[str], str]]) -> str:
+    for transform in transforms:
+        text = transform(text)
+    return text
+
+
+def split_blocks(piece: str, size: int) -> Iterator[str]:
+    """
+    piece in blocks of at most size characters, each cut after a newline
+
+    A line longer than size is kept whole in its own block.
+    """
+    start = 0
+    while len(piece) - start > size:
+        cut = piece.rfind("\n", start, start + size) + 1
+        if cut == 0:
+            cut = piece.find("\n", start + size) + 1
+            if cut == 0:
+                break
+        yield piece[start:cut]
+        start = cut
+    yield piece[start:] if start > 0 else piece
+
+
+def transform_stream(
+    pieces: Iterable[str],
+    transforms: List[Callable[[str], str]],
+    block_size: int = STREAM_BLOCK_SIZE,
+) -> Iterator[str]:
+    """
+    Apply content transforms to a stream of rendered pieces
+
+    Pieces are regrouped on line boundaries before transforming, so transforms
+    see whole lines and must not match across a newline. Pieces larger than
+    block_size, such as the expanded CONTENT, are split into blocks of whole
+    lines, so only a block at a time is transformed and written.
+    """
+    buffer: List[str] = []
+    for piece in pieces:
+        for block in split_blocks(piece, block_size):
+            cut = block.rfind("\n") + 1
+            if cut == 0:
+                buffer.append(block)
+                continue
+            buffer.append(block[:cut])
+            yield apply_transforms("".join(buffer), transforms)
+            buffer = [block[cut:]] if cut < len(block) else []
+    if buffer:
+        yield apply_transforms("".join(buffer), transforms)
+
+
+def transform_chapter(content: str, transforms: List[Callable[[str], str]]) -> str:
+    return apply_transforms(content, transforms) + "\n"
+
 
 class LatexBuilder:
     def __init__(
-        self, options: TemplateOptions, renderer: TemplateRenderer, target_folder: str
+        self,
+        options: TemplateOptions,
+        renderer: TemplateRenderer,
+        target_folder: str,
+        def_builder: Optional[DefBuilder] = None,
+        jobs: Optional[int] = None,
+        input_paths: Optional[List[str]] = None,
+        fs: Optional[FileSystem] = None,
     ):
         self.options = options
         self.renderer = renderer
         self.target_folder = target_folder
+        # share a DefBuilder between builders to only compose the defs once
+        self.def_builder = def_builder if def_builder is not None else DefBuilder()
+        # worker processes writing chapters in the book layout, None for a cpu each
+        self.jobs = jobs
+        # folders, after the target folder, searched for \input files to inline
+        self.input_paths = input_paths if input_paths is not None else []
+        # where outputs are written, a folder on disk unless given
+        self.fs: FileSystem = fs if fs is not None else DiskFileSystem()
+        # outputs rewritten by the last build, unchanged files are left untouched
+        self.changed_files: List[str] = []
+        # sha256 of every output of the last build by path, changed or not
+        self.output_digests: Dict[str, str] = {}
+        # inputs left in main.tex by the last single file build, not found to inline
+        self.unresolved_inputs: List[str] = []
+        # uses of each undefined variable in the last build, kept here rather
+        # than on the renderer, which is shared between builds
+        self.undefined_summary: Dict[str, int] = {}
 
     def validate(self, data: DocModel, raise_if_invalid):
         logging.info("Validating docmodel data...")
@@ -46,7 +150,22 @@ class LatexBuilder:
         tagged: Dict[str, str],
         bibtex: Optional[str] = None,  # TODO remove as we copy the file forwards?
         raise_if_invalid: bool = True,
+        stream: bool = False,
     ):
+        """
+        Render the template with the data and content given and write the output
+
+        In the compact layout the content chunks are joined into the main file.
+        In the book layout each chunk is a chapter written to its own file,
+        `main-chapter-01.tex` and so on, and the template's CONTENT is the list
+        of `\\include`s for them, so `\\includeonly` can select chapters.
+
+        With `jtex.output.single_file` the book layout keeps its chapters, each
+        inlined into the main file on its own pages as its `\\include` would be.
+
+        When stream is set the template is rendered piece by piece straight into
+        the output file, keeping memory use flat regardless of document size.
+        """
         logging.info("Rendering template...")
         self.validate(data, raise_if_invalid)
         if self.renderer is None:
@@ -71,57 +190,187 @@ class LatexBuilder:
         if not "authors" in data_to_render or data_to_render["authors"] is None:
             data_to_render["authors"] = []
 
-        rendered_content = [
-            self.renderer.render(data=data_to_render, content=content[0])
-        ]
-        self._write(data, rendered_content, bibtex)
+        chapters: List[Tuple[str, str]] = []
+        if self.options.compact:
+            main_content = "\n".join(content)
+        elif data.get("jtex.output.single_file", bool, False):
+            main_content = "\n".join(include_block(chunk) for chunk in content)
+        else:
+            chapters = [
+                (f"{self._stem(data)}-chapter-{idx + 1:02d}", chunk)
+                for idx, chunk in enumerate(content)
+            ]
+            main_content = "\n".join(f"\\include{{{name}}}" for name, _ in chapters)
+
+        self.undefined_summary = {}
+        rendered: Union[str, Iterable[str]]
+        if stream:
+            # rendering happens as the pieces are consumed while writing
+            rendered = timed_iter(
+                "render",
+                self.renderer.generate(
+                    data=data_to_render,
+                    content=main_content,
+                    undefined_summary=self.undefined_summary,
+                ),
+            )
+        else:
+            with timed("render"):
+                rendered = self.renderer.render(
+                    data=data_to_render,
+                    content=main_content,
+                    undefined_summary=self.undefined_summary,
+                )
+        self._write(data, [rendered], bibtex, chapters)
+
+    @property
+    def build_digest(self) -> str:
+        """
+        Stable hash over the names and content of all outputs of the last build,
+        for caches to key on
+        """
+        return fingerprint(
+            (os.path.relpath(path, self.target_folder), digest)
+            for path, digest in self.output_digests.items()
+        )
+
+    @staticmethod
+    def _stem(data: DocModel) -> str:
+        return os.path.splitext(data.get("jtex.output.filename", str, "main.tex"))[0]
+
+    def _write_chapters(
+        self,
+        data: DocModel,
+        chapters: List[Tuple[str, str]],
+        transforms: List[Callable[[str], str]],
+    ) -> List[str]:
+        """
+        Transform each chapter, across worker processes when there is more than
+        one, write each to its own file and remove chapters left by a previous build
+        """
+        logging.info("Writing %s chapters...", len(chapters))
+        jobs = min(len(chapters), self.jobs or os.cpu_count() or 1)
+        if jobs <= 1:
+            transformed = [
+                transform_chapter(chunk, transforms) for _, chunk in chapters
+            ]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                transformed = list(
+                    executor.map(
+                        transform_chapter,
+                        [chunk for _, chunk in chapters],
+                        [transforms] * len(chapters),
+                    )
+                )
+
+        changed = []
+        filenames = [f"{name}.tex" for name, _ in chapters]
+        for filename, text in zip(filenames, transformed):
+            path = os.path.join(self.target_folder, filename)
+            self.output_digests[path] = content_digest(text)
+            if self.fs.write_if_changed(path, text):
+                changed.append(path)
+
+        for stale in fnmatch.filter(
+            self.fs.listdir(self.target_folder), f"{self._stem(data)}-chapter-*.tex"
+        ):
+            if stale not in filenames:
+                path = os.path.join(self.target_folder, stale)
+                self.fs.remove(path)
+                changed.append(path)
+        return changed
+
+    def _remove_inlined_assets(self, inliner: InputInliner):
+        """
+        Remove the template inputs inlined into a single file output from the
+        target, where they were copied with the template's assets
+        """
+        for search_path, filename in inliner.resolved.values():
+            if search_path != self.options.template_location:
+                continue
+            path = os.path.join(self.target_folder, filename)
+            if self.fs.exists(path):
+                self.fs.remove(path)
 
     @log_and_raise_errors(lambda *args: "Could not write final document")
-    def _write(self, data: DocModel, content: List[str], bibtex: Optional[str]):
+    def _write(
+        self,
+        data: DocModel,
+        content: List[Union[str, Iterable[str]]],
+        bibtex: Optional[str],
+        chapters: Optional[List[Tuple[str, str]]] = None,
+    ):
         logging.info("ProjectBuilder - writing...")
+        self.output_digests = {}
+        self.unresolved_inputs = []
 
-        def_builder = DefBuilder()
-        def_builder.build(self.options, self.target_folder)
-        content_transforms = def_builder.get_content_transforms(self.options)
-
-        if not self.options.compact:
-            raise NotImplementedError(
-                "LatexBuilder not implemented for books layouts yet"
+        engine = self.def_builder.get_transform_engine(self.options)
+        inliner: Optional[InputInliner] = None
+        if data.get("jtex.output.single_file", bool, False):
+            # defs and local inputs go into main.tex rather than their own files
+            inliner = InputInliner(
+                self.def_builder.files(self.options),
+                [self.options.template_location] + self.input_paths,
+                transform=engine,
+            )
+            changed = []
+        else:
+            changed, digests = self.def_builder.build(
+                self.options, self.target_folder, fs=self.fs
             )
+            for name, digest in digests.items():
+                self.output_digests[os.path.join(self.target_folder, name)] = digest
 
-        logging.info("Applying content transforms")
-        transformed_content = ""
-        for chunk in content:
-            transformed_chunk = chunk
-            for transform in content_transforms:
-                transformed_chunk = transform(transformed_chunk)
-            transformed_content += transformed_chunk + "\n"
+        if chapters:
+            with timed("chapters"):
+                changed += self._write_chapters(data, chapters, [engine])
 
-        logging.info("Writing main.tex...")
-        with open(
+        logging.info("Writing main.tex and applying content transforms...")
+        content_transforms = [timed_call("transforms", engine)]
+        inline = timed_call("inline", inliner.inline) if inliner is not None else None
+        with self.fs.open_writer(
             os.path.join(
                 self.target_folder, data.get("jtex.output.filename", str, "main.tex")
             ),
-            "w+",
+            buffering=WRITE_BUFFER_SIZE,
         ) as file:
             file.write(stringify_front_matter(data.to_dict()))
-            file.write(transformed_content)
+            for chunk in content:
+                pieces = (
+                    [apply_transforms(chunk, content_transforms)]
+                    if isinstance(chunk, str)
+                    else transform_stream(chunk, content_transforms)
+                )
+                for piece in pieces:
+                    file.write(piece if inline is None else inline(piece))
+                file.write("\n")
+        self.output_digests[file.path] = file.digest
+        if file.changed:
+            changed.append(file.path)
+        if inliner is not None:
+            logging.info("Inlined: %s", inliner.inlined)
+            self.unresolved_inputs = inliner.unresolved
+            self._remove_inlined_assets(inliner)
 
         logging.info("Writing main.bib...")
         if bibtex:
-            with open(os.path.join(self.target_folder, "main.bib"), "w+") as file:
-                file.write(bibtex)
+            bib_path = os.path.join(self.target_folder, "main.bib")
+            self.output_digests[bib_path] = content_digest(bibtex)
+            if self.fs.write_if_changed(bib_path, bibtex):
+                changed.append(bib_path)
 
         logging.info("Cleaning up...")
-        files = [
-            "template.tex",
-            "template.yml",
-            "thumbnail.png",
-            "README.md",
-            "PORT.md",
-        ]
-        for file in files:
-            if os.path.exists(os.path.join(self.target_folder, file)):
-                os.remove(os.path.join(self.target_folder, file))
+        for filename in TEMPLATE_ONLY_FILES:
+            path = os.path.join(self.target_folder, filename)
+            if filename == COMPILED_FOLDER:
+                self.fs.rmtree(path)
+            elif self.fs.exists(path):
+                self.fs.remove(path)
 
+        self.changed_files = changed
+        if len(changed) > 0:
+            logging.info("Changed: %s", [os.path.basename(f) for f in changed])
+        else:
+            logging.info("No outputs changed")
         logging.info("Done!")
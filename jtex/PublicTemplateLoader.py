@@ -1,16 +1,31 @@
+import atexit
+import functools
+import json
 import logging
 import os
-from re import template
-from typing import Dict, List, Tuple, cast
-from zipfile import ZipFile
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import as_completed
+from typing import Callable, Dict, List, Optional, Tuple, cast
 
 import requests
 import typer
 
-from .TemplateLoader import TemplateLoader
+from .BytecodeCache import get_default_bytecode_cache
+from .Downloader import get_downloader
+from .FileSystem import FileSystem
+from .RendererRegistry import RendererRegistry
+from .TemplateArchive import get_archive
+from .TemplateCache import FileLock, get_default_template_cache
+from .TemplateLoader import TEMPLATE_ONLY_FILES, TemplateLoader
 from .TemplateOptions import TemplateOptions
-from .TemplateRenderer import TemplateRenderer
-from .utils import download
+from .TemplateRenderer import TemplateRenderer, UndefinedPolicy, read_templates
+from .Timings import timed
+from .utils import download, fingerprint, get_cache_dir
 
 CURVENOTE_API_URL = os.getenv("CURVENOTE_API_URL")
 API_URL = (
@@ -18,13 +33,15 @@ API_URL = (
 )
 TEMPLATE_DOWNLOAD_URL = "{api_url}/templates/tex/{template_name}/download"
 OLD_TEMPLATE_DOWNLOAD_URL = "{api_url}/templates/{template_name}/download"
+DEFAULT_LOOKUP_TIMEOUT = 10
+LEGACY_NAMES_MAX_AGE = 7 * 24 * 3600
 
 
-def do_download(URL: str, template_name: str):
+def do_download(URL: str, template_name: str, timeout: Optional[float] = None):
     url = URL.format(api_url=API_URL, template_name=template_name)
     logging.info(f"DOWNLOAD: {url}")
     try:
-        download_info = requests.get(url).json()
+        download_info = get_downloader().get_json(url, timeout=timeout)
         if "status" in download_info and download_info["status"] != 200:
             raise ValueError(f'{template_name} not found - {download_info["status"]}')
     except requests.exceptions.RequestException as e:
@@ -32,59 +49,309 @@ def do_download(URL: str, template_name: str):
     return download_info
 
 
+def lookup_in_background(URL: str, template_name: str, timeout: float) -> Future:
+    """
+    Run do_download on a daemon thread, which unlike an executor's workers is
+    not joined at exit, so a slow lookup that lost the race never holds up the
+    process
+    """
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(do_download(URL, template_name, timeout))
+        except Exception as err:
+            future.set_exception(err)
+
+    threading.Thread(target=run, name="jtex-lookup", daemon=True).start()
+    return future
+
+
+def first_link(
+    lookups: List[Tuple[str, str]],
+    timeout: float,
+    on_settled: Optional[Callable[[List[bool]], None]] = None,
+) -> Optional[Dict]:
+    """
+    Make the (URL, template_name) lookups at once and return the first answer
+    with a link, or None if every lookup answered without one
+
+    Raises a ValueError if no lookup answered within timeout seconds. Lookups
+    still running are left to finish in the background, on_settled is called
+    once all have, with whether each found a link.
+    """
+    found: List[Optional[bool]] = [None] * len(lookups)
+    lock = threading.Lock()
+
+    def settle(idx: int, future: Future):
+        with lock:
+            found[idx] = future.exception() is None and "link" in future.result()
+            settled = all(f is not None for f in found)
+        if settled and on_settled is not None:
+            on_settled(cast(List[bool], found))
+
+    futures = [lookup_in_background(url, name, timeout) for url, name in lookups]
+    for idx, future in enumerate(futures):
+        future.add_done_callback(functools.partial(settle, idx))
+
+    errors: List[str] = []
+    answered = False
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            if future.exception() is not None:
+                errors.append(str(future.exception()))
+                continue
+            if "link" in future.result():
+                return future.result()
+            answered = True
+    except FutureTimeoutError:
+        errors.append(f"no answer within {timeout}s")
+    if answered:
+        return None
+    raise ValueError("; ".join(errors))
+
+
+def legacy_names_path() -> Optional[str]:
+    """
+    Where the names only found on the legacy endpoint are kept, None if
+    caching is disabled by JTEX_NO_CACHE
+    """
+    if os.getenv("JTEX_NO_CACHE"):
+        return None
+    return get_cache_dir("lookup", "legacy.json")
+
+
+def read_legacy_names() -> Dict[str, float]:
+    """
+    Names only found on the legacy endpoint, with when that was recorded
+    """
+    path = legacy_names_path()
+    if path is None:
+        return {}
+    try:
+        with open(path, "r") as file:
+            return dict(json.load(file))
+    except (OSError, TypeError, ValueError):
+        return {}
+
+
+def is_legacy(template_name: str) -> bool:
+    """
+    True if template_name was recently found only on the legacy endpoint,
+    names are checked on both endpoints again after LEGACY_NAMES_MAX_AGE
+    """
+    recorded = read_legacy_names().get(template_name)
+    return recorded is not None and time.time() - recorded < LEGACY_NAMES_MAX_AGE
+
+
+_legacy_lock = threading.Lock()
+
+
+def remember_legacy(template_name: str, legacy: bool):
+    """
+    Record whether template_name is only found on the legacy endpoint
+    """
+    path = legacy_names_path()
+    if path is None:
+        return
+    with _legacy_lock:
+        names = read_legacy_names()
+        if not legacy and template_name not in names:
+            return
+        if legacy:
+            names[template_name] = time.time()
+        else:
+            del names[template_name]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(names, file, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logging.warning("Could not record legacy template names: %s", err)
+
+
+_download_folder: Optional[str] = None
+_download_locks: Dict[str, threading.Lock] = {}
+_download_lock = threading.Lock()
+
+
+def download_folder() -> str:
+    """
+    Folder public templates are downloaded to when the template cache is
+    disabled, one per process, reused by every build and removed at exit
+    """
+    global _download_folder
+    with _download_lock:
+        if _download_folder is None:
+            _download_folder = tempfile.mkdtemp(prefix="jtex-templates-")
+            atexit.register(shutil.rmtree, _download_folder, ignore_errors=True)
+        return _download_folder
+
+
+def download_lock(template_name: str) -> threading.Lock:
+    """
+    Held while template_name is downloaded, builds in the process share its zip
+    """
+    with _download_lock:
+        return _download_locks.setdefault(template_name, threading.Lock())
+
+
 class PublicTemplateLoader(TemplateLoader):
-    def __init__(self, template_location: str):
-        super().__init__(template_location)
+    def __init__(
+        self,
+        template_location: str,
+        registry: Optional[RendererRegistry] = None,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+        fs: Optional[FileSystem] = None,
+        lookup_timeout: Optional[float] = None,
+    ):
+        super().__init__(template_location, registry, undefined_policy, fs)
+        self._lookup_timeout: float = (
+            lookup_timeout
+            if lookup_timeout is not None
+            else float(os.getenv("JTEX_LOOKUP_TIMEOUT", DEFAULT_LOOKUP_TIMEOUT))
+        )
+        # keeps the cached template being built from until the loader is closed
+        self._pin: Optional[FileLock] = None
+
+    def close(self):
+        if self._pin is not None:
+            self._pin.release()
+            self._pin = None
 
     def initialise_from_template_api(
         self, template_name: str
     ) -> Tuple[TemplateOptions, TemplateRenderer]:
-        logging.info("Writing to target folder: %s", self._target_folder)
+        with timed("template.fetch"):
+            template_location = self._fetch_template(template_name)
+
+        # success -- update members
+        self._template_name = template_name
+        self._template_location = template_location
+        options = TemplateOptions(template_location)
+
+        # the template folder or zip is replaced or evicted as new versions
+        # are fetched, so the renderer holds its own in memory copy of the
+        # templates and can outlive them
+        templates = read_templates(template_location)
+
+        def create_renderer():
+            renderer = TemplateRenderer(
+                get_default_bytecode_cache(), self._undefined_policy
+            )
+            renderer.use_templates(templates)
+            return renderer
 
+        key = RendererRegistry.public_key(
+            template_name,
+            options.get("metadata.version"),
+            fingerprint(templates.items()),
+            self._undefined_policy,
+        )
+        with timed("template.load"):
+            renderer = self._registry.get(key, create_renderer)
+
+        return options, renderer
+
+    def _lookup_link(self, template_name: str) -> str:
+        """
+        Ask the API where to download the template from
+
+        Both download endpoints are asked at once and the first link returned
+        is used, names known to be only on the legacy endpoint ask it alone.
+        """
         logging.info("Looking up template %s", template_name)
-        logging.info("latest code")
-        try:
-            download_info = {}
+        name = (
+            template_name
+            if template_name.startswith("public/")
+            else f"public/{template_name}"
+        )
+        old_name = (
+            template_name
+            if not template_name.startswith("public/")
+            else template_name[7:]
+        )
+
+        if is_legacy(template_name):
             try:
-                name = (
-                    template_name
-                    if template_name.startswith("public/")
-                    else f"public/{template_name}"
-                )
-                download_info = do_download(TEMPLATE_DOWNLOAD_URL, name)
-            except:
-                name = (
-                    template_name
-                    if not template_name.startswith("public/")
-                    else template_name[7:]
+                download_info = do_download(
+                    OLD_TEMPLATE_DOWNLOAD_URL, old_name, self._lookup_timeout
                 )
-                download_info = do_download(OLD_TEMPLATE_DOWNLOAD_URL, name)
-            if "link" not in download_info:
-                typer.echo(f"Template '{template_name}' not found")
-                raise typer.Exit(-1)
+                if "link" in download_info:
+                    return self._found(download_info)
+            except ValueError as err:
+                logging.info("Legacy lookup of %s failed: %s", template_name, err)
+
+        def settled(found: List[bool]):
+            # remember names only the legacy endpoint has, forget them once
+            # the new endpoint has them too
+            if found[0] or found[1]:
+                remember_legacy(template_name, not found[0])
+
+        try:
+            download_info = first_link(
+                [(TEMPLATE_DOWNLOAD_URL, name), (OLD_TEMPLATE_DOWNLOAD_URL, old_name)],
+                self._lookup_timeout,
+                settled,
+            )
         except ValueError as err:
             logging.error("could not download template %s", template_name)
             raise ValueError(f"could not download template: {template_name}") from err
+        if download_info is None:
+            typer.echo(f"Template '{template_name}' not found")
+            raise typer.Exit(-1)
+        return self._found(download_info)
 
-        # fetch template to local folder
+    @staticmethod
+    def _found(download_info: Dict) -> str:
         logging.info(f"Found template, download url {download_info['link']}")
+        return download_info["link"]
+
+    def _fetch_template(self, template_name: str) -> str:
+        """
+        Fetch the template, from the template cache when it is enabled, and
+        return the folder or zip holding it
+
+        A cached template stays pinned in the cache until the loader is closed.
+        """
+        logging.info("Writing to target folder: %s", self._target_folder)
+        cache = get_default_template_cache()
+        if cache is None:
+            return self._download_template(template_name)
+
+        # templates and defs are read from the cached tree in place, which a
+        # download never changes, only the assets are copied to the target.
+        # The tree is pinned so it is not evicted while builds read from it.
+        with cache.checkout(
+            template_name, lambda: self._lookup_link(template_name)
+        ) as cached:
+            self.close()
+            self._pin = cache.pin(cached)
+            self._fs.copy_tree(cached, self._target_folder, exclude=TEMPLATE_ONLY_FILES)
+        return cached
+
+    def _download_template(self, template_name: str) -> str:
+        """
+        Download the template zip, which is used in place, extracting only
+        the assets needed alongside the output, and return its path
+
+        Each download of a template replaces the zip of the last one, so the
+        process keeps one zip per template however many builds it runs.
+        """
+        link = self._lookup_link(template_name)
         logging.info("downloading...")
         zip_filename = os.path.join(
-            self._target_folder, f"{template_name.replace('/','_')}.template.zip"
+            download_folder(), f"{template_name.replace('/','_')}.template.zip"
         )
-        download(download_info["link"], zip_filename)
-
-        # unzip
-        logging.info("Download complete, unzipping...")
-        with ZipFile(zip_filename, "r") as zip_file:
-            zip_file.extractall(self._target_folder)
-        logging.info("Unzipped to %s", self._target_folder)
-        os.remove(zip_filename)
-        logging.info("Removed %s", zip_filename)
-
-        # success -- update members
-        self._template_name = template_name
-        renderer = TemplateRenderer()
-        renderer.use_from_folder(self._target_folder)
+        with download_lock(template_name):
+            download(link, zip_filename)
 
-        return TemplateOptions(self._target_folder), renderer
+            logging.info("Download complete, extracting assets...")
+            get_archive(zip_filename).extract(
+                self._target_folder, self._fs, exclude=TEMPLATE_ONLY_FILES
+            )
+        logging.info("Extracted assets to %s", self._target_folder)
+        return zip_filename
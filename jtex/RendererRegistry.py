@@ -0,0 +1,160 @@
+import logging
+import os
+from typing import Callable, Hashable, Optional, Tuple
+
+from jinja2.loaders import PackageLoader
+
+from .BytecodeCache import get_default_bytecode_cache
+from .TemplateArchive import archive_signature
+from .TemplateRenderer import TemplateRenderer, UndefinedPolicy, read_templates
+from .utils import LRUCache, fingerprint
+from .version import __version__
+
+DEFAULT_MAX_ENVIRONMENTS = 32
+
+RegistryKey = Tuple[Hashable, ...]
+
+
+class RendererRegistry:
+    """
+    Process wide store of warm TemplateRenderers
+
+    Renderers are keyed on the identity of the template they were built for, a
+    folder path plus a fingerprint of its templates, a template zip and its
+    mtime and size, or the public template name and version. Each keeps its
+    jinja Environment and so its compiled templates in memory. The number of
+    live environments is capped, least recently used renderers are dropped
+    first.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_ENVIRONMENTS):
+        self._renderers = LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._renderers)
+
+    def __contains__(self, key: RegistryKey):
+        return key in self._renderers
+
+    @property
+    def stats(self):
+        return self._renderers.stats
+
+    @staticmethod
+    def builtin_key(
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+    ) -> RegistryKey:
+        return ("builtin", __version__, UndefinedPolicy(undefined_policy).value)
+
+    @staticmethod
+    def folder_key(
+        searchpath: str, undefined_policy: UndefinedPolicy = UndefinedPolicy.silent
+    ) -> RegistryKey:
+        abs_path = os.path.abspath(searchpath)
+        return (
+            "folder",
+            abs_path,
+            fingerprint(read_templates(abs_path).items()),
+            UndefinedPolicy(undefined_policy).value,
+        )
+
+    @staticmethod
+    def archive_key(
+        archive_path: str, undefined_policy: UndefinedPolicy = UndefinedPolicy.silent
+    ) -> RegistryKey:
+        abs_path = os.path.abspath(archive_path)
+        return (
+            "archive",
+            abs_path,
+            archive_signature(abs_path),
+            UndefinedPolicy(undefined_policy).value,
+        )
+
+    @staticmethod
+    def public_key(
+        name: str,
+        version: Optional[str],
+        content_hash: str,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+    ) -> RegistryKey:
+        return (
+            "public",
+            name,
+            version,
+            content_hash,
+            UndefinedPolicy(undefined_policy).value,
+        )
+
+    def get(
+        self, key: RegistryKey, factory: Callable[[], TemplateRenderer]
+    ) -> TemplateRenderer:
+        """
+        Return the renderer registered for key, building it with factory on a miss
+        """
+        if key in self._renderers:
+            logging.info("RendererRegistry - reusing renderer for %s", key[:2])
+        return self._renderers.get_or_create(key, factory)
+
+    def get_builtin(
+        self, undefined_policy: UndefinedPolicy = UndefinedPolicy.silent
+    ) -> TemplateRenderer:
+        """
+        Renderer for the template built into the package
+        """
+
+        def factory():
+            renderer = TemplateRenderer(get_default_bytecode_cache(), undefined_policy)
+            renderer.use_loader(PackageLoader("jtex", "builtin_template"))
+            return renderer
+
+        return self.get(self.builtin_key(undefined_policy), factory)
+
+    def get_folder(
+        self,
+        searchpath: str,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+    ) -> TemplateRenderer:
+        """
+        Renderer loading templates from a folder, reused while its templates are unchanged
+
+        Templates precompiled with `jtex compile` are used when present and current.
+        """
+
+        def factory():
+            renderer = TemplateRenderer(get_default_bytecode_cache(), undefined_policy)
+            if not renderer.use_compiled(os.path.abspath(searchpath)):
+                renderer.use_from_folder(os.path.abspath(searchpath))
+            return renderer
+
+        return self.get(self.folder_key(searchpath, undefined_policy), factory)
+
+    def get_archive(
+        self,
+        archive_path: str,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+    ) -> TemplateRenderer:
+        """
+        Renderer loading templates from a template zip, reused while the zip
+        is unchanged
+        """
+
+        def factory():
+            renderer = TemplateRenderer(get_default_bytecode_cache(), undefined_policy)
+            renderer.use_archive(os.path.abspath(archive_path))
+            return renderer
+
+        return self.get(self.archive_key(archive_path, undefined_policy), factory)
+
+    def invalidate(self, key: Optional[RegistryKey] = None):
+        """
+        Drop the renderer registered for key, or every renderer if no key is given
+        """
+        if key is None:
+            self._renderers.clear()
+        else:
+            self._renderers.pop(key)
+
+
+registry = RendererRegistry(
+    int(os.getenv("JTEX_MAX_ENVIRONMENTS", DEFAULT_MAX_ENVIRONMENTS))
+)
@@ -0,0 +1,181 @@
+import functools
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+from pykwalify.errors import SchemaError
+from pykwalify.types import tt
+
+# check(value, path, errors) appends the messages for value at path to errors
+Check = Callable[[Any, str, List[str]], None]
+
+RULE_KEYWORDS = {
+    "type",
+    "map",
+    "mapping",
+    "seq",
+    "sequence",
+    "required",
+    "req",
+    "allowempty",
+    "name",
+    "desc",
+}
+SCALAR_TYPES = {"str", "int", "float", "number", "bool", "text", "any"}
+
+
+class SchemaValidator:
+    """
+    A pykwalify schema compiled once into nested check functions
+
+    Covers the subset of pykwalify that the jtex schemas use, maps, sequences
+    with a single item rule, scalar types, required and allowempty, and
+    reports the same errors in the same order as pykwalify's Core. Compiling a
+    schema using anything else raises a ValueError, use Core for those.
+    """
+
+    def __init__(self, schema: Dict):
+        self._check = self._compile(schema, "")
+
+    @classmethod
+    def from_file(cls, schema_file: str) -> "SchemaValidator":
+        with open(schema_file, "r") as file:
+            return cls(yaml.safe_load(file))
+
+    def errors(self, data: Any) -> List[str]:
+        errors: List[str] = []
+        self._check(data, "", errors)
+        return errors
+
+    def validate(self, data: Any):
+        """
+        Raise a SchemaError, worded as pykwalify's, if data does not match
+        """
+        errors = self.errors(data)
+        if len(errors) > 0:
+            logging.error("Schema validation failed: %s", errors)
+            raise SchemaError(
+                "Schema validation failed:\n - {error_msg}.".format(
+                    error_msg=".\n - ".join(errors)
+                )
+            )
+
+    def _compile(self, rule: Dict, rule_path: str) -> Check:
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule at '{rule_path}' is not a map")
+        unsupported = set(rule) - RULE_KEYWORDS
+        if unsupported:
+            raise ValueError(f"Unsupported keywords {unsupported} at '{rule_path}'")
+
+        required = bool(rule.get("required", rule.get("req", False)))
+        seq = rule.get("seq", rule.get("sequence"))
+        mapping = rule.get("map", rule.get("mapping"))
+        if seq is not None:
+            body = self._compile_sequence(seq, rule_path)
+        elif mapping is not None or rule.get("type") == "map":
+            body = self._compile_mapping(
+                mapping, bool(rule.get("allowempty", False)), rule_path
+            )
+        else:
+            body = self._compile_scalar(rule.get("type", "str"), rule_path)
+        if not required:
+            return body
+
+        def check_required(value: Any, path: str, errors: List[str]):
+            if value is None:
+                errors.append(f"required.novalue : '{path}'")
+                return
+            body(value, path, errors)
+
+        return check_required
+
+    def _compile_sequence(self, seq: List, rule_path: str) -> Check:
+        if not isinstance(seq, list) or len(seq) != 1:
+            raise ValueError(
+                f"Only single item sequences are supported at '{rule_path}'"
+            )
+        item_rule = seq[0]
+        check_item = self._compile(item_rule, f"{rule_path}/seq")
+        # pykwalify stops checking items against a map rule with no mapping
+        skip_items = (
+            isinstance(item_rule, dict)
+            and item_rule.get("type") == "map"
+            and item_rule.get("map", item_rule.get("mapping")) is None
+        )
+
+        def check_sequence(value: Any, path: str, errors: List[str]):
+            if value is None:
+                return
+            if not isinstance(value, list):
+                if isinstance(value, str):
+                    value = value.encode("unicode_escape")
+                errors.append(f"Value '{value}' is not a list. Value path: '{path}'")
+                return
+            if skip_items:
+                return
+            for idx, item in enumerate(value):
+                check_item(item, f"{path}/{idx}", errors)
+
+        return check_sequence
+
+    def _compile_mapping(
+        self, mapping: Optional[Dict], allowempty: bool, rule_path: str
+    ) -> Check:
+        if mapping is None and not allowempty:
+            raise ValueError(f"Map without mapping at '{rule_path}'")
+        if mapping is not None and not isinstance(mapping, dict):
+            raise ValueError(f"Mapping at '{rule_path}' is not a map")
+        checks: Optional[Dict[Any, Check]] = None
+        required_keys: List[Any] = []
+        if mapping is not None:
+            checks = {}
+            for key, key_rule in mapping.items():
+                if key == "=" or str(key).startswith(("regex;", "re;")):
+                    raise ValueError(f"Unsupported key '{key}' at '{rule_path}'")
+                checks[key] = self._compile(key_rule, f"{rule_path}/{key}")
+                if key_rule.get("required", key_rule.get("req", False)):
+                    required_keys.append(key)
+
+        def check_mapping(value: Any, path: str, errors: List[str]):
+            if not isinstance(value, dict):
+                errors.append(f"Value '{value}' is not a dict. Value path: '{path}'")
+                return
+            if checks is None:
+                return
+            for key in required_keys:
+                if key not in value:
+                    errors.append(f"Cannot find required key '{key}'. Path: '{path}'")
+            for key, item in value.items():
+                check = checks.get(key)
+                if check is not None:
+                    check(item, f"{path}/{key}", errors)
+                elif not allowempty:
+                    errors.append(f"Key '{key}' was not defined. Path: '{path}'")
+
+        return check_mapping
+
+    def _compile_scalar(self, scalar_type: str, rule_path: str) -> Check:
+        if scalar_type not in SCALAR_TYPES:
+            raise ValueError(f"Unsupported type '{scalar_type}' at '{rule_path}'")
+        is_type = tt[scalar_type]
+
+        def check_scalar(value: Any, path: str, errors: List[str]):
+            if value is not None and not is_type(value):
+                errors.append(
+                    f"Value '{value}' is not of type '{scalar_type}'. Path: '{path}'"
+                )
+
+        return check_scalar
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(schema_file: str) -> Optional[SchemaValidator]:
+    """
+    The compiled validator for a schema file, once per process, or None if
+    the schema needs pykwalify itself
+    """
+    try:
+        return SchemaValidator.from_file(schema_file)
+    except ValueError as err:
+        logging.debug("Not compiling %s: %s", schema_file, err)
+        return None
@@ -0,0 +1,206 @@
+import os
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zipfile import ZipFile
+
+from jinja2 import BaseLoader, Environment, TemplateNotFound
+
+from .FileSystem import FileSystem
+from .utils import LRUCache
+
+DEFAULT_MAX_ARCHIVES = 16
+
+
+def is_archive(path: str) -> bool:
+    return path.endswith(".zip") and os.path.isfile(path)
+
+
+def split_archive_path(path: str) -> Optional[Tuple[str, str]]:
+    """
+    The archive and member name for a path into a template archive, such as
+    `template.zip/code.def`, None if no parent of path is an archive
+    """
+    if ".zip" not in path:
+        return None
+    head, member = os.path.split(os.path.normpath(path))
+    while member:
+        if is_archive(head):
+            return head, member
+        head, tail = os.path.split(head)
+        member = f"{tail}/{member}" if tail else ""
+    return None
+
+
+class TemplateArchive:
+    """
+    A template zip used in place, without extracting it
+
+    Members are read on demand, so a build only decompresses the templates it
+    renders and the defs it includes. Assets that need to sit alongside the
+    output are extracted with `extract`, skipping those already there.
+
+    A closed archive is reopened by the next read, as long as the zip on disk
+    is unchanged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature = archive_signature(path)
+        self._zip = ZipFile(path, "r")
+        self._closed = False
+        # ZipFile reads through one shared file handle
+        self._lock = threading.Lock()
+        self._infos = {
+            info.filename: info for info in self._zip.infolist() if not info.is_dir()
+        }
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            self._zip.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def names(self) -> List[str]:
+        return sorted(self._infos)
+
+    def exists(self, name: str) -> bool:
+        return name in self._infos
+
+    def read(self, name: str) -> bytes:
+        if name not in self._infos:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        with self._lock:
+            if self._closed:
+                self._reopen()
+            return self._zip.read(self._infos[name])
+
+    def _reopen(self):
+        if archive_signature(self.path) != self.signature:
+            raise ValueError(f"{self.path} has changed since it was opened")
+        self._zip = ZipFile(self.path, "r")
+        self._closed = False
+
+    def templates(self) -> Dict[str, str]:
+        """
+        All .tex templates in the archive, keyed by their template name
+        """
+        return {
+            name: self.read(name).decode("utf-8")
+            for name in self.names()
+            if name.endswith(".tex")
+        }
+
+    def extract(
+        self, path: str, fs: FileSystem, exclude: Iterable[str] = ()
+    ) -> List[str]:
+        """
+        Write the members to the folder path, skipping top level entries named
+        in exclude and files that already match, and return the paths written
+
+        Existing files are compared by size and crc32 against the archive's
+        directory, so unchanged members are never decompressed.
+        """
+        written = []
+        excluded = set(exclude)
+        for name, info in sorted(self._infos.items()):
+            if name.split("/")[0] in excluded:
+                continue
+            target = os.path.join(path, *name.split("/"))
+            if fs.exists(target):
+                existing = fs.read(target)
+                if len(existing) == info.file_size and zlib.crc32(existing) == info.CRC:
+                    continue
+            fs.makedirs(os.path.dirname(target))
+            fs.write(target, self.read(name))
+            written.append(target)
+        return written
+
+
+def archive_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+_archives = LRUCache(
+    int(os.getenv("JTEX_MAX_ARCHIVES", DEFAULT_MAX_ARCHIVES)),
+    on_evict=lambda _, archive: archive.close(),
+)
+_archives_lock = threading.Lock()
+
+
+def get_archive(path: str) -> TemplateArchive:
+    """
+    The open archive at path, shared within the process until it changes
+
+    Archives dropped from the cache, or replaced after their zip changed, are
+    closed.
+    """
+    abs_path = os.path.abspath(path)
+    signature = archive_signature(abs_path)
+    with _archives_lock:
+        archive = _archives.get(abs_path)
+        if archive is None or archive.signature != signature:
+            archive = TemplateArchive(abs_path)
+            _archives.put(abs_path, archive)
+        return archive
+
+
+def read_file(path: str) -> bytes:
+    """
+    Bytes of the file at path, on disk or inside a template archive
+    """
+    if not os.path.exists(path):
+        in_archive = split_archive_path(path)
+        if in_archive is not None:
+            return get_archive(in_archive[0]).read(in_archive[1])
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def file_exists(path: str) -> bool:
+    if os.path.exists(path):
+        return True
+    in_archive = split_archive_path(path)
+    return in_archive is not None and get_archive(in_archive[0]).exists(in_archive[1])
+
+
+class ZipLoader(BaseLoader):
+    """
+    Loads templates from a template archive, decompressing each on first use
+
+    The archive is looked up on each load rather than held, so the loader
+    does not keep a zip open once it has been dropped from the archive cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    def get_source(
+        self, environment: Environment, template: str
+    ) -> Tuple[str, str, Callable[[], bool]]:
+        archive = get_archive(self.path)
+        if not archive.exists(template):
+            raise TemplateNotFound(template)
+        source = archive.read(template).decode("utf-8")
+        return (
+            source,
+            f"{self.path}/{template}",
+            lambda: archive_signature(self.path) == archive.signature,
+        )
+
+    def list_templates(self) -> List[str]:
+        names = get_archive(self.path).names()
+        return [name for name in names if name.endswith(".tex")]
@@ -0,0 +1,328 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from zipfile import ZipFile
+
+import requests
+
+from .Downloader import get_downloader
+from .utils import get_cache_dir
+
+try:
+    import fcntl
+
+    def _lock(fd: int, blocking: bool, shared: bool):
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        fcntl.flock(fd, mode | (0 if blocking else fcntl.LOCK_NB))
+
+    def _unlock(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+except ImportError:  # windows
+    import msvcrt
+
+    # msvcrt has no shared locks, shared locks are exclusive on windows
+    def _lock(fd: int, blocking: bool, shared: bool):
+        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+    def _unlock(fd: int):
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 300
+
+
+class FileLock:
+    """
+    Exclusive, or shared, lock on a file, held across processes
+
+    Uses flock where available, so the lock is released if the process dies.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            _lock(fd, blocking, self.shared)
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        _unlock(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def folder_size(folder: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, files in os.walk(folder)
+        for filename in files
+    )
+
+
+class TemplateCache:
+    """
+    Public templates downloaded from the API, kept on disk between builds
+
+    Each template name has an entry recording the ETag and Last-Modified of
+    its download and the sha256 of the zip, which is unzipped once into
+    `trees/<sha256>`, so identical downloads share a folder and the folder
+    for a given template version never changes. Entries checked within
+    max_age seconds are used as they are, older ones are revalidated with a
+    conditional request and only downloaded again if the server has a new
+    version. Offline, entries are used however old and missing templates are
+    an error.
+
+    Each name is fetched under a lock shared by all processes using the cache.
+    Trees are evicted least recently used first to keep the cache under
+    max_size bytes.
+
+        with cache.checkout("public/default", lookup) as folder:
+            ...
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_size: int = DEFAULT_MAX_SIZE,
+        max_age: float = DEFAULT_MAX_AGE,
+        offline: bool = False,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+        os.makedirs(os.path.join(directory, "entries"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "trees"), exist_ok=True)
+
+    @staticmethod
+    def entry_key(name: str) -> str:
+        digest = hashlib.sha256(name.encode("utf-8")).hexdigest()[:12]
+        return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{digest}"
+
+    def _entry_path(self, name: str) -> str:
+        return os.path.join(self.directory, "entries", f"{self.entry_key(name)}.json")
+
+    def _lock(self, name: str) -> FileLock:
+        return FileLock(
+            os.path.join(self.directory, "locks", f"{self.entry_key(name)}.lock")
+        )
+
+    def tree_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "trees", digest)
+
+    def _pin_lock(self, digest: str, shared: bool = True) -> FileLock:
+        return FileLock(
+            os.path.join(self.directory, "pins", f"{digest}.lock"), shared=shared
+        )
+
+    def pin(self, folder: str) -> FileLock:
+        """
+        Keep the folder given by checkout from being evicted until the returned
+        lock is released, pin it inside the checkout block
+
+        Pins are shared, any number of builds can hold one on the same folder.
+        """
+        lock = self._pin_lock(os.path.basename(folder))
+        lock.acquire()
+        return lock
+
+    def entry(self, name: str) -> Optional[Dict]:
+        try:
+            with open(self._entry_path(name), "r") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not os.path.isdir(self.tree_path(entry["digest"])):
+            return None
+        return entry
+
+    def entries(self) -> List[Dict]:
+        entries = []
+        folder = os.path.join(self.directory, "entries")
+        for filename in os.listdir(folder):
+            try:
+                with open(os.path.join(folder, filename), "r") as file:
+                    entries.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def _write_entry(self, entry: Dict):
+        path = self._entry_path(entry["name"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(entry, file)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def checkout(self, name: str, lookup: Callable[[], str]) -> Iterator[str]:
+        """
+        Folder holding the unzipped template, fetched if it is not cached or
+        has changed, lookup returns the url to download it from
+
+        The folder is locked for the duration of the block, copy or read what
+        is needed from it inside, or pin it to read from it afterwards.
+        """
+        with self._lock(name):
+            entry = self._revalidate(name, lookup)
+            entry["used"] = time.time()
+            self._write_entry(entry)
+            yield self.tree_path(entry["digest"])
+        self.evict(keep=name)
+
+    def _revalidate(self, name: str, lookup: Callable[[], str]) -> Dict:
+        entry = self.entry(name)
+        if entry is not None and self.offline:
+            logging.info("Offline, using cached template %s", name)
+            return entry
+        if entry is None and self.offline:
+            raise ValueError(f"Template {name} is not cached and jtex is offline")
+        if entry is not None and time.time() - entry["checked"] < self.max_age:
+            logging.info("Using cached template %s", name)
+            return entry
+        try:
+            return self._fetch(name, lookup(), entry)
+        except (ValueError, requests.exceptions.RequestException) as err:
+            if entry is None:
+                raise
+            logging.warning("Could not revalidate %s, using cached: %s", name, err)
+            return entry
+
+    def _fetch(self, name: str, url: str, entry: Optional[Dict]) -> Dict:
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        logging.info("Downloading template %s", name)
+        # kept across runs under the name's lock so an interrupted download
+        # is resumed by the next fetch
+        zip_filename = os.path.join(
+            self.directory, "downloads", f"{self.entry_key(name)}.zip"
+        )
+        os.makedirs(os.path.dirname(zip_filename), exist_ok=True)
+        result = get_downloader().download(url, zip_filename, headers=headers)
+        if result.status == 304 and entry is not None:
+            logging.info("Cached template %s is up to date", name)
+            entry["checked"] = time.time()
+            return entry
+        if result.status == 304:
+            raise ValueError(f"Download of {name} failed - {result.status}")
+        self._store(zip_filename, result.sha256)
+
+        return dict(
+            name=name,
+            digest=result.sha256,
+            etag=result.headers.get("ETag"),
+            last_modified=result.headers.get("Last-Modified"),
+            size=folder_size(self.tree_path(result.sha256)),
+            checked=time.time(),
+            used=time.time(),
+        )
+
+    def _store(self, zip_filename: str, digest: str):
+        """
+        Unzip the downloaded template into the cache under its sha256
+        """
+        tree = self.tree_path(digest)
+        try:
+            if os.path.isdir(tree):
+                return
+            staging = tempfile.mkdtemp(prefix="unzip-", dir=self.directory)
+            try:
+                with ZipFile(zip_filename, "r") as zip_file:
+                    zip_file.extractall(staging)
+                try:
+                    os.rename(staging, tree)
+                except OSError:
+                    # unzipped by another process under another name meanwhile
+                    pass
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        finally:
+            os.remove(zip_filename)
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Remove the least recently used templates until the cache is no larger
+        than max_size, skipping keep and any locked or pinned by a build
+        """
+        entries = sorted(self.entries(), key=lambda e: e.get("used", 0))
+        sizes = {e["digest"]: e.get("size", 0) for e in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            if entry["name"] == keep:
+                continue
+            lock = self._lock(entry["name"])
+            if not lock.acquire(blocking=False):
+                continue
+            pin = self._pin_lock(entry["digest"], shared=False)
+            if not pin.acquire(blocking=False):
+                lock.release()
+                continue
+            try:
+                os.remove(self._entry_path(entry["name"]))
+                digest = entry["digest"]
+                if all(e["digest"] != digest for e in self.entries()):
+                    shutil.rmtree(self.tree_path(digest), ignore_errors=True)
+                    total -= sizes[digest]
+                logging.info("Evicted %s from template cache", entry["name"])
+            except OSError:
+                pass
+            finally:
+                pin.release()
+                lock.release()
+
+
+def get_default_template_cache() -> Optional[TemplateCache]:
+    """
+    The cache used for public templates
+
+    Lives in JTEX_CACHE_DIR/templates, size is set by JTEX_TEMPLATE_CACHE_SIZE
+    (bytes), entries are revalidated after JTEX_TEMPLATE_MAX_AGE seconds and
+    never when JTEX_OFFLINE is set. Caching is disabled by setting JTEX_NO_CACHE.
+    """
+    if os.getenv("JTEX_NO_CACHE"):
+        return None
+    try:
+        return TemplateCache(
+            get_cache_dir("templates"),
+            int(os.getenv("JTEX_TEMPLATE_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+            float(os.getenv("JTEX_TEMPLATE_MAX_AGE", DEFAULT_MAX_AGE)),
+            bool(os.getenv("JTEX_OFFLINE")),
+        )
+    except OSError as err:
+        logging.warning("Template cache unavailable: %s", err)
+        return None
@@ -1,24 +1,48 @@
 import glob
 import logging
 import os
-from distutils.dir_util import copy_tree
-from shutil import copyfile
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import pkg_resources
-from jinja2.loaders import PackageLoader
 
+from .FileSystem import DiskFileSystem, FileSystem
+from .RendererRegistry import RendererRegistry
+from .RendererRegistry import registry as default_registry
+from .TemplateArchive import get_archive, is_archive
 from .TemplateOptions import TemplateOptions
-from .TemplateRenderer import TemplateRenderer
+from .TemplateRenderer import COMPILED_FOLDER, TemplateRenderer, UndefinedPolicy
+from .Timings import timed
 
 DEFAULT_TEMPLATE_PATH = pkg_resources.resource_filename("jtex", "builtin_template")
 
+# files that describe the template itself, not needed alongside the output
+TEMPLATE_ONLY_FILES: List[str] = [
+    "template.tex",
+    "template.yml",
+    "thumbnail.png",
+    "README.md",
+    "PORT.md",
+    COMPILED_FOLDER,
+]
+
 
 class TemplateLoader:
-    def __init__(self, target_folder: str):
+    def __init__(
+        self,
+        target_folder: str,
+        registry: Optional[RendererRegistry] = None,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+        fs: Optional[FileSystem] = None,
+    ):
         self._template_name: Optional[str] = None
+        self._template_location: Optional[str] = None
         self._target_folder: str = target_folder
-        os.makedirs(self._target_folder, exist_ok=True)
+        self._undefined_policy = UndefinedPolicy(undefined_policy)
+        self._registry: RendererRegistry = (
+            registry if registry is not None else default_registry
+        )
+        self._fs: FileSystem = fs if fs is not None else DiskFileSystem()
+        self._fs.makedirs(self._target_folder)
 
     @staticmethod
     def validate(template_path: str) -> int:
@@ -57,24 +81,44 @@ class TemplateLoader:
 
         return code
 
+    def close(self):
+        """
+        Release anything held for builds from the loaded template
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def is_initialized(self):
         return self._template_name is not None
 
+    @property
+    def template_location(self) -> Optional[str]:
+        """
+        The folder or zip the template was loaded from
+        """
+        return self._template_location
+
     def initialise_with_builtin_template(
         self,
     ) -> Tuple[TemplateOptions, TemplateRenderer]:
         logging.info("TemplateLoader - Initialising with builtin template")
         logging.info("Copying template assets")
-        template_assets = ["curvenote.png", "template.yml"]
+        template_assets = ["curvenote.png"]
         for asset_filename in template_assets:
             src = os.path.join(DEFAULT_TEMPLATE_PATH, asset_filename)
             dest = os.path.join(self._target_folder, asset_filename)
             logging.info("Copying: %s to %s", src, dest)
-            copyfile(src, dest)
+            with timed("template.fetch"):
+                self._fs.copy_file(src, dest)
 
         self._template_name = "builtin"
-        renderer = TemplateRenderer()
-        renderer.use_loader(PackageLoader("jtex", os.path.join("builtin_template")))
+        self._template_location = DEFAULT_TEMPLATE_PATH
+        with timed("template.load"):
+            renderer = self._registry.get_builtin(self._undefined_policy)
 
         return TemplateOptions(DEFAULT_TEMPLATE_PATH), renderer
 
@@ -88,11 +132,17 @@ class TemplateLoader:
         if not os.path.exists(abs_path):
             raise ValueError("local template path does not exist")
 
+        if is_archive(abs_path):
+            return self._initialise_from_archive(abs_path)
+
         if not os.path.isdir(abs_path):
-            raise ValueError("local template path must point to a folder")
+            raise ValueError("local template path must point to a folder or zip")
 
         try:
-            copy_tree(abs_path, self._target_folder)
+            with timed("template.fetch"):
+                self._fs.copy_tree(
+                    abs_path, self._target_folder, exclude=TEMPLATE_ONLY_FILES
+                )
         except Exception as err:
             logging.error(
                 "Could not copy local template from %s to %s",
@@ -103,7 +153,27 @@ class TemplateLoader:
             raise err
 
         self._template_name = os.path.basename(os.path.normpath(abs_path))
-        renderer = TemplateRenderer()
-        renderer.use_from_folder(self._target_folder)
+        self._template_location = abs_path
+        with timed("template.load"):
+            renderer = self._registry.get_folder(abs_path, self._undefined_policy)
+
+        return TemplateOptions(abs_path), renderer
+
+    def _initialise_from_archive(
+        self, archive_path: str
+    ) -> Tuple[TemplateOptions, TemplateRenderer]:
+        """
+        Use a template zip in place, templates and defs are read from the
+        archive and only the assets the output needs are extracted
+        """
+        with timed("template.fetch"):
+            get_archive(archive_path).extract(
+                self._target_folder, self._fs, exclude=TEMPLATE_ONLY_FILES
+            )
+
+        self._template_name = os.path.splitext(os.path.basename(archive_path))[0]
+        self._template_location = archive_path
+        with timed("template.load"):
+            renderer = self._registry.get_archive(archive_path, self._undefined_policy)
 
-        return TemplateOptions(self._target_folder), renderer
+        return TemplateOptions(archive_path), renderer
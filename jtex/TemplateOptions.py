@@ -1,14 +1,103 @@
+import functools
+import hashlib
+import io
+import json
 import logging
 import os
-from typing import Any, Dict, List, Set, Union, cast
+from typing import Any, Dict, List, Optional, Set, Union, cast
 
 import pkg_resources
 from pykwalify.core import Core
 
+from .TemplateArchive import file_exists, read_file
 from .TexFormat import TexFormat
+from .Timings import timed
+from .utils import get_cache_dir
+from .version import __version__
 
 SCHEMA_PATH = pkg_resources.resource_filename("jtex", "schema")
 
+OPTIONS_SCHEMAS = [
+    os.path.join(SCHEMA_PATH, "config.schema.yml"),
+    os.path.join(SCHEMA_PATH, "template.schema.yml"),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def schemas_digest() -> str:
+    """
+    Hash of the template schemas and jtex version, read once per process
+    """
+    hasher = hashlib.sha256(__version__.encode("utf-8"))
+    for schema in OPTIONS_SCHEMAS:
+        with open(schema, "rb") as file:
+            hasher.update(file.read())
+    return hasher.hexdigest()
+
+
+def options_cache_path(template_yml: bytes) -> Optional[str]:
+    """
+    Where the validated options for a template.yml are cached, None if caching
+    is disabled by JTEX_NO_CACHE
+    """
+    if os.getenv("JTEX_NO_CACHE"):
+        return None
+    hasher = hashlib.sha256(schemas_digest().encode("utf-8"))
+    hasher.update(template_yml)
+    return get_cache_dir("options", f"{hasher.hexdigest()}.json")
+
+
+def read_cached_options(cache_path: Optional[str]) -> Optional[Dict]:
+    if cache_path is None:
+        return None
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cached_options(cache_path: Optional[str], source: Dict):
+    """
+    Cache the validated options, unless they do not survive a round trip
+    through JSON unchanged
+    """
+    if cache_path is None:
+        return
+    try:
+        data = json.dumps(source)
+        if json.loads(data) != source:
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(data)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as err:
+        logging.warning("Could not cache template options: %s", err)
+
+
+def load_options(template_yml: str) -> Dict:
+    """
+    The contents of template.yml, validated against the template schemas
+
+    Validated options are cached on disk, in JTEX_CACHE_DIR/options, keyed by
+    the content of template.yml and of the schemas, so a template that has
+    been loaded before is read back without validating again.
+    """
+    data = read_file(template_yml)
+    cache_path = options_cache_path(data)
+    cached = read_cached_options(cache_path)
+    if cached is not None:
+        logging.info("Using cached options for %s", template_yml)
+        return cached
+    parser = Core(
+        data_file_obj=io.StringIO(data.decode("utf-8")), schema_files=OPTIONS_SCHEMAS
+    )
+    parser.validate(raise_exception=True)
+    write_cached_options(cache_path, parser.source)
+    return parser.source
+
 
 class Tag:
     def __init__(self, id: str, plain: bool):
@@ -28,18 +117,12 @@ class TemplateOptions:
 
         template_yml = os.path.join(template_location, "template.yml")
         logging.info("Looking for template on %s", template_yml)
-        if not os.path.exists(template_yml):
+        if not file_exists(template_yml):
             logging.info("%s does not exist", template_yml)
             raise FileNotFoundError(f"{template_yml} does not exist")
 
-        self._parser: Core = Core(
-            source_file=template_yml,
-            schema_files=[
-                os.path.join(SCHEMA_PATH, "config.schema.yml"),
-                os.path.join(SCHEMA_PATH, "template.schema.yml"),
-            ],
-        )
-        self._parser.validate(raise_exception=True)
+        with timed("template_options_validation"):
+            self._source: Optional[Dict] = load_options(template_yml)
 
     @property
     def template_location(self):
@@ -58,10 +141,10 @@ class TemplateOptions:
 
         raises a ValueError if the options is not found
         """
-        if self._parser is None or self._parser.source is None:
+        if self._source is None:
             return default
         try:
-            return TemplateOptions.find(path, self._parser.source)
+            return TemplateOptions.find(path, self._source)
         except KeyError:
             return default
 
@@ -94,9 +177,9 @@ class TemplateOptions:
         """
         Return the schema secton
         """
-        if self._parser is None or self._parser.source is None:
+        if self._source is None:
             return {}
-        return self._parser.source["config"]["schema"]
+        return self._source["config"]["schema"]
 
     @property
     def tagged(self) -> List:
@@ -110,6 +193,6 @@ class TemplateOptions:
         """
         TODO
         """
-        if self._parser is None or self._parser.source is None:
+        if self._source is None:
             return {}
-        return self._parser.source["config"]["options"]
+        return self._source["config"]["options"]
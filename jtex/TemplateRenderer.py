@@ -1,26 +1,179 @@
+import builtins
+import hashlib
+import json
 import logging
+import os
 import re
+from collections import Counter
+from contextvars import ContextVar
+from enum import Enum
 from os import path
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Union
 
-from jinja2 import BaseLoader, Environment, FileSystemLoader, Undefined
+import jinja2
+from jinja2 import (
+    BaseLoader,
+    BytecodeCache,
+    ChoiceLoader,
+    DictLoader,
+    Environment,
+    FileSystemLoader,
+    ModuleLoader,
+    StrictUndefined,
+    Undefined,
+)
+
+from .TemplateArchive import ZipLoader, get_archive, is_archive
+from .utils import LRUCache
+from .version import __version__
+
+# python builtins are exposed to templates, collected once per process
+TEMPLATE_GLOBALS = dict(vars(builtins))
+
+COMPILED_FOLDER = "_compiled"
+COMPILED_MANIFEST = "manifest.json"
+
+DEFAULT_STRING_CACHE_SIZE = 64
+
+
+def read_templates(searchpath: str) -> Dict[str, str]:
+    """
+    Read all .tex templates below searchpath, or in the template archive at
+    searchpath, keyed by their template name
+    """
+    if is_archive(searchpath):
+        return get_archive(searchpath).templates()
+    templates = {}
+    for dirpath, _, filenames in os.walk(searchpath):
+        for filename in filenames:
+            if not filename.endswith(".tex"):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            name = os.path.relpath(full_path, searchpath).replace(os.path.sep, "/")
+            with open(full_path, "r") as file:
+                templates[name] = file.read()
+    return templates
+
+
+def compiled_manifest(templates: Dict[str, str]) -> Dict:
+    """
+    Describes what a set of compiled templates was built from
+    """
+    return dict(
+        jtex=__version__,
+        jinja=jinja2.__version__,
+        templates={
+            name: hashlib.sha256(source.encode("utf-8")).hexdigest()
+            for name, source in templates.items()
+        },
+    )
+
+
+class CompiledLoader(ModuleLoader):
+    """
+    Loads templates precompiled by `jtex compile`, which are importable python modules
+    """
+
+    def __init__(self, path: str, names: List[str]):
+        super().__init__(path)
+        self.names = sorted(names)
+
+    def list_templates(self) -> List[str]:
+        return self.names
+
+
+class UndefinedPolicy(str, Enum):
+    """
+    How templates treat variables that are not in the data
+
+    silent - render anyway, counting undefined accesses
+    log-once - as silent, also logging the first access to each name
+    strict - fail the render on the first use of an undefined variable
+    """
+
+    silent = "silent"
+    log_once = "log-once"
+    strict = "strict"
+
+
+# undefined accesses counted by name for the render in progress
+_undefined_counts: ContextVar[Optional[Counter]] = ContextVar(
+    "undefined_counts", default=None
+)
+
+
+def record_undefined(name: str) -> int:
+    counts = _undefined_counts.get()
+    if counts is None:
+        return 0
+    counts[name] += 1
+    return counts[name]
 
 
 class SilentUndefined(Undefined):
     """
     Dont break renders because vars arent there!
+
+    Every use of an undefined variable is counted, whether it is printed,
+    tested, iterated or has an attribute looked up on it.
     """
 
+    def _record(self):
+        record_undefined(self._undefined_name or self._undefined_message)
+
     def _fail_with_undefined_error(self, *args, **kwargs):
-        logging.exception("Found undefined variable skipping %s %s", args, kwargs)
+        self._record()
         return None
 
+    def __str__(self) -> str:
+        self._record()
+        return super().__str__()
+
+    def __iter__(self):
+        self._record()
+        return super().__iter__()
+
+    def __bool__(self) -> bool:
+        self._record()
+        return super().__bool__()
+
+    def __len__(self) -> int:
+        self._record()
+        return super().__len__()
+
+
+class LogOnceUndefined(SilentUndefined):
+    """
+    As SilentUndefined, logging the first undefined access to each name in a render
+    """
+
+    def _record(self):
+        name = self._undefined_name or self._undefined_message
+        if record_undefined(name) <= 1:
+            logging.warning("Found undefined variable %s, skipping", name)
+
+
+UNDEFINED_CLASSES = {
+    UndefinedPolicy.silent: SilentUndefined,
+    UndefinedPolicy.log_once: LogOnceUndefined,
+    UndefinedPolicy.strict: StrictUndefined,
+}
+
 
 class TemplateRenderer:
     jinja: Optional[Environment]
 
-    def __init__(self):
+    def __init__(
+        self,
+        bytecode_cache: Optional[BytecodeCache] = None,
+        undefined_policy: UndefinedPolicy = UndefinedPolicy.silent,
+        string_cache_size: int = DEFAULT_STRING_CACHE_SIZE,
+    ):
         self.jinja = None
+        self.bytecode_cache = bytecode_cache
+        self.undefined_policy = UndefinedPolicy(undefined_policy)
+        # templates compiled by render_from_string, keyed by a hash of their text
+        self._string_templates = LRUCache(string_cache_size)
 
     def reset_environment(self, loader=None):
         """
@@ -45,10 +198,12 @@ class TemplateRenderer:
             autoescape=False,
             auto_reload=True,
             loader=loader,
-            undefined=SilentUndefined,
+            undefined=UNDEFINED_CLASSES[self.undefined_policy],
             keep_trailing_newline=True,
+            bytecode_cache=self.bytecode_cache,
         )
-        self.jinja.globals.update(__builtins__)
+        self.jinja.globals.update(TEMPLATE_GLOBALS)
+        self._string_templates.clear()
 
     def use_from_folder(self, searchpath: Union[str, List[str]]):
         """
@@ -56,31 +211,186 @@ class TemplateRenderer:
         """
         self.reset_environment(FileSystemLoader(searchpath))
 
+    def use_compiled(self, searchpath: str) -> bool:
+        """
+        Load templates from the modules precompiled into searchpath/_compiled
+
+        Falls back to the template sources in searchpath for anything not compiled.
+        Returns False, leaving the environment untouched, if there are no compiled
+        templates or they were built from different sources or versions.
+        """
+        compiled_path = os.path.join(searchpath, COMPILED_FOLDER)
+        manifest_file = os.path.join(compiled_path, COMPILED_MANIFEST)
+        if not os.path.exists(manifest_file):
+            return False
+        try:
+            with open(manifest_file, "r") as file:
+                manifest = json.load(file)
+        except ValueError:
+            logging.warning("Could not read %s, ignoring", manifest_file)
+            return False
+        if manifest != compiled_manifest(read_templates(searchpath)):
+            logging.warning(
+                "Compiled templates in %s are out of date, ignoring", compiled_path
+            )
+            return False
+
+        logging.info("Using compiled templates from %s", compiled_path)
+        self.reset_environment(
+            ChoiceLoader(
+                [
+                    CompiledLoader(compiled_path, list(manifest["templates"].keys())),
+                    FileSystemLoader(searchpath),
+                ]
+            )
+        )
+        return True
+
+    def compile_templates(self, target_path: str) -> List[str]:
+        """
+        Compile every .tex template in the environment into python modules at
+        target_path, along with a manifest used to detect stale modules
+        """
+        if self.jinja is None:
+            raise ValueError("Environment not initialized")
+        names = self.list_templates()
+        os.makedirs(target_path, exist_ok=True)
+        self.jinja.compile_templates(
+            target_path,
+            filter_func=lambda name: name in names,
+            zip=None,
+            log_function=logging.info,
+            ignore_errors=False,
+        )
+        templates = {
+            name: self.jinja.loader.get_source(self.jinja, name)[0] for name in names
+        }
+        with open(os.path.join(target_path, COMPILED_MANIFEST), "w") as file:
+            json.dump(compiled_manifest(templates), file, indent=2, sort_keys=True)
+        return names
+
+    def use_archive(self, archive_path: str):
+        """
+        Load templates from a template zip as they are used, without extracting it
+        """
+        self.reset_environment(ZipLoader(archive_path))
+
+    def use_templates(self, templates: Dict[str, str]):
+        """
+        Load templates held in memory, keyed by template name
+        """
+        self.reset_environment(DictLoader(templates))
+
     def use_loader(self, loader: BaseLoader):
         """
         Load the basic template (fallback) included in the package
         """
         self.reset_environment(loader)
 
-    def render_from_string(self, template: str, data: Dict, content: str = ""):
+    def _start_tracking(self):
+        return _undefined_counts.set(Counter())
+
+    def _stop_tracking(self, token, undefined_summary: Optional[Dict[str, int]]):
+        counts = _undefined_counts.get() or Counter()
+        try:
+            _undefined_counts.reset(token)
+        except ValueError:
+            # a generator finished in a different context than it started
+            _undefined_counts.set(None)
+        if undefined_summary is not None:
+            undefined_summary.clear()
+            undefined_summary.update(counts.most_common())
+        if len(counts) > 0:
+            logging.info(
+                "Undefined variables in render: %s",
+                ", ".join(f"{name} ({count})" for name, count in counts.most_common()),
+            )
+
+    def _tracked(
+        self, pieces: Iterator[str], undefined_summary: Optional[Dict[str, int]]
+    ) -> Iterator[str]:
+        token = self._start_tracking()
+        try:
+            yield from pieces
+        finally:
+            self._stop_tracking(token, undefined_summary)
+
+    def render_from_string(
+        self,
+        template: str,
+        data: Dict,
+        content: str = "",
+        undefined_summary: Optional[Dict[str, int]] = None,
+    ):
         """
         Render using the template specified in a string
+
+        undefined_summary, if given, is filled with the number of uses of each
+        undefined variable in this render. Renderers are shared between builds,
+        so the summary is kept by the caller rather than on the renderer.
         """
         if self.jinja is None:
             raise ValueError("Environment not initialized")
-        template_obj = self.jinja.from_string(template)
-        return template_obj.render(**data, CONTENT=content)
+        jinja = self.jinja
+        template_obj = self._string_templates.get_or_create(
+            hashlib.sha256(template.encode("utf-8")).hexdigest(),
+            lambda: jinja.from_string(template),
+        )
+        token = self._start_tracking()
+        try:
+            return template_obj.render(**data, CONTENT=content)
+        finally:
+            self._stop_tracking(token, undefined_summary)
+
+    @property
+    def string_cache_stats(self) -> Dict[str, int]:
+        """
+        Hits and misses of the compiled template cache used by render_from_string
+        """
+        return self._string_templates.stats
 
     def list_templates(self):
         if self.jinja is None:
             raise ValueError("Environment not initialized")
         return [t for t in self.jinja.list_templates() if re.match(r".*.tex$", t)]
 
-    def render(self, data: Dict, content: str, template_name: str = "template.tex"):
+    def generate(
+        self,
+        data: Dict,
+        content: str,
+        template_name: str = "template.tex",
+        undefined_summary: Optional[Dict[str, int]] = None,
+    ) -> Iterator[str]:
+        """
+        Render piece by piece, without holding the whole output in memory
+
+        undefined_summary is filled as for render_from_string, once the pieces
+        have all been consumed.
+        """
+        if self.jinja is None:
+            raise ValueError("Environment not initialized")
+        template = self.jinja.get_template(template_name)
+        return self._tracked(
+            template.generate(**data, CONTENT=content), undefined_summary
+        )
+
+    def render(
+        self,
+        data: Dict,
+        content: str,
+        template_name: str = "template.tex",
+        undefined_summary: Optional[Dict[str, int]] = None,
+    ):
         """
         A render method which will
+
+        undefined_summary is filled as for render_from_string.
         """
         if self.jinja is None:
             raise ValueError("Environment not initialized")
         template = self.jinja.get_template(template_name)
-        return template.render(**data, CONTENT=content)
+        token = self._start_tracking()
+        try:
+            return template.render(**data, CONTENT=content)
+        finally:
+            self._stop_tracking(token, undefined_summary)
@@ -0,0 +1,130 @@
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# the Timings collecting phases in the current context, if any
+_active: ContextVar[Optional["Timings"]] = ContextVar("jtex_timings", default=None)
+
+
+class Timings:
+    """
+    Wall and CPU time spent in each phase of a build
+
+    Used as a context manager, phases timed with `timed` anywhere in the code
+    called within the block are added up per phase name, in the order first
+    seen. CPU time is this process's only, chapters transformed in worker
+    processes count towards wall time alone. Phases do not nest, the code
+    only times leaf steps, so the phases add up to at most the total.
+
+        with Timings() as timings:
+            builder.build(...)
+        timings.write("timings.json")
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, List[float]] = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._start = (0.0, 0.0)
+        self._token = None
+
+    def __enter__(self):
+        self._token = _active.set(self)
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, *args):
+        self.wall += time.perf_counter() - self._start[0]
+        self.cpu += time.process_time() - self._start[1]
+        _active.reset(self._token)
+
+    def add(self, name: str, wall: float, cpu: float):
+        phase = self.phases.setdefault(name, [0.0, 0.0, 0])
+        phase[0] += wall
+        phase[1] += cpu
+        phase[2] += 1
+
+    def to_dict(self) -> Dict:
+        return dict(
+            wall=self.wall,
+            cpu=self.cpu,
+            phases={
+                name: dict(wall=wall, cpu=cpu, count=count)
+                for name, (wall, cpu, count) in self.phases.items()
+            },
+        )
+
+    def write(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+@contextmanager
+def timed(name: str):
+    """
+    Time the block as phase name of the active Timings, if there is one
+    """
+    timings = _active.get()
+    if timings is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def timed_iter(name: str, iterable: Iterable[T]) -> Iterable[T]:
+    """
+    Time producing each item of iterable as phase name, for generators whose
+    work happens as they are consumed
+    """
+    timings = _active.get()
+    if timings is None:
+        return iterable
+
+    def generate() -> Iterator[T]:
+        iterator = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                timings.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+            yield item
+
+    return generate()
+
+
+def timed_call(name: str, func: Callable[[str], str]) -> Callable[[str], str]:
+    """
+    func timed as phase name each time it is called
+    """
+    if _active.get() is None:
+        return func
+
+    def call(text: str) -> str:
+        with timed(name):
+            return func(text)
+
+    return call
+
+
+@contextmanager
+def report_to(path: Optional[str]):
+    """
+    Collect Timings for the block and write them to path as JSON, if a path is given
+    """
+    if path is None:
+        yield None
+        return
+    with Timings() as timings:
+        yield timings
+    timings.write(path)
@@ -0,0 +1,79 @@
+import logging
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .options.RegexTransform import RegexTransform
+
+# numbered backreferences change meaning once a pattern is embedded in another
+NUMBERED_BACKREF = re.compile(r"\\[1-9]")
+
+
+class TransformEngine:
+    """
+    Applies a set of content transforms in a single scan of the content
+
+    RegexTransforms are fused into one alternation so the content is scanned
+    once however many are active. At each position the first transform, in
+    registration order, that matches there is applied and scanning resumes
+    after its match. This gives the same result as applying the transforms one
+    after another as long as no transform matches text that another produces
+    or overlaps. Patterns that cannot be fused, and transforms that are plain
+    functions, are applied afterwards in their own passes.
+    """
+
+    def __init__(self, transforms: Iterable[Callable[[str], str]]):
+        self.transforms = list(transforms)
+        fusable = [
+            t
+            for t in self.transforms
+            if isinstance(t, RegexTransform) and not NUMBERED_BACKREF.search(t.pattern)
+        ]
+        # _scan finds the next match of any transform, it has no capturing groups
+        # of its own so re keeps its fast search for the patterns' first characters.
+        # _dispatch, the same alternation with a named group per transform, is
+        # only run where _scan matched to tell which transform it was.
+        self._scan: Optional[re.Pattern] = None
+        self._dispatch: Optional[re.Pattern] = None
+        self._by_group: Dict[str, RegexTransform] = {}
+        if len(fusable) > 1:
+            try:
+                self._scan = re.compile("|".join(t.scoped_pattern for t in fusable))
+                self._dispatch = re.compile(
+                    "|".join(
+                        f"(?P<_t{idx}>{t.scoped_pattern})"
+                        for idx, t in enumerate(fusable)
+                    )
+                )
+                self._by_group = {f"_t{idx}": t for idx, t in enumerate(fusable)}
+            except re.error as err:  # e.g. group names clashing between patterns
+                logging.warning("Could not fuse content transforms: %s", err)
+                self._scan = self._dispatch = None
+        fused = list(self._by_group.values())
+        self._passes: List[Callable[[str], str]] = [
+            t for t in self.transforms if t not in fused
+        ]
+        logging.info(
+            "TransformEngine - %s transforms fused, %s applied separately",
+            len(fused),
+            len(self._passes),
+        )
+
+    def __len__(self):
+        return len(self.transforms)
+
+    def __call__(self, content: str) -> str:
+        if self._scan is not None:
+            content = self._scan.sub(self._replace, content)
+        for transform in self._passes:
+            content = transform(content)
+        return content
+
+    def _replace(self, match: re.Match) -> str:
+        start = match.start()
+        # matches the same span as match, as the alternatives are tried in the same order
+        dispatched = self._dispatch.match(match.string, start)  # type: ignore
+        transform = self._by_group[dispatched.lastgroup]  # type: ignore
+        if transform.constant is not None:
+            return transform.constant
+        # rerun the transform's own regex so its group numbers line up with its replacement
+        return transform.regex.match(match.string, start).expand(transform.replacement)  # type: ignore
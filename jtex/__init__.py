@@ -1,8 +1,13 @@
+from .BatchBuilder import BatchBuilder, BatchItem, BatchResult
+from .BytecodeCache import TemplateBytecodeCache
 from .DefBuilder import DefBuilder
 from .DocModel import DocModel
+from .FileSystem import DiskFileSystem, FileSystem, MemoryFileSystem, ZipFileSystem
 from .LatexBuilder import LatexBuilder
 from .PublicTemplateLoader import PublicTemplateLoader
 from .TemplateLoader import TemplateLoader
 from .TemplateOptions import Tag, TemplateOptions
 from .TemplateRenderer import TemplateRenderer
+from .Timings import Timings
+from .TransformEngine import TransformEngine
 from .version import __version__
@@ -4,8 +4,10 @@ import sys
 import typer
 
 from ..version import __version__
+from .compile import compile_template
 from .freeform import freeform
 from .render import render
+from .render_many import render_many
 from .validate import validate
 
 logger = logging.getLogger()
@@ -21,6 +23,13 @@ logger.addHandler(handler)
 app = typer.Typer()
 
 app.command(help=("Validate a Curvenote LaTeX Template"))(validate)
+app.command(
+    name="compile",
+    help=(
+        "Precompile the templates in a Curvenote LaTeX Template folder into python modules. "
+        "Renders using the template load these directly, skipping template parsing."
+    ),
+)(compile_template)
 app.command(
     help=(
         "Build a LaTeX document based on a free-form template, accompanying data structure and optional 'body' content. "
@@ -35,6 +44,14 @@ app.command(
         "Can be used to develop/test Curvenote templates."
     )
 )(render)
+app.command(
+    name="render-many",
+    help=(
+        "Build many LaTeX documents listed in a manifest, as `render` does for a single document. "
+        "Documents sharing a template load it once and are rendered in parallel with --jobs. "
+        "Progress is recorded in a journal so interrupted runs resume where they left off."
+    ),
+)(render_many)
 
 
 def version_callback(value: bool):
@@ -0,0 +1,32 @@
+import os
+from pathlib import Path
+
+import typer
+
+from ..TemplateRenderer import COMPILED_FOLDER, TemplateRenderer
+
+
+def compile_template(
+    template_path: Path = typer.Argument(
+        ...,
+        help=("Local folder containing the Curvenote compatible template to compile"),
+        exists=True,
+        dir_okay=True,
+        file_okay=False,
+        resolve_path=True,
+    ),
+):
+    target_path = os.path.join(str(template_path), COMPILED_FOLDER)
+    typer.echo(f"Compiling templates in {template_path}")
+
+    renderer = TemplateRenderer()
+    renderer.use_from_folder(str(template_path))
+    try:
+        names = renderer.compile_templates(target_path)
+    except Exception as err:
+        typer.echo(f"Could not compile templates: {err}")
+        raise typer.Exit(code=1)
+
+    for name in names:
+        typer.echo(f"Compiled {name}")
+    typer.echo(f"Compiled templates written to {target_path}")
@@ -1,10 +1,13 @@
 import os
 from pathlib import Path
-from shutil import copyfile
+from typing import Dict, Optional
 
 import typer
+from jinja2 import UndefinedError
 
 from .. import DocModel, TemplateRenderer, utils
+from ..TemplateRenderer import UndefinedPolicy
+from ..Timings import report_to, timed
 
 
 def freeform(
@@ -48,6 +51,32 @@ def freeform(
         file_okay=True,
         resolve_path=True,
     ),
+    undefined: UndefinedPolicy = typer.Option(
+        UndefinedPolicy.silent,
+        help=(
+            "How to treat variables used in the template that are not in the data. "
+            "'silent' and 'log-once' render anyway and summarise what was missing, 'strict' fails the render."
+        ),
+    ),
+    timings: Path = typer.Option(
+        None,
+        help="Write the wall and CPU time spent in each phase of the build to this JSON file.",
+        dir_okay=False,
+        file_okay=True,
+        resolve_path=True,
+    ),
+):
+    with report_to(str(timings) if timings is not None else None):
+        _freeform(template_tex, content_tex, output_tex, bib, undefined)
+    typer.echo("Done!")
+
+
+def _freeform(
+    template_tex: Path,
+    content_tex: Path,
+    output_tex: Path,
+    bib: Optional[Path],
+    undefined: UndefinedPolicy,
 ):
     typer.echo(f"Output file: {output_tex}")
     typer.echo(f"Content file: {content_tex}")
@@ -55,17 +84,17 @@ def freeform(
     if bib:
         typer.echo(f"Bib file: {bib}")
 
-    fm_and_content = ""
+    # Load configuration from front matter, then the content after it
+    fm, content = None, ""
     if content_tex:
         try:
-            with open(content_tex) as cfile:
-                fm_and_content = cfile.read()
-        except:
+            with timed("parse_front_matter"):
+                fm, body = utils.read_front_matter(str(content_tex))
+            with timed("read_content"):
+                content = body.read()
+        except (OSError, UnicodeError):
             typer.echo("Could not read content")
             raise typer.Exit(code=1)
-
-    # Load configuration from front matter
-    fm, content = utils.parse_front_matter(fm_and_content)
     if fm is None:
         typer.echo("Could not read front matter in content")
         raise typer.Exit(code=1)
@@ -82,22 +111,36 @@ def freeform(
         raise typer.Exit(1)
 
     typer.echo("Rendering...")
-    renderer = TemplateRenderer()
+    renderer = TemplateRenderer(undefined_policy=undefined)
     renderer.reset_environment()
 
-    rendered = renderer.render_from_string(template, docmodel.to_dict(), content)
+    undefined_summary: Dict[str, int] = {}
+    try:
+        with timed("render"):
+            rendered = renderer.render_from_string(
+                template, docmodel.to_dict(), content, undefined_summary
+            )
+    except UndefinedError as err:
+        typer.echo(f"Undefined variable in template: {err}")
+        raise typer.Exit(code=1)
+    if len(undefined_summary) > 0:
+        typer.echo(f"Undefined variables: {undefined_summary}")
     typer.echo("Rendered")
 
     try:
         os.makedirs(os.path.dirname(output_tex), exist_ok=True)
-        with open(output_tex, "w") as outfile:
-            outfile.write(utils.stringify_front_matter(docmodel.to_dict()))
-            outfile.write(rendered)
+        with timed("write"):
+            written = utils.write_if_changed(
+                str(output_tex),
+                utils.stringify_front_matter(docmodel.to_dict()) + rendered,
+            )
+        if not written:
+            typer.echo("Output unchanged")
+        if bib:
+            with timed("bib_copy"):
+                utils.copy_if_changed(
+                    str(bib), os.path.join(os.path.dirname(str(output_tex)), "main.bib")
+                )
     except:
         typer.echo("Could not write output file")
         typer.Exit(1)
-
-    if bib:
-        copyfile(bib, os.path.join(str(output_tex), "main.bib"))
-
-    typer.echo("Done!")
@@ -1,12 +1,16 @@
 import glob
 import os
 from pathlib import Path
-from shutil import copyfile
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 import typer
+from jinja2 import UndefinedError
 
 from .. import DocModel, LatexBuilder, PublicTemplateLoader, TemplateLoader, utils
+from ..FileSystem import DiskFileSystem, FileSystem
+from ..TemplateOptions import TemplateOptions
+from ..TemplateRenderer import TemplateRenderer, UndefinedPolicy
+from ..Timings import report_to, timed
 
 
 def validate_document(docmodel: DocModel):
@@ -14,69 +18,37 @@ def validate_document(docmodel: DocModel):
     return True
 
 
-def render(
-    content_file: Path = typer.Argument(
-        ...,
-        help=(
-            "Path to a .tex file with containing jtex front matter content to render."
-        ),
-        exists=True,
-        dir_okay=False,
-        file_okay=True,
-        resolve_path=True,
-    ),
-    output_path: Path = typer.Option(
-        None,
-        help=(
-            "If supplied with override the jtex.output.path (and default path) specified in front matter"
-            "This is useful when dynamically setting a temporary output folder."
-            "Will be created if it does not exist."
-        ),
-        exists=False,
-        dir_okay=True,
-        file_okay=False,
-        resolve_path=True,
-    ),
-    template_path: Path = typer.Option(
-        None,
-        help=(
-            "If supplied with override the jtex.template option and use the template found on this path"
-        ),
-        exists=True,
-        dir_okay=True,
-        file_okay=False,
-        resolve_path=True,
-    ),
-):
+def read_content(content_file: Path, with_body: bool = True) -> Tuple[Dict, str]:
+    """
+    Read a content file, returning its front matter and body, or only its
+    front matter without reading further than that unless with_body is set
+    """
     typer.echo(f"Content: {content_file}")
     if content_file.exists() and content_file.is_file():
         typer.echo("Found content")
     else:
-        typer.echo("content not found")
-        raise typer.Exit(code=1)
+        raise ValueError(f"content not found at {content_file}")
 
-    # open content file
-    fm_and_content = ""
+    # Load configuration from front matter, then the content after it
+    content = ""
     try:
-        with open(content_file) as cfile:
-            fm_and_content = cfile.read()
+        with timed("parse_front_matter"):
+            fm, body = utils.read_front_matter(str(content_file))
+        if with_body:
+            with timed("read_content"):
+                content = body.read()
         typer.echo("Loaded content")
-    except:
-        typer.echo("Could not read content")
-        raise typer.Exit(code=1)
-
-    # Load configuration from front matter
-    fm, content = utils.parse_front_matter(fm_and_content)
+    except (OSError, UnicodeError) as err:
+        raise ValueError(f"Could not read content - {err}")
     if fm is None:
-        typer.echo("Could not read front matter in content")
-        raise typer.Exit(code=1)
+        raise ValueError("Could not read front matter in content")
 
-    # will validate and throw on invalid front matter
-    docmodel = DocModel(fm)
+    return fm, content
 
-    content_path = os.path.dirname(os.path.abspath(content_file))
-    typer.echo(f"Content path {content_path}")
 
+def resolve_target_folder(
+    docmodel: DocModel, content_path: str, output_path: Optional[Path]
+) -> str:
     # output.path is treated as relative to the content_path, not the current working directory
     jtex_output_path = os.path.expanduser(docmodel.get("jtex.output.path", str, "."))
     target_folder = (
@@ -90,20 +62,23 @@ def render(
         target_folder = str(output_path)
         os.makedirs(target_folder, exist_ok=True)
     typer.echo(f"Target output folder {target_folder}")
+    return target_folder
 
-    jtex_working_path = target_folder
 
+def find_references(docmodel: DocModel, content_path: str) -> Optional[Path]:
     # check for references and confirm bib file
     references = docmodel.get("jtex.input.references")
-    bib_file = ""
-    if references is not None:
-        bib_file = Path(content_path, references)
-        if bib_file.exists():
-            typer.echo(f"Found bib file at {bib_file}")
-        else:
-            typer.echo(f"Could not find references bib file at {bib_file}")
-            raise typer.Exit(code=1)
+    if references is None:
+        return None
+    bib_file = Path(content_path, references)
+    if bib_file.exists():
+        typer.echo(f"Found bib file at {bib_file}")
+    else:
+        raise ValueError(f"Could not find references bib file at {bib_file}")
+    return bib_file
 
+
+def load_tagged(docmodel: DocModel, content_path: str) -> Dict[str, str]:
     # check for tagged content and load it
     tagged_files = docmodel.get("jtex.input.tagged", Dict[str, str], {})
     tagged = {}
@@ -121,37 +96,104 @@ def render(
         _ = [typer.echo(f"{k}: {v}") for k, v in missing_tagged_files]
         typer.Exit(code=1)
 
+    return tagged
+
+
+def load_chapters(docmodel: DocModel, content_path: str, content: str) -> List[str]:
+    """
+    The content chunks to build, the content followed by any jtex.input.chapters
+    """
+    chapter_files = docmodel.get("jtex.input.chapters", List[str], [])
+    if len(chapter_files) == 0:
+        return [content]
+    chunks = [content] if len(content.strip()) > 0 else []
+    for chapter_file in chapter_files:
+        chapter_file_path = os.path.join(content_path, chapter_file)
+        if not os.path.exists(chapter_file_path):
+            raise ValueError(f"Could not find chapter file at {chapter_file_path}")
+        with open(chapter_file_path, "r") as f:
+            chunks.append(f.read())
+    typer.echo(f"Loaded {len(chapter_files)} chapters")
+    return chunks
+
+
+def load_template(
+    docmodel: DocModel,
+    jtex_working_path: str,
+    template_path: Optional[Path],
+    undefined: UndefinedPolicy,
+) -> Tuple[TemplateLoader, TemplateOptions, TemplateRenderer]:
+    """
+    Load the template for docmodel, close the loader once the build is done
+    """
     template = docmodel.get("jtex.template")
     if template_path is not None:
         typer.echo(f"Using local template at: {template_path}")
-        loader = TemplateLoader(jtex_working_path)
+        loader = TemplateLoader(jtex_working_path, undefined_policy=undefined)
         template_options, renderer = loader.initialise_from_path(str(template_path))
     elif template is not None:
         typer.echo(
             f"Using template {docmodel.get('jtex.template')} from the Curvenote API"
         )
-        loader = PublicTemplateLoader(jtex_working_path)
+        loader = PublicTemplateLoader(jtex_working_path, undefined_policy=undefined)
         template_options, renderer = loader.initialise_from_template_api(template)
     else:
         typer.echo("Using built in template")
-        loader = TemplateLoader(jtex_working_path)
+        loader = TemplateLoader(jtex_working_path, undefined_policy=undefined)
         template_options, renderer = loader.initialise_with_builtin_template()
     typer.echo("Template loaded")
+    return loader, template_options, renderer
+
+
+def build_document(
+    builder: LatexBuilder,
+    docmodel: DocModel,
+    content: List[str],
+    tagged: Dict[str, str],
+):
+    try:
+        builder.build(
+            docmodel,
+            content,
+            tagged,
+            bibtex=None,
+            raise_if_invalid=docmodel.get("jtex.strict", bool, False),
+            stream=True,
+        )
+    except UndefinedError as err:
+        raise ValueError(f"Undefined variable in template: {err}")
+    if len(builder.undefined_summary) > 0:
+        typer.echo(f"Undefined variables: {builder.undefined_summary}")
+    if len(builder.unresolved_inputs) > 0:
+        typer.echo(
+            f"Could not find files to inline: {', '.join(builder.unresolved_inputs)}"
+        )
+    if len(builder.changed_files) > 0:
+        typer.echo(
+            f"Updated: {', '.join(os.path.basename(f) for f in builder.changed_files)}"
+        )
+    else:
+        typer.echo("Outputs unchanged")
 
-    builder = LatexBuilder(template_options, renderer, str(target_folder))
-    builder.build(
-        docmodel,
-        [content],
-        tagged,
-        bibtex=None,
-        raise_if_invalid=docmodel.get("jtex.strict", bool, False),
-    )
 
-    if references is not None:
+def copy_references(
+    bib_file: Optional[Path], target_folder: str, fs: Optional[FileSystem] = None
+):
+    fs = fs if fs is not None else DiskFileSystem()
+    if bib_file is not None:
         target_bib = os.path.join(str(target_folder), "main.bib")
         if bib_file != Path(target_bib):
-            copyfile(bib_file, target_bib)
+            with timed("bib_copy"):
+                fs.copy_file(str(bib_file), target_bib)
 
+
+def copy_assets(
+    docmodel: DocModel,
+    content_path: str,
+    target_folder: str,
+    fs: Optional[FileSystem] = None,
+):
+    fs = fs if fs is not None else DiskFileSystem()
     typer.echo("Checking content_path for image assets")
     typer.echo(f"Content Path: {content_path}")
     typer.echo(f"Target Folder: {target_folder}")
@@ -165,10 +207,11 @@ def render(
     def copy_with_path(file_path: str, target_folder: str):
         src_path, filename = os.path.split(file_path)
         internal_src_path = Path(src_path).relative_to(content_path)
-        os.makedirs(target_folder / internal_src_path, exist_ok=True)
-        dest = target_folder / internal_src_path / filename
-        if Path(file_path) != dest:
-            copyfile(file_path, dest)
+        fs.makedirs(os.path.join(target_folder, internal_src_path))
+        dest = Path(target_folder, internal_src_path, filename)
+        with timed("assets.copy"):
+            copied = Path(file_path) != dest and fs.copy_file(file_path, str(dest))
+        if copied:
             typer.echo(f"Copied {filename} to {dest}")
 
     if not copy:
@@ -185,10 +228,11 @@ def render(
             "*.pdf",
         ]
         image_files = []
-        for im_type in image_types:
-            image_files.extend(
-                glob.glob(f"{content_path}/**/{im_type}", recursive=True)
-            )
+        with timed("assets.glob"):
+            for im_type in image_types:
+                image_files.extend(
+                    glob.glob(f"{content_path}/**/{im_type}", recursive=True)
+                )
         if len(image_files) > 0:
             typer.echo(f"Found {len(image_files)} files to copy")
             for im_file_path in image_files:
@@ -196,8 +240,11 @@ def render(
         else:
             typer.echo("No image assets found")
 
-        tex_files = glob.glob(f"{content_path}/**/*.tex", recursive=True)
-        if len(tex_files) > 0:
+        with timed("assets.glob"):
+            tex_files = glob.glob(f"{content_path}/**/*.tex", recursive=True)
+        if docmodel.get("jtex.output.single_file", bool, False):
+            typer.echo("jtex.output.single_file is set - not copying tex files")
+        elif len(tex_files) > 0:
             typer.echo(f"Found {len(tex_files) - 1} files to copy")
             for tex_file_path in tex_files:
                 if tex_file_path.endswith(
@@ -206,4 +253,89 @@ def render(
                     continue
                 copy_with_path(tex_file_path, target_folder)
 
+
+def render(
+    content_file: Path = typer.Argument(
+        ...,
+        help=(
+            "Path to a .tex file with containing jtex front matter content to render."
+        ),
+        exists=True,
+        dir_okay=False,
+        file_okay=True,
+        resolve_path=True,
+    ),
+    output_path: Path = typer.Option(
+        None,
+        help=(
+            "If supplied with override the jtex.output.path (and default path) specified in front matter"
+            "This is useful when dynamically setting a temporary output folder."
+            "Will be created if it does not exist."
+        ),
+        exists=False,
+        dir_okay=True,
+        file_okay=False,
+        resolve_path=True,
+    ),
+    template_path: Path = typer.Option(
+        None,
+        help=(
+            "If supplied with override the jtex.template option and use the template found on this path, a folder or zip"
+        ),
+        exists=True,
+        dir_okay=True,
+        file_okay=True,
+        resolve_path=True,
+    ),
+    undefined: UndefinedPolicy = typer.Option(
+        UndefinedPolicy.silent,
+        help=(
+            "How to treat variables used in the template that are not in the data. "
+            "'silent' and 'log-once' render anyway and summarise what was missing, 'strict' fails the render."
+        ),
+    ),
+    timings: Path = typer.Option(
+        None,
+        help="Write the wall and CPU time spent in each phase of the build to this JSON file.",
+        dir_okay=False,
+        file_okay=True,
+        resolve_path=True,
+    ),
+):
+    try:
+        with report_to(str(timings) if timings is not None else None):
+            fm, content = read_content(content_file)
+
+            # will validate and throw on invalid front matter
+            docmodel = DocModel(fm)
+
+            content_path = os.path.dirname(os.path.abspath(content_file))
+            typer.echo(f"Content path {content_path}")
+
+            target_folder = resolve_target_folder(docmodel, content_path, output_path)
+            jtex_working_path = target_folder
+
+            bib_file = find_references(docmodel, content_path)
+            tagged = load_tagged(docmodel, content_path)
+            chapters = load_chapters(docmodel, content_path, content)
+
+            loader, template_options, renderer = load_template(
+                docmodel, jtex_working_path, template_path, undefined
+            )
+
+            with loader:
+                builder = LatexBuilder(
+                    template_options,
+                    renderer,
+                    str(target_folder),
+                    input_paths=[content_path],
+                )
+                build_document(builder, docmodel, chapters, tagged)
+
+            copy_references(bib_file, target_folder)
+            copy_assets(docmodel, content_path, target_folder)
+    except ValueError as err:
+        typer.echo(str(err))
+        raise typer.Exit(code=1)
+
     typer.echo("Done!")
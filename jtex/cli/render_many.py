@@ -0,0 +1,257 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+import yaml
+
+from .. import DocModel
+from ..BatchBuilder import BatchBuilder, BatchResult, BatchState
+from ..TemplateRenderer import UndefinedPolicy
+from .render import (
+    build_document,
+    copy_assets,
+    copy_references,
+    find_references,
+    load_chapters,
+    load_tagged,
+    read_content,
+    resolve_target_folder,
+)
+
+
+class ManifestEntry:
+    """
+    A content file to render, with optional output folder and template overrides
+    """
+
+    def __init__(
+        self,
+        content_file: str,
+        output_path: Optional[str] = None,
+        template_path: Optional[str] = None,
+    ):
+        self.content_file = content_file
+        self.output_path = output_path
+        self.template_path = template_path
+
+    @property
+    def key(self) -> str:
+        return f"{self.content_file}|{self.output_path or ''}"
+
+
+class RenderJob:
+    """
+    A manifest entry resolved against its front matter, ready for a worker
+    """
+
+    def __init__(self, entry: ManifestEntry, docmodel: DocModel, target_folder: str):
+        self.entry = entry
+        self.docmodel = docmodel
+        self.target_folder = target_folder
+
+    @property
+    def name(self) -> str:
+        return self.entry.content_file
+
+
+def read_manifest(manifest: Path) -> List[ManifestEntry]:
+    """
+    Read a manifest, either a YAML list or JSON lines, of entries with a content
+    path and optional output and template_path. Relative paths are resolved
+    against the manifest's folder.
+    """
+    with open(manifest, "r") as file:
+        if manifest.suffix in [".jsonl", ".ndjson"]:
+            raw = [json.loads(line) for line in file if len(line.strip()) > 0]
+        else:
+            raw = yaml.load(file, Loader=yaml.SafeLoader) or []
+
+    base = os.path.dirname(os.path.abspath(manifest))
+
+    def resolve(value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return os.path.abspath(os.path.join(base, os.path.expanduser(value)))
+
+    entries = []
+    for item in raw:
+        if isinstance(item, str):
+            item = dict(content=item)
+        if "content" not in item:
+            raise ValueError(f"Manifest entry has no content: {item}")
+        entries.append(
+            ManifestEntry(
+                resolve(item["content"]),
+                resolve(item.get("output")),
+                resolve(item.get("template_path")),
+            )
+        )
+    return entries
+
+
+def read_journal(journal: Path) -> Dict[str, Dict]:
+    """
+    Latest journal record for each entry key
+    """
+    records: Dict[str, Dict] = {}
+    if not journal.exists():
+        return records
+    with open(journal, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written line from an interrupted run
+            records[record["key"]] = record
+    return records
+
+
+def render_job(state: BatchState, job: RenderJob):
+    """
+    The steps of `jtex render` after the template is loaded, run in a batch worker
+    """
+    content_file = Path(job.entry.content_file)
+    _, content = read_content(content_file)
+    content_path = os.path.dirname(os.path.abspath(content_file))
+
+    bib_file = find_references(job.docmodel, content_path)
+    tagged = load_tagged(job.docmodel, content_path)
+    chapters = load_chapters(job.docmodel, content_path, content)
+
+    os.makedirs(job.target_folder, exist_ok=True)
+    builder = state.builder_for(job.target_folder, input_paths=[content_path])
+    build_document(builder, job.docmodel, chapters, tagged)
+
+    copy_references(bib_file, job.target_folder)
+    copy_assets(job.docmodel, content_path, job.target_folder)
+
+
+def render_many(
+    manifest: Path = typer.Argument(
+        ...,
+        help=(
+            "Path to a manifest of documents to render, a .yml list or .jsonl lines of entries with "
+            "'content' (path to a .tex file with jtex front matter) and optionally 'output' and 'template_path'. "
+            "Relative paths are resolved against the manifest's folder."
+        ),
+        exists=True,
+        dir_okay=False,
+        file_okay=True,
+        resolve_path=True,
+    ),
+    jobs: int = typer.Option(
+        1, help="Number of documents to render in parallel worker processes."
+    ),
+    journal: Path = typer.Option(
+        None,
+        help=(
+            "Journal file recording rendered documents, defaults to the manifest path with .journal appended. "
+            "Documents already rendered successfully are skipped, so an interrupted run resumes where it left off."
+        ),
+        dir_okay=False,
+        file_okay=True,
+        resolve_path=True,
+    ),
+    template_path: Path = typer.Option(
+        None,
+        help=(
+            "If supplied will override the jtex.template option of every document and use the template found on this path, a folder or zip"
+        ),
+        exists=True,
+        dir_okay=True,
+        file_okay=True,
+        resolve_path=True,
+    ),
+    undefined: UndefinedPolicy = typer.Option(
+        UndefinedPolicy.silent,
+        help=(
+            "How to treat variables used in the template that are not in the data. "
+            "'silent' and 'log-once' render anyway and summarise what was missing, 'strict' fails the render."
+        ),
+    ),
+):
+    journal_path = journal if journal is not None else Path(f"{manifest}.journal")
+    entries = read_manifest(manifest)
+    records = read_journal(journal_path)
+    pending = [e for e in entries if not records.get(e.key, {}).get("ok", False)]
+    typer.echo(
+        f"{len(entries)} documents in manifest, {len(entries) - len(pending)} already rendered"
+    )
+
+    failed = 0
+    with open(journal_path, "a") as journal_file:
+
+        def record(entry: ManifestEntry, result: BatchResult):
+            nonlocal failed
+            if not result.ok:
+                failed += 1
+            journal_file.write(
+                json.dumps(dict(key=entry.key, ok=result.ok, **result.to_dict())) + "\n"
+            )
+            journal_file.flush()
+            typer.echo(
+                f"{'Rendered' if result.ok else 'FAILED'} {result.name} ({result.seconds:.2f}s)"
+            )
+
+        # group documents by template so each template is loaded once
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[RenderJob]] = {}
+        for entry in pending:
+            try:
+                fm, _ = read_content(Path(entry.content_file), with_body=False)
+                docmodel = DocModel(fm)
+                content_path = os.path.dirname(entry.content_file)
+                target_folder = resolve_target_folder(
+                    docmodel,
+                    content_path,
+                    Path(entry.output_path) if entry.output_path else None,
+                )
+            except Exception as err:  # includes the ValueError from read_content
+                record(
+                    entry,
+                    BatchResult(
+                        entry.content_file, "", 0.0, f"{type(err).__name__}: {err}"
+                    ),
+                )
+                continue
+            local_template = entry.template_path or (
+                str(template_path) if template_path is not None else None
+            )
+            template_name = (
+                None if local_template is not None else docmodel.get("jtex.template")
+            )
+            groups.setdefault((local_template, template_name), []).append(
+                RenderJob(entry, docmodel, target_folder)
+            )
+
+        for (local_template, template_name), group in groups.items():
+            typer.echo(
+                f"Rendering {len(group)} documents with template {local_template or template_name or 'builtin'}"
+            )
+            with BatchBuilder(
+                template_path=local_template,
+                template_name=template_name,
+                jobs=jobs,
+                undefined_policy=undefined,
+            ) as builder:
+                done = set()
+                try:
+                    for idx, result in builder.run(render_job, group):
+                        record(group[idx].entry, result)
+                        done.add(idx)
+                except Exception as err:  # the template itself could not be loaded
+                    for job in [j for i, j in enumerate(group) if i not in done]:
+                        record(
+                            job.entry,
+                            BatchResult(
+                                job.name,
+                                job.target_folder,
+                                0.0,
+                                f"{type(err).__name__}: {err}",
+                            ),
+                        )
+
+    typer.echo(f"Done! {len(pending) - failed} rendered, {failed} failed")
+    if failed > 0:
+        raise typer.Exit(code=1)
@@ -1,13 +1,7 @@
-import logging
-import re
-
 from .BooleanSchemaOption import BooleanSchemaOption
 from .SchemaOptionDefs import SchemaOptionDefs
 
-
-def citep_transform(content: str):
-    logging.info("Transform: citep_transform")
-    return re.sub(r"\\citep{", r"\\cite{", content)
+citep_transform = SchemaOptionDefs.register_transform("citep", r"\\citep{", r"\\cite{")
 
 
 class NatbibSchemaOption(BooleanSchemaOption):
@@ -19,6 +13,6 @@ class NatbibSchemaOption(BooleanSchemaOption):
             SchemaOptionDefs(packages=["package-natbib.def"]),
         )
 
-        self.add(False, SchemaOptionDefs(transforms=[citep_transform]))
+        self.add(False, SchemaOptionDefs(transforms=["citep"]))
 
         self.set_default(False)
@@ -0,0 +1,54 @@
+import re
+from typing import Optional
+
+# flags that can be scoped to a part of a pattern, see TransformEngine
+INLINE_FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s", re.VERBOSE: "x"}
+
+
+class RegexTransform:
+    """
+    A content transform declared as a regex and its replacement
+
+    Calling it applies the substitution to a string, as re.sub would. Declared
+    this way, rather than as a function, the TransformEngine can fuse it with
+    the other active transforms into a single pass over the content.
+    """
+
+    def __init__(
+        self, pattern: str, replacement: str, flags: int = 0, name: Optional[str] = None
+    ):
+        unsupported = flags & ~sum(INLINE_FLAGS)
+        if unsupported:
+            raise ValueError(f"Unsupported flags for a RegexTransform: {unsupported}")
+        self.pattern = pattern
+        self.replacement = replacement
+        self.flags = flags
+        self.name = name if name is not None else pattern
+        self.regex = re.compile(pattern, flags)
+        self.constant = self._constant_replacement()
+
+    def __call__(self, content: str) -> str:
+        return self.regex.sub(self.replacement, content)
+
+    def __repr__(self):
+        return f"RegexTransform({self.name!r})"
+
+    def _constant_replacement(self) -> Optional[str]:
+        """
+        The replacement text if it does not depend on the match, else None
+        """
+        if self.regex.groups > 0:
+            return None
+        try:
+            expanded = {re.sub(x, self.replacement, x) for x in ["x", "y"]}
+        except re.error:
+            return None
+        return expanded.pop() if len(expanded) == 1 else None
+
+    @property
+    def scoped_pattern(self) -> str:
+        """
+        The pattern with its flags scoped to it, to embed in a larger pattern
+        """
+        letters = "".join(l for f, l in INLINE_FLAGS.items() if self.flags & f)
+        return f"(?{letters}:{self.pattern})" if letters else f"(?:{self.pattern})"
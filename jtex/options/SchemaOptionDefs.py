@@ -1,23 +1,66 @@
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Union
+
+from .RegexTransform import RegexTransform
 
 
 class SchemaOptionDefs:
+    """
+    The defs an option setting brings in, and the transforms applied to content
+    when it is active
+
+    Transforms are registered once by name with `register_transform` and listed
+    by name, as def files are, e.g. SchemaOptionDefs(transforms=["citep"]).
+    Registered transforms are applied together in one pass over the content by
+    the TransformEngine, any other callable taking and returning the content
+    can be listed too and gets its own pass.
+    """
+
     _passopts: List[str]
     _packages: List[str]
     _setup: List[str]
     _transforms: List[Callable[[str], str]]
+    _registered_transforms: Dict[str, RegexTransform] = {}
 
     def __init__(
         self,
         passopts: List[str] = [],
         packages: List[str] = [],
         setup: List[str] = [],
-        transforms: List[Callable[[str], str]] = [],
+        transforms: List[Union[str, Callable[[str], str]]] = [],
     ):
         self._passopts = passopts
         self._packages = packages
         self._setup = setup
-        self._transforms = transforms
+        self._transforms = [
+            self.get_transform(t) if isinstance(t, str) else t for t in transforms
+        ]
+
+    @classmethod
+    def register_transform(
+        cls, name: str, pattern: str, replacement: str, flags: int = 0
+    ) -> RegexTransform:
+        """
+        Register a content transform replacing pattern with replacement, for
+        defs to list by name
+
+        raises a ValueError if a transform is already registered under name
+        """
+        if name in cls._registered_transforms:
+            raise ValueError(f"Transform {name} is already registered")
+        transform = RegexTransform(pattern, replacement, flags, name=name)
+        cls._registered_transforms[name] = transform
+        return transform
+
+    @classmethod
+    def get_transform(cls, name: str) -> RegexTransform:
+        """
+        The transform registered under name
+
+        raises a ValueError if no transform is registered under name
+        """
+        if name not in cls._registered_transforms:
+            raise ValueError(f"Unknown transform {name}")
+        return cls._registered_transforms[name]
 
     @property
     def passopts(self):
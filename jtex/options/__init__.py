@@ -7,6 +7,7 @@ from .CodeSchemaOption import CodeSchemaOption
 from .HideLinksSchemaOption import HideLinksSchemaOption
 from .NatbibSchemaOption import NatbibSchemaOption
 from .RaggedBottomOption import RaggedBottomSchemaOption
+from .RegexTransform import RegexTransform
 from .SchemaOptionDefs import CustomTemplateDefs, SchemaOptionDefs
 from .SloppySchemaOption import SloppySchemaOption
 from .StringSchemaOption import StringSchemaOption
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _cache_dir(monkeypatch, tmp_path_factory):
+    """
+    Keep the on-disk caches of each test out of the user's ~/.cache/jtex
+    """
+    monkeypatch.setenv("JTEX_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+
+
+class StubResponse:
+    """
+    What the stub server answers, sent after delay seconds, with the body cut
+    short after cut_after bytes to simulate a dropped connection
+    """
+
+    def __init__(
+        self,
+        status: int = 200,
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+        delay: float = 0,
+        cut_after: Optional[int] = None,
+    ):
+        self.status = status
+        self.body = body
+        self.headers = headers if headers is not None else {}
+        self.delay = delay
+        self.cut_after = cut_after
+
+    @classmethod
+    def json(cls, data: Any, delay: float = 0) -> "StubResponse":
+        return cls(body=json.dumps(data).encode(), delay=delay)
+
+
+# a route answers the headers of a request
+Route = Callable[[Dict[str, str]], StubResponse]
+
+
+class StubServer:
+    """
+    Local HTTP stand-in for the API and download hosts
+
+    routes map a path to the function answering it, unknown paths get a 404.
+    Every request is recorded as (path, headers).
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                headers = dict(self.headers)
+                server.requests.append((self.path, headers))
+                server.connections.add(self.client_address)
+                route = server.routes.get(self.path)
+                resp = route(headers) if route is not None else StubResponse(404)
+                time.sleep(resp.delay)
+                self.send_response(resp.status)
+                for key, value in resp.headers.items():
+                    self.send_header(key, value)
+                if resp.status != 304:
+                    self.send_header("Content-Length", str(len(resp.body)))
+                self.end_headers()
+                if resp.cut_after is not None:
+                    self.wfile.write(resp.body[: resp.cut_after])
+                    self.close_connection = True
+                elif resp.status != 304:
+                    self.wfile.write(resp.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def paths(self) -> List[str]:
+        return [path for path, _ in self.requests]
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(name="http_server")
+def _http_server():
+    server = StubServer()
+    yield server
+    server.stop()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import pytest
+
+from jtex.BatchBuilder import BatchBuilder, BatchItem
+from jtex.DocModel import DocModel
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+def make_items(tmp_dir: str):
+    items = [
+        BatchItem(
+            DocModel(dict(title=f"Document {n}")),
+            f"Content {n}",
+            os.path.join(tmp_dir, f"doc{n}"),
+        )
+        for n in range(3)
+    ]
+    # strict documents fail on the template's missing required options
+    items.append(
+        BatchItem(
+            DocModel(
+                dict(
+                    title="Strict",
+                    jtex=dict(strict=True, input={}, output={}, options={}),
+                ),
+                ensure_defaults=False,
+            ),
+            "Content",
+            os.path.join(tmp_dir, "strict"),
+            name="strict",
+        )
+    )
+    return items
+
+
+@pytest.fixture(params=[1, 2], name="jobs")
+def _jobs(request):
+    return request.param
+
+
+def test_batch_build(jobs):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        items = make_items(tmp_dir)
+        with BatchBuilder(template_path=TEMPLATE_PATH, jobs=jobs) as builder:
+            results = builder.build(items)
+
+        assert [r.name for r in results] == [i.name for i in items]
+        assert [r.ok for r in results] == [True, True, True, False]
+        assert "REQUIRED" in str(results[3].error)
+        for n in range(3):
+            assert results[n].seconds > 0
+            with open(os.path.join(tmp_dir, f"doc{n}", "main.tex")) as file:
+                actual = file.read()
+            assert f"\\title{{Document {n}}}" in actual
+            assert f"Content {n}" in actual
+            assert os.path.exists(os.path.join(tmp_dir, f"doc{n}", "curvenote.def"))
+            assert not os.path.exists(os.path.join(tmp_dir, f"doc{n}", "template.tex"))
+
+
+def test_batch_build_builtin():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        items = make_items(tmp_dir)[:2]
+        with BatchBuilder() as builder:
+            results = builder.build(items)
+        assert all(r.ok for r in results)
+        assert os.path.exists(os.path.join(tmp_dir, "doc0", "curvenote.png"))
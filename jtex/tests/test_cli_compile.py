@@ -0,0 +1,26 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from jtex.RendererRegistry import RendererRegistry
+
+
+def test_cli_compile():
+    dir, _ = os.path.split(os.path.realpath(__file__))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_path = os.path.join(tmp_dir, "template")
+        shutil.copytree(os.path.join(dir, "data", "cn", "template"), template_path)
+
+        ret_val = subprocess.run(f"jtex compile {template_path}", shell=True)
+        assert ret_val.returncode == 0
+        assert os.path.exists(os.path.join(template_path, "_compiled", "manifest.json"))
+
+        renderer = RendererRegistry().get_folder(template_path)
+        assert renderer.jinja is not None
+        assert renderer.jinja.loader is not None
+        assert type(renderer.jinja.loader).__name__ == "ChoiceLoader"
+        output = renderer.render(dict(doc=dict(title="A Title")), "Lorem ipsum")
+        assert "\\title{A Title}" in output
+        assert "Lorem ipsum" in output
@@ -48,3 +48,27 @@ def test_cli_freeform():
             assert actual_lines[n] == expected_lines[n]
 
         assert expected == actual
+
+
+def test_cli_freeform_copies_bib_alongside_output():
+
+    dir, _ = os.path.split(os.path.realpath(__file__))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_tex = os.path.join(tmp_dir, "out", "paper.tex")
+        bib = os.path.join(tmp_dir, "refs.bib")
+        with open(bib, "w") as file:
+            file.write("@article{a, title={A}}\n")
+
+        CLI_CMD = (
+            f"jtex freeform "
+            f"{os.path.join(dir, 'data', 'lite', 'template.tex')} "
+            f"{os.path.join(dir, 'data', 'lite', 'main.tex')} "
+            f"--output-tex {output_tex} "
+            f"--bib {bib} "
+        )
+        ret_val = subprocess.run(CLI_CMD, shell=True)
+        assert ret_val.returncode == 0
+
+        with open(os.path.join(tmp_dir, "out", "main.bib"), "r") as file:
+            assert file.read() == "@article{a, title={A}}\n"
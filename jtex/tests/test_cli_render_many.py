@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import tempfile
+
+
+def test_cli_render_many():
+    dir, _ = os.path.split(os.path.realpath(__file__))
+    content = os.path.join(dir, "data", "cn", "main.tex")
+    template = os.path.join(dir, "data", "cn", "template")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest = os.path.join(tmp_dir, "manifest.jsonl")
+        with open(manifest, "w") as file:
+            for n in range(3):
+                file.write(json.dumps(dict(content=content, output=f"out{n}")) + "\n")
+
+        CLI_CMD = f"jtex render-many {manifest} --jobs 2 --template-path {template} "
+        ret_val = subprocess.run(CLI_CMD, shell=True)
+        assert ret_val.returncode == 0
+
+        for n in range(3):
+            with open(os.path.join(tmp_dir, f"out{n}", "ms.tex"), "r") as outfile:
+                actual = outfile.read()
+            assert "\\title{Test Document}" in actual
+            assert "Lorem Abstractium" in actual
+            assert "Lorem ipsum" in actual
+
+        with open(f"{manifest}.journal", "r") as file:
+            records = [json.loads(line) for line in file]
+        assert len(records) == 3
+        assert all(r["ok"] for r in records)
+
+        # a second run resumes from the journal and renders nothing
+        ret_val = subprocess.run(CLI_CMD, shell=True, capture_output=True, text=True)
+        assert ret_val.returncode == 0
+        assert "3 already rendered" in ret_val.stdout
+        with open(f"{manifest}.journal", "r") as file:
+            assert len(file.readlines()) == 3
+
+
+def test_cli_render_many_failures():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest = os.path.join(tmp_dir, "manifest.yml")
+        with open(manifest, "w") as file:
+            file.write("- content: missing.tex\n")
+
+        ret_val = subprocess.run(f"jtex render-many {manifest}", shell=True)
+        assert ret_val.returncode == 1
+
+        with open(f"{manifest}.journal", "r") as file:
+            records = [json.loads(line) for line in file]
+        assert len(records) == 1
+        assert not records[0]["ok"]
+        assert records[0]["error"] == (
+            f"ValueError: content not found at {os.path.join(tmp_dir, 'missing.tex')}"
+        )
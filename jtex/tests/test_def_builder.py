@@ -1,2 +1,126 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from jtex.DefBuilder import DefBuilder
+from jtex.DefStore import def_store
+from jtex.TemplateOptions import TemplateOptions
+from jtex.utils import file_digest
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+@pytest.fixture(name="template_path")
+def _template_path(tmp_path):
+    path = os.path.join(tmp_path, "template")
+    shutil.copytree(TEMPLATE_PATH, path)
+    with open(os.path.join(path, "template.yml")) as file:
+        config = file.read()
+    with open(os.path.join(path, "template.yml"), "w") as file:
+        file.write(config.replace("code: highlight", "code: code.def"))
+    with open(os.path.join(path, "code.def"), "w") as file:
+        file.write("% custom code\n")
+    return path
+
+
 def test_def_build_fails():
     assert True
+
+
+def test_repeated_build_reads_no_defs(template_path, tmp_path):
+    DefBuilder().build(TemplateOptions(template_path), str(tmp_path))
+    reads = def_store.stats["reads"]
+
+    options = TemplateOptions(template_path)
+    builder = DefBuilder()
+    builder.build(options, str(tmp_path))
+    assert def_store.stats["reads"] == reads
+    with open(os.path.join(tmp_path, "curvenote.setup.def")) as file:
+        assert "% custom code" in file.read()
+
+
+def test_changed_custom_def_is_reread(template_path, tmp_path):
+    DefBuilder().build(TemplateOptions(template_path), str(tmp_path))
+    reads = def_store.stats["reads"]
+
+    def_path = os.path.join(template_path, "code.def")
+    with open(def_path, "w") as file:
+        file.write("% changed custom code\n")
+    os.utime(def_path, ns=(0, 0))
+
+    DefBuilder().build(TemplateOptions(template_path), str(tmp_path))
+    assert def_store.stats["reads"] == reads + 1
+    with open(os.path.join(tmp_path, "curvenote.setup.def")) as file:
+        assert "% changed custom code" in file.read()
+
+
+def test_reused_builder_rereads_changed_def(template_path, tmp_path):
+    options = TemplateOptions(template_path)
+    builder = DefBuilder()
+    builder.build(options, str(tmp_path))
+
+    def_path = os.path.join(template_path, "code.def")
+    with open(def_path, "w") as file:
+        file.write("% changed custom code\n")
+    os.utime(def_path, ns=(0, 0))
+
+    builder.build(options, str(tmp_path))
+    with open(os.path.join(tmp_path, "curvenote.setup.def")) as file:
+        assert "% changed custom code" in file.read()
+
+
+def test_options_resolved_once(template_path):
+    options = TemplateOptions(template_path)
+    builder = DefBuilder()
+    resolved = builder._resolve_options(options)
+    builder.compose(options)
+    builder.get_content_transforms(options)
+    assert builder._resolve_options(options) is resolved
+
+
+COMPOSE_SCRIPT = """
+import sys
+from jtex.DefBuilder import DefBuilder
+from jtex.TemplateOptions import TemplateOptions
+from jtex.utils import file_digest
+options = TemplateOptions(sys.argv[1])
+print(DefBuilder().compose(options))
+print(DefBuilder().build(options, sys.argv[2])[1])
+"""
+
+
+def test_compose_is_independent_of_hash_seed(template_path, tmp_path):
+    outputs = [
+        subprocess.run(
+            [sys.executable, "-c", COMPOSE_SCRIPT, template_path, str(tmp_path)],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in ["1", "2", "3"]
+    ]
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_compose_keeps_declaration_order(template_path):
+    passopts, packages, setup = DefBuilder().compose(TemplateOptions(template_path))
+    names = [os.path.basename(p) for p in setup]
+    assert names.index("setup-callout.def") < names.index("code.def")
+    assert len(set(packages)) == len(packages)
+
+
+def test_build_digests_match_files(template_path, tmp_path):
+    options = TemplateOptions(template_path)
+    changed, digests = DefBuilder().build(options, str(tmp_path))
+    assert sorted(changed) == sorted(os.path.join(tmp_path, f) for f in digests)
+    for name, digest in digests.items():
+        assert digest == file_digest(os.path.join(tmp_path, name))
+    assert DefBuilder().build(TemplateOptions(template_path), str(tmp_path)) == (
+        [],
+        digests,
+    )
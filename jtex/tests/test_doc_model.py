@@ -1,9 +1,11 @@
+import copy
 from typing import Optional
 
 import pytest
+from mergedeep import merge
 from pykwalify.errors import CoreError
 
-from jtex.DocModel import DocModel
+from jtex.DocModel import DEFAULTS, DocModel, resolve_layers
 
 
 @pytest.fixture(
@@ -41,3 +43,58 @@ def test_get_data():
     assert dm.get("something", Optional[str]) is None
     assert dm.get("something", str, "else") == "else"
     assert dm.get("this.key.is.not.there", str) is None
+
+
+@pytest.mark.parametrize(
+    "layers",
+    [
+        [DEFAULTS, {}],
+        [DEFAULTS, dict(title="a", jtex=dict(output=dict(path="out")))],
+        [DEFAULTS, dict(jtex=dict(output=None, options=dict(a=[1, 2])))],
+        [DEFAULTS, dict(jtex=dict(input=dict(tagged=dict(abstract="a.tex"))))],
+        [
+            DEFAULTS,
+            dict(authors=[dict(name="a")], jtex=dict(version=2)),
+            dict(authors=[dict(name="b")], jtex=dict(output=dict(filename="x.tex"))),
+        ],
+    ],
+)
+def test_resolve_matches_deep_merge(layers):
+    merged = copy.deepcopy(layers[0])
+    for layer in layers[1:]:
+        merge(merged, copy.deepcopy(layer))
+    assert resolve_layers(layers, copy_base=True) == merged
+
+
+def test_layers_are_shared_not_modified():
+    defaults = copy.deepcopy(DEFAULTS)
+    authors = [dict(name=f"Author {idx}") for idx in range(1000)]
+    fm = dict(authors=authors, jtex=dict(output=dict(path="out")))
+    fm_before = copy.deepcopy(fm)
+
+    first = DocModel(fm)
+    second = DocModel(dict(title="b"))
+    assert first.get("authors") is authors
+    assert first.get("jtex.output.path") == "out"
+    assert second.get("jtex.output.path") == "_build"
+
+    # models do not share the defaults with each other or DEFAULTS itself
+    first.get("jtex.options")["a"] = 1
+    second.to_dict()["jtex"]["output"]["path"] = "changed"
+    assert DEFAULTS == defaults
+    assert fm == fm_before
+    assert DocModel({}).get("jtex.options") == {}
+    assert DocModel({}).get("jtex.output.path") == "_build"
+
+
+def test_overrides():
+    fm = dict(title="a", jtex=dict(output=dict(path="out")))
+    docmodel = DocModel(fm, overrides=dict(jtex=dict(output=dict(filename="b.tex"))))
+    assert docmodel.get("jtex.output.path") == "out"
+    assert docmodel.get("jtex.output.filename") == "b.tex"
+    assert docmodel.get("jtex.output.copy_images") is True
+
+    overridden = docmodel.with_overrides(dict(title="b"))
+    assert overridden.get("title") == "b"
+    assert overridden.get("jtex.output.filename") == "b.tex"
+    assert docmodel.get("title") == "a"
@@ -0,0 +1,150 @@
+import hashlib
+import os
+
+import pytest
+import requests
+from conftest import StubResponse
+
+from jtex.Downloader import Downloader, chunk_size_for
+
+DATA = os.urandom(300 * 1024)
+
+
+class RangedFile:
+    """
+    Serves DATA with Range and If-Range support, optionally dropping the
+    connection part way through the first responses
+    """
+
+    def __init__(self):
+        self.data = DATA
+        self.etag = '"v1"'
+        self.cut_after = None
+        self.cuts = 0
+
+    def __call__(self, headers) -> StubResponse:
+        start = 0
+        range_header = headers.get("Range")
+        if_range = headers.get("If-Range")
+        if range_header and (if_range is None or if_range == self.etag):
+            start = int(range_header[len("bytes=") :].split("-")[0])
+        response_headers = {"ETag": self.etag}
+        if start:
+            end = len(self.data) - 1
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{len(self.data)}"
+        cut_after = None
+        if self.cuts > 0:
+            self.cuts -= 1
+            cut_after = self.cut_after
+        return StubResponse(
+            206 if start else 200,
+            self.data[start:],
+            response_headers,
+            cut_after=cut_after,
+        )
+
+
+@pytest.fixture(name="server")
+def _server(http_server):
+    server = RangedFile()
+    http_server.routes["/file"] = server
+    http_server.routes["/info"] = lambda _: StubResponse.json(dict(link="/file"))
+    server.url = http_server.url("/file")
+    server.http = http_server
+    return server
+
+
+def test_download_with_checksum_and_progress(server, tmp_path):
+    save_path = str(tmp_path / "file.zip")
+    progress = []
+    result = Downloader().download(
+        server.url,
+        save_path,
+        sha256=hashlib.sha256(DATA).hexdigest(),
+        progress=lambda received, total: progress.append((received, total)),
+    )
+    with open(save_path, "rb") as file:
+        assert file.read() == DATA
+    assert result.status == 200
+    assert result.size == len(DATA)
+    assert progress[-1] == (len(DATA), len(DATA))
+    assert len(progress) == len(DATA) // chunk_size_for(len(DATA)) + 1
+    assert not os.path.exists(f"{save_path}.part")
+
+
+def test_checksum_mismatch(server, tmp_path):
+    save_path = str(tmp_path / "file.zip")
+    with pytest.raises(ValueError):
+        Downloader().download(server.url, save_path, sha256="0" * 64)
+    assert os.listdir(tmp_path) == []
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    server.cut_after = 100 * 1024
+    server.cuts = 2
+    save_path = str(tmp_path / "file.zip")
+    downloader = Downloader()
+    result = downloader.download(
+        server.url, save_path, sha256=hashlib.sha256(DATA).hexdigest()
+    )
+    # whatever arrived before each cut is kept, up to the last whole chunk
+    ranges = [headers.get("Range") for _, headers in server.http.requests]
+    assert len(ranges) == 3 and ranges[0] is None
+    assert ranges[2] == f"bytes={result.resumed_from}-"
+    assert result.resumed_from > 0
+    assert downloader.stats["resumed"] == 2
+    assert downloader.stats["bytes"] == len(DATA)
+
+
+def test_partial_download_from_earlier_run(server, tmp_path):
+    server.cut_after = 100 * 1024
+    server.cuts = 1
+    save_path = str(tmp_path / "file.zip")
+    with pytest.raises(requests.exceptions.RequestException):
+        Downloader(retries=0).download(server.url, save_path)
+    partial = os.path.getsize(f"{save_path}.part")
+    assert partial > 0
+
+    result = Downloader().download(server.url, save_path)
+    assert result.resumed_from == partial
+    with open(save_path, "rb") as file:
+        assert file.read() == DATA
+
+
+def test_retries_made_once_per_attempt(server, tmp_path):
+    server.cut_after = 100 * 1024
+    server.cuts = 3
+    downloader = Downloader(retries=2)
+    assert downloader.session.get_adapter(server.url).max_retries.total == 0
+    with pytest.raises(requests.exceptions.RequestException):
+        downloader.download(server.url, str(tmp_path / "file.zip"))
+    assert len(server.http.requests) == 3
+
+
+def test_changed_file_starts_over(server, tmp_path):
+    server.cut_after = 100 * 1024
+    server.cuts = 1
+    save_path = str(tmp_path / "file.zip")
+    with pytest.raises(requests.exceptions.RequestException):
+        Downloader(retries=0).download(server.url, save_path)
+
+    server.data = DATA[::-1]
+    server.etag = '"v2"'
+    result = Downloader().download(server.url, save_path)
+    assert result.resumed_from == 0
+    with open(save_path, "rb") as file:
+        assert file.read() == DATA[::-1]
+
+
+def test_session_reuses_connections(server, tmp_path):
+    downloader = Downloader()
+    for idx in range(3):
+        assert downloader.get_json(server.http.url("/info")) == dict(link="/file")
+        downloader.download(server.url, str(tmp_path / f"file{idx}.zip"))
+    assert len(server.http.requests) == 6
+    assert len(server.http.connections) == 1
+
+
+def test_get_json_checks_status(server):
+    with pytest.raises(requests.exceptions.HTTPError):
+        Downloader().get_json(server.http.url("/missing"))
@@ -0,0 +1,109 @@
+import io
+import os
+import tempfile
+import zipfile
+
+import pytest
+
+from jtex.DocModel import DocModel
+from jtex.FileSystem import DiskFileSystem, MemoryFileSystem, ZipFileSystem
+from jtex.LatexBuilder import LatexBuilder
+from jtex.TemplateLoader import TemplateLoader
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+class Unseekable(io.RawIOBase):
+    """
+    A write only stream, like a socket or an HTTP response
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def build(fs, template_path=None):
+    loader = TemplateLoader("", fs=fs)
+    if template_path is None:
+        options, renderer = loader.initialise_with_builtin_template()
+    else:
+        options, renderer = loader.initialise_from_path(template_path)
+    builder = LatexBuilder(options, renderer, "", fs=fs)
+    docmodel = DocModel(dict(title="A Title", jtex=dict(input=dict())))
+    builder.build(
+        docmodel,
+        ["Some \\citep{abc} content\n"],
+        {},
+        bibtex="@article{abc}",
+        raise_if_invalid=False,
+        stream=True,
+    )
+    return builder
+
+
+@pytest.mark.parametrize("template_path", [None, TEMPLATE_PATH])
+def test_build_in_memory(template_path):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            fs = MemoryFileSystem()
+            builder = build(fs, template_path)
+            assert os.listdir(tmp_dir) == []
+        finally:
+            os.chdir(cwd)
+
+    assert "main.tex" in fs.files
+    assert "curvenote.def" in fs.files
+    assert fs.files["main.bib"] == b"@article{abc}"
+    assert "template.tex" not in fs.files
+    assert "template.yml" not in fs.files
+    assert "Some \\cite{abc} content" in fs.files["main.tex"].decode()
+    assert sorted(builder.changed_files) == sorted(
+        f for f in fs.files if f.endswith((".tex", ".def", ".bib"))
+    )
+
+    assert build(fs, template_path).changed_files == []
+
+
+def test_build_to_zip_stream():
+    stream = Unseekable()
+    with ZipFileSystem(stream) as fs:
+        build(fs)
+        with pytest.raises(ValueError):
+            fs.write("main.tex", b"")
+
+    with zipfile.ZipFile(io.BytesIO(stream.buffer.getvalue())) as archive:
+        names = archive.namelist()
+        main = archive.read("main.tex").decode()
+    assert set(names) >= {"main.tex", "main.bib", "curvenote.def", "curvenote.png"}
+    assert "template.yml" not in names
+    assert "\\input{curvenote.def}" in main
+
+
+def test_disk_copy_detects_same_size_changes(tmp_path):
+    src, dst = str(tmp_path / "a.png"), str(tmp_path / "b.png")
+    with open(src, "wb") as file:
+        file.write(b"one")
+    fs = DiskFileSystem()
+    assert fs.copy_file(src, dst)
+    assert not fs.copy_file(src, dst)
+
+    # a same sized change with an older mtime, as restored from an archive
+    with open(src, "wb") as file:
+        file.write(b"two")
+    os.utime(src, ns=(0, 0))
+    assert fs.copy_file(src, dst)
+    with open(dst, "rb") as file:
+        assert file.read() == b"two"
+
+    # equal content is left alone whatever the mtimes
+    os.utime(src, ns=(10**9, 10**9))
+    assert not fs.copy_file(src, dst)
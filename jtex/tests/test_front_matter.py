@@ -1,6 +1,10 @@
+import datetime
+
 import pytest
+import yaml
 
-from jtex.utils import parse_front_matter, stringify_front_matter
+from jtex import utils
+from jtex.utils import parse_front_matter, read_front_matter, stringify_front_matter
 
 CONTENT_NO_FM = r"""
 %% https://curvenote.com/oxa:RkW3EUemHJbWfgejvqYu/j4p2ktrUnpNLTYJxNZAq.5
@@ -92,3 +96,69 @@ def test_stringify_front_matter():
     assert fm.index("%   input:\n") > -1
     assert fm.index("%   version: 33\n") > -1
     assert fm.index("%     name: something\n") > -1
+
+
+@pytest.fixture(
+    params=[
+        dict(title="The Title", authors=[dict(name="Jane Smith", email="j@x.org")]),
+        dict(title="A long title " * 20, tags=["a", "b"], date=dict(year=2022)),
+        dict(authors=[dict(name="Zoë Müller"), dict(name="山田 太郎")]),
+        dict(title="Ünïcødé " * 20, abstract="two\tcolumns", empty={}, none=None),
+        dict(nested=dict(deeper=dict(key="é" * 12, when=datetime.date(2022, 1, 2)))),
+        {"key é": 1, 2: [1.5, True, "\t tab"], "x" * 70: "ü" * 10},
+    ],
+    name="front_matter",
+)
+def _front_matter(request):
+    return request.param
+
+
+def test_libyaml_output_is_identical(front_matter):
+    assert utils.dump_yaml(front_matter) == yaml.dump(front_matter)
+    text = yaml.dump(front_matter)
+    assert utils.load_yaml(text) == yaml.load(text, Loader=yaml.FullLoader)
+
+
+def test_without_libyaml(front_matter, monkeypatch):
+    text = stringify_front_matter(front_matter) + "content\n"
+    monkeypatch.setattr(utils, "CFullLoader", None)
+    monkeypatch.setattr(utils, "CDumper", None)
+    assert stringify_front_matter(front_matter) + "content\n" == text
+    assert parse_front_matter(text) == (front_matter, "content\n")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        CONTENT_NO_FM,
+        FM_NO_CONTENT,
+        FM_AND_CONTENT,
+        FM_AND_CONTENT.replace("\n", "\r\n"),
+        FM_NO_CONTENT.rstrip("\n"),
+        "before\n% ---\n% title: a\n% ---\nbody\n% ---\nmore",
+        "% ---\n% title: a\nno closing delimiter\n",
+        "% ---\n% title: a\n% note: x % --- y\n",
+        "a % --- b % --- c\n",
+        "% ---\n% title: Zoë\n% ---",
+    ],
+)
+def test_read_front_matter_matches_parse(text, tmp_path):
+    path = tmp_path / "content.tex"
+    path.write_bytes(text.encode("utf-8"))
+    with open(path) as file:
+        expected = parse_front_matter(file.read())
+
+    front_matter, body = read_front_matter(str(path))
+    assert (front_matter, body.read()) == expected
+
+
+def test_read_front_matter_stops_at_delimiter(tmp_path):
+    path = tmp_path / "content.tex"
+    path.write_text(FM_AND_CONTENT + "x" * 1000000)
+    front_matter, body = read_front_matter(str(path))
+    assert front_matter["title"] == "The Title"
+    with open(path) as file:
+        file.seek(body.offset)
+        assert file.read() == body.read()
+    assert body.read().endswith("x" * 1000000)
@@ -0,0 +1,335 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from jtex.DocModel import DocModel
+from jtex.FileSystem import MemoryFileSystem
+from jtex.LatexBuilder import (
+    STREAM_BLOCK_SIZE,
+    LatexBuilder,
+    split_blocks,
+    transform_stream,
+)
+from jtex.options.NatbibSchemaOption import citep_transform
+from jtex.TemplateLoader import TemplateLoader
+from jtex.utils import file_digest
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+@pytest.fixture(
+    params=[
+        [],
+        ["a\\citep{x}\n"],
+        ["a\\ci", "tep{x} b\\citep", "{y}\n", "no newline"],
+        ["\n", "\\citep{", "\n\\citep{z}"],
+    ],
+    name="pieces",
+)
+def _pieces(request):
+    return request.param
+
+
+def test_transform_stream(pieces):
+    streamed = "".join(transform_stream(iter(pieces), [citep_transform]))
+    assert streamed == citep_transform("".join(pieces))
+
+
+@pytest.mark.parametrize("block_size", [1, 4, 8, 1000])
+def test_transform_stream_in_blocks(pieces, block_size):
+    streamed = "".join(
+        transform_stream(iter(pieces), [citep_transform], block_size=block_size)
+    )
+    assert streamed == citep_transform("".join(pieces))
+
+
+def test_split_blocks():
+    assert list(split_blocks("ab\ncd\nef\n", 6)) == ["ab\ncd\n", "ef\n"]
+    assert list(split_blocks("abcdefgh\nij", 4)) == ["abcdefgh\n", "ij"]
+    assert list(split_blocks("abcdefgh", 4)) == ["abcdefgh"]
+    assert list(split_blocks("ab", 4)) == ["ab"]
+
+
+class RecordingFileSystem(MemoryFileSystem):
+    """
+    Records the length of each write to a streamed output
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def open_writer(self, path: str, buffering: int = -1):
+        writer = super().open_writer(path, buffering)
+        write = writer.write
+
+        def record(text: str):
+            self.writes.append(len(text))
+            write(text)
+
+        writer.write = record
+        return writer
+
+
+def test_large_content_is_written_in_blocks(tmp_path):
+    target = str(tmp_path / "out")
+    fs = RecordingFileSystem()
+    options, renderer = TemplateLoader(target, fs=fs).initialise_from_path(
+        TEMPLATE_PATH
+    )
+    line = "Some \\citep{abc} content in a long document\n"
+    content = line * (20 * STREAM_BLOCK_SIZE // len(line))
+    builder = LatexBuilder(options, renderer, target, fs=fs)
+    builder.build(
+        DocModel(dict(title="A Title")),
+        [content],
+        {},
+        raise_if_invalid=False,
+        stream=True,
+    )
+
+    assert max(fs.writes) <= STREAM_BLOCK_SIZE
+    assert len(fs.writes) >= 20
+    main = fs.read(os.path.join(target, "main.tex")).decode("utf-8")
+    assert main.count("\\cite{abc}") == content.count("\n")
+
+
+def build(tmp_dir: str, stream: bool):
+    target = os.path.join(tmp_dir, "stream" if stream else "string")
+    options, renderer = TemplateLoader(target).initialise_from_path(TEMPLATE_PATH)
+    builder = LatexBuilder(options, renderer, target)
+    docmodel = DocModel(dict(title="A Title", authors=[dict(name="Curve Note")]))
+    builder.build(
+        docmodel,
+        ["Some \\citep{abc} content\n"],
+        {},
+        raise_if_invalid=False,
+        stream=stream,
+    )
+    with open(os.path.join(target, "main.tex")) as file:
+        return file.read()
+
+
+def test_stream_matches_string_build():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        streamed = build(tmp_dir, stream=True)
+        assert streamed == build(tmp_dir, stream=False)
+        assert "\\title{A Title}" in streamed
+        assert "Some \\cite{abc} content" in streamed
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_undefined_summary_per_build(tmp_path, stream):
+    target = str(tmp_path / "out")
+    options, renderer = TemplateLoader(target).initialise_from_path(TEMPLATE_PATH)
+    builders = [LatexBuilder(options, renderer, target) for _ in range(2)]
+    builders[0].build(
+        DocModel(dict(title="A Title")),
+        ["a"],
+        {},
+        raise_if_invalid=False,
+        stream=stream,
+    )
+    builders[1].build(
+        DocModel(dict(title="A Title", authors=[dict(name="Curve Note")])),
+        ["b"],
+        {},
+        raise_if_invalid=False,
+        stream=stream,
+    )
+    assert builders[0].undefined_summary == dict(date=3, authors=1)
+    assert builders[1].undefined_summary == dict(date=3)
+
+
+def build_into(target: str, content: str, stream: bool = True) -> LatexBuilder:
+    options, renderer = TemplateLoader(target).initialise_from_path(TEMPLATE_PATH)
+    builder = LatexBuilder(options, renderer, target)
+    docmodel = DocModel(dict(title="A Title", authors=[dict(name="Curve Note")]))
+    builder.build(docmodel, [content], {}, raise_if_invalid=False, stream=stream)
+    return builder
+
+
+def mtimes(folder: str):
+    return {
+        os.path.join(root, f): os.stat(os.path.join(root, f)).st_mtime_ns
+        for root, _, files in os.walk(folder)
+        for f in files
+    }
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_rebuild_leaves_unchanged_outputs(stream):
+    with tempfile.TemporaryDirectory() as target:
+        first = build_into(target, "Some content\n", stream)
+        assert os.path.join(target, "main.tex") in first.changed_files
+        assert os.path.join(target, "curvenote.def") in first.changed_files
+        before = mtimes(target)
+
+        second = build_into(target, "Some content\n", stream)
+        assert second.changed_files == []
+        assert mtimes(target) == before
+        assert not any(f.endswith(".jtex-tmp") for f in os.listdir(target))
+
+        third = build_into(target, "Other content\n", stream)
+        assert third.changed_files == [os.path.join(target, "main.tex")]
+        with open(os.path.join(target, "main.tex")) as file:
+            assert "Other content" in file.read()
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_output_digests_are_stable(stream):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first = build_into(os.path.join(tmp_dir, "a"), "Some content\n", stream)
+        second = build_into(os.path.join(tmp_dir, "b"), "Some content\n", stream)
+        for path, digest in first.output_digests.items():
+            assert digest == file_digest(path)
+        assert first.build_digest == second.build_digest
+
+        third = build_into(os.path.join(tmp_dir, "a"), "Other content\n", stream)
+        assert third.build_digest != first.build_digest
+
+
+@pytest.fixture(name="book_template")
+def _book_template():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template = os.path.join(tmp_dir, "book")
+        shutil.copytree(TEMPLATE_PATH, template)
+        template_yml = os.path.join(template, "template.yml")
+        with open(template_yml) as file:
+            config = file.read()
+        with open(template_yml, "w") as file:
+            file.write(config.replace("layout: compact", "layout: book"))
+        yield template
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_book_layout_writes_chapters(book_template, jobs):
+    with tempfile.TemporaryDirectory() as target:
+        options, renderer = TemplateLoader(target).initialise_from_path(book_template)
+        docmodel = DocModel(dict(title="A Book"))
+        chapters = [
+            f"\\chapter{{{n}}} \\citep{{{n}}}\n" for n in ["one", "two", "three"]
+        ]
+
+        builder = LatexBuilder(options, renderer, target, jobs=jobs)
+        builder.build(docmodel, chapters, {}, raise_if_invalid=False, stream=True)
+
+        with open(os.path.join(target, "main.tex")) as file:
+            main = file.read()
+        assert "\\include{main-chapter-01}\n\\include{main-chapter-02}" in main
+        assert "\\chapter" not in main
+        with open(os.path.join(target, "main-chapter-03.tex")) as file:
+            assert file.read() == "\\chapter{three} \\cite{three}\n\n"
+
+        builder = LatexBuilder(options, renderer, target, jobs=jobs)
+        builder.build(docmodel, chapters[:2], {}, raise_if_invalid=False)
+        assert not os.path.exists(os.path.join(target, "main-chapter-03.tex"))
+        assert os.path.join(target, "main-chapter-01.tex") not in builder.changed_files
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_single_file_inlines_defs_and_inputs(stream):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target = os.path.join(tmp_dir, "out")
+        os.makedirs(target)
+        with open(os.path.join(tmp_dir, "section.tex"), "w") as file:
+            file.write("Section text \\citep{abc}\n")
+        options, renderer = TemplateLoader(target).initialise_with_builtin_template()
+        builder = LatexBuilder(options, renderer, target, input_paths=[tmp_dir])
+        docmodel = DocModel(
+            dict(title="A Title", jtex=dict(output=dict(single_file=True)))
+        )
+        builder.build(
+            docmodel,
+            ["Before\n\\input{section}\n% \\input{section}\n\\input{missing}\n"],
+            {},
+            raise_if_invalid=False,
+            stream=stream,
+        )
+
+        assert not any(f.endswith(".def") for f in os.listdir(target))
+        with open(os.path.join(target, "main.tex")) as file:
+            main = file.read()
+        assert "\\input{curvenote.def}" not in main
+        assert "% Pass Options Section" in main
+        assert "% Setup Section" in main
+        assert "Before\nSection text \\cite{abc}\n% \\input{section}\n" in main
+        assert "\\input{missing}" in main
+        assert builder.unresolved_inputs == ["missing"]
+
+
+def test_single_file_inlines_includes(tmp_path, caplog):
+    target = str(tmp_path / "out")
+    os.makedirs(target)
+    (tmp_path / "chapter.tex").write_text(
+        "Chapter text \\citep{abc}\n\\input{nested}\n"
+    )
+    (tmp_path / "nested.tex").write_text("Nested \\citep{def}\n")
+    options, renderer = TemplateLoader(target).initialise_with_builtin_template()
+    builder = LatexBuilder(options, renderer, target, input_paths=[str(tmp_path)])
+    docmodel = DocModel(dict(title="A Title", jtex=dict(output=dict(single_file=True))))
+    builder.build(
+        docmodel,
+        ["Before\n\\include{chapter}\n\\input{missing}\n"],
+        {},
+        raise_if_invalid=False,
+    )
+
+    with open(os.path.join(target, "main.tex")) as file:
+        main = file.read()
+    assert (
+        "Before\n\\clearpage\nChapter text \\cite{abc}\nNested \\cite{def}\n"
+        "\\clearpage\n\\input{missing}\n"
+    ) in main
+    assert builder.unresolved_inputs == ["missing"]
+    assert "Could not find \\input{missing} to inline" in caplog.text
+
+
+def test_single_file_keeps_book_chapters(book_template, tmp_path):
+    target = str(tmp_path / "out")
+    options, renderer = TemplateLoader(target).initialise_from_path(book_template)
+    docmodel = DocModel(dict(title="A Book", jtex=dict(output=dict(single_file=True))))
+    builder = LatexBuilder(options, renderer, target)
+    builder.build(
+        docmodel,
+        ["\\chapter{one}\n", "\\chapter{two}\n"],
+        {},
+        raise_if_invalid=False,
+        stream=True,
+    )
+
+    assert not any("chapter" in f for f in os.listdir(target))
+    with open(os.path.join(target, "main.tex")) as file:
+        main = file.read()
+    assert (
+        "\\clearpage\n\\chapter{one}\n\\clearpage\n"
+        "\\clearpage\n\\chapter{two}\n\\clearpage"
+    ) in main
+
+
+def test_single_file_removes_inlined_template_inputs(tmp_path):
+    template = str(tmp_path / "template")
+    shutil.copytree(TEMPLATE_PATH, template)
+    with open(os.path.join(template, "template.tex")) as file:
+        source = file.read()
+    with open(os.path.join(template, "template.tex"), "w") as file:
+        file.write(source.replace("[-CONTENT-]", "[-CONTENT-]\n\\input{appendix}"))
+    with open(os.path.join(template, "appendix.tex"), "w") as file:
+        file.write("Appendix text\n")
+    with open(os.path.join(template, "logo.png"), "wb") as file:
+        file.write(b"png")
+
+    target = str(tmp_path / "out")
+    options, renderer = TemplateLoader(target).initialise_from_path(template)
+    assert os.path.exists(os.path.join(target, "appendix.tex"))
+    docmodel = DocModel(dict(title="A Title", jtex=dict(output=dict(single_file=True))))
+    LatexBuilder(options, renderer, target).build(
+        docmodel, ["Some content\n"], {}, raise_if_invalid=False
+    )
+
+    assert sorted(os.listdir(target)) == ["logo.png", "main.tex"]
+    with open(os.path.join(target, "main.tex")) as file:
+        assert "Some content\n\nAppendix text\n" in file.read()
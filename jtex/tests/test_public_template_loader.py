@@ -0,0 +1,93 @@
+import importlib
+import threading
+import time
+
+import pytest
+import typer
+from conftest import StubResponse, StubServer
+
+from jtex.PublicTemplateLoader import PublicTemplateLoader
+
+loader_module = importlib.import_module("jtex.PublicTemplateLoader")
+
+NEW_PATH = "/templates/tex/public/cn/download"
+OLD_PATH = "/templates/cn/download"
+
+
+def answer(api: StubServer, path: str, data: dict, delay: float = 0):
+    api.routes[path] = lambda _: StubResponse.json(data, delay=delay)
+
+
+@pytest.fixture(name="api")
+def _api(monkeypatch, http_server):
+    monkeypatch.delenv("JTEX_NO_CACHE", raising=False)
+    monkeypatch.setattr(loader_module, "API_URL", http_server.base_url)
+    return http_server
+
+
+def lookup(tmp_path, timeout: float = 5) -> str:
+    loader = PublicTemplateLoader(str(tmp_path / "out"), lookup_timeout=timeout)
+    return loader._lookup_link("cn")
+
+
+def wait_until(condition, timeout: float = 5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_first_link_wins(api, tmp_path):
+    answer(api, NEW_PATH, dict(link="new"), delay=1)
+    answer(api, OLD_PATH, dict(link="old"))
+    start = time.time()
+    assert lookup(tmp_path) == "old"
+    assert time.time() - start < 1
+    # the new endpoint answered too, so cn is not legacy only
+    assert wait_until(lambda: len(api.requests) == 2)
+    time.sleep(1.1)
+    assert loader_module.read_legacy_names() == {}
+
+
+def test_legacy_names_are_remembered(api, tmp_path):
+    answer(api, OLD_PATH, dict(link="old"))
+    assert lookup(tmp_path) == "old"
+    assert wait_until(lambda: loader_module.is_legacy("cn"))
+
+    api.requests.clear()
+    assert lookup(tmp_path) == "old"
+    assert api.paths() == [OLD_PATH]
+
+
+def test_legacy_names_are_forgotten(api, tmp_path):
+    loader_module.remember_legacy("cn", True)
+    answer(api, NEW_PATH, dict(link="new"))
+    assert lookup(tmp_path) == "new"
+    assert api.paths()[0] == OLD_PATH
+    assert wait_until(lambda: not loader_module.is_legacy("cn"))
+
+
+def test_not_found(api, tmp_path):
+    answer(api, NEW_PATH, dict())
+    with pytest.raises(typer.Exit):
+        lookup(tmp_path)
+
+
+def test_lookup_errors(api, tmp_path):
+    with pytest.raises(ValueError):
+        lookup(tmp_path)
+
+    answer(api, NEW_PATH, dict(link="new"), delay=1)
+    answer(api, OLD_PATH, dict(link="old"), delay=1)
+    start = time.time()
+    with pytest.raises(ValueError):
+        lookup(tmp_path, timeout=0.2)
+    assert time.time() - start < 1
+
+
+def test_slow_lookups_do_not_hold_up_exit(api, tmp_path):
+    answer(api, NEW_PATH, dict(link="new"), delay=1)
+    answer(api, OLD_PATH, dict(link="old"))
+    assert lookup(tmp_path) == "old"
+    running = [t for t in threading.enumerate() if t.name == "jtex-lookup"]
+    assert running and all(t.daemon for t in running)
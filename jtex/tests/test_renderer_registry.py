@@ -0,0 +1,66 @@
+import tempfile
+from os import path
+
+from jtex.RendererRegistry import RendererRegistry
+from jtex.TemplateLoader import TemplateLoader
+from jtex.TemplateRenderer import TemplateRenderer
+
+
+def write_template(folder: str, contents: str):
+    with open(path.join(folder, "template.tex"), "w") as file:
+        file.write(contents)
+
+
+def test_folder_renderer_reused():
+    registry = RendererRegistry()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_template(tmp, "A [-x-]")
+        first = registry.get_folder(tmp)
+        second = registry.get_folder(tmp)
+        assert first is second
+        assert registry.stats["hits"] == 1
+        assert registry.stats["misses"] == 1
+        assert second.render(dict(x=1), "") == "A 1"
+
+
+def test_folder_renderer_follows_content():
+    registry = RendererRegistry()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_template(tmp, "A [-x-]")
+        first = registry.get_folder(tmp)
+        write_template(tmp, "B [-x-]")
+        second = registry.get_folder(tmp)
+        assert first is not second
+        assert second.render(dict(x=1), "") == "B 1"
+
+
+def test_invalidate():
+    registry = RendererRegistry()
+    key = ("test",)
+    first = registry.get(key, TemplateRenderer)
+    registry.invalidate(key)
+    assert key not in registry
+    assert registry.get(key, TemplateRenderer) is not first
+
+    registry.invalidate()
+    assert len(registry) == 0
+
+
+def test_max_size():
+    registry = RendererRegistry(max_size=2)
+    renderers = [registry.get((n,), TemplateRenderer) for n in range(3)]
+    assert len(registry) == 2
+    assert (0,) not in registry
+    assert registry.get((2,), TemplateRenderer) is renderers[2]
+
+
+def test_loader_uses_registry():
+    registry = RendererRegistry()
+    with tempfile.TemporaryDirectory() as tmp:
+        _, first = TemplateLoader(
+            path.join(tmp, "a"), registry
+        ).initialise_with_builtin_template()
+        _, second = TemplateLoader(
+            path.join(tmp, "b"), registry
+        ).initialise_with_builtin_template()
+        assert first is second
@@ -0,0 +1,87 @@
+import copy
+import os
+
+import pytest
+from mergedeep import merge
+from pykwalify.core import Core
+from pykwalify.errors import SchemaError
+
+from jtex.DocModel import DEFAULTS, FRONTMATTER_SCHEMA, DocModel
+from jtex.SchemaValidator import SchemaValidator, get_validator
+from jtex.TemplateOptions import SCHEMA_PATH
+
+
+@pytest.fixture(
+    params=[
+        {},
+        dict(title=None, authors=[], tags=[], date={}),
+        dict(authors=[{}, dict(name="a", is_corresponding=True)]),
+        dict(title=1),
+        dict(title="x", authors=[dict(name=1, foo=2), "x", None]),
+        dict(authors="x"),
+        dict(authors=dict(name="a")),
+        dict(date=dict(year="x", month=True, day=1.5)),
+        dict(date=dict(year="2021", month="1e2")),
+        dict(date=None),
+        dict(tags=[1, None, b"x", ["y"]]),
+        dict(unknown=1),
+        dict(
+            jtex=dict(
+                version=1,
+                strict="no",
+                input=dict(tagged="x", chapters="a.tex", other=1),
+                output=dict(),
+                options=None,
+            )
+        ),
+        dict(jtex=dict(version=1, input=None, output=[], options={})),
+        dict(jtex=dict(version=1)),
+        dict(jtex=None),
+    ],
+    name="front_matter",
+)
+def _front_matter(request):
+    return request.param
+
+
+def with_defaults(data):
+    return merge(copy.deepcopy(DEFAULTS), data)
+
+
+def pykwalify_errors(data):
+    core = Core(source_data=data, schema_files=[FRONTMATTER_SCHEMA])
+    core.validate(raise_exception=False)
+    return core.validation_errors
+
+
+@pytest.mark.parametrize("ensure_defaults", [True, False])
+def test_errors_match_pykwalify(front_matter, ensure_defaults):
+    data = with_defaults(front_matter) if ensure_defaults else front_matter
+    validator = get_validator(FRONTMATTER_SCHEMA)
+    assert validator is not None
+    assert validator.errors(data) == pykwalify_errors(data)
+
+
+def test_exception_matches_pykwalify(front_matter):
+    data = with_defaults(front_matter)
+    try:
+        Core(source_data=data, schema_files=[FRONTMATTER_SCHEMA]).validate()
+        expected = None
+    except SchemaError as err:
+        expected = err.msg
+    try:
+        DocModel(front_matter)
+        raised = None
+    except SchemaError as err:
+        raised = err.msg
+    assert raised == expected
+
+
+def test_unsupported_schema_is_not_compiled():
+    with pytest.raises(ValueError):
+        SchemaValidator(dict(type="str", pattern="^a"))
+    with pytest.raises(ValueError):
+        SchemaValidator(dict(map={"regex;(a.*)": dict(type="str")}))
+    assert get_validator(os.path.join(SCHEMA_PATH, "frontmatter.schema.yml")) is (
+        get_validator(FRONTMATTER_SCHEMA)
+    )
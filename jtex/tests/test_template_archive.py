@@ -0,0 +1,186 @@
+import importlib
+import os
+import shutil
+import zipfile
+
+import pytest
+
+from jtex.BatchBuilder import BatchBuilder, BatchItem
+from jtex.DefStore import def_store
+from jtex.DocModel import DocModel
+from jtex.FileSystem import DiskFileSystem, MemoryFileSystem
+from jtex.LatexBuilder import LatexBuilder
+from jtex.PublicTemplateLoader import PublicTemplateLoader
+from jtex.TemplateArchive import get_archive, split_archive_path
+from jtex.TemplateLoader import TEMPLATE_ONLY_FILES, TemplateLoader
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+def write_archive(archive_path: str, code_def: str):
+    """
+    Zip the cn template with a custom code def and an asset
+    """
+    with open(os.path.join(TEMPLATE_PATH, "template.yml")) as file:
+        config = file.read().replace("code: highlight", "code: code.def")
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.write(os.path.join(TEMPLATE_PATH, "template.tex"), "template.tex")
+        zip_file.writestr("template.yml", config)
+        zip_file.writestr("code.def", code_def)
+        zip_file.writestr("styles/cn.sty", "% style\n")
+
+
+@pytest.fixture(name="archive_path")
+def _archive_path(tmp_path):
+    archive_path = str(tmp_path / "cn.zip")
+    write_archive(archive_path, "% custom code\n")
+    return archive_path
+
+
+def build(target: str, archive_path: str, fs=None) -> LatexBuilder:
+    options, renderer = TemplateLoader(target, fs=fs).initialise_from_path(archive_path)
+    builder = LatexBuilder(options, renderer, target, fs=fs)
+    docmodel = DocModel(dict(title="A Title", authors=[dict(name="Curve Note")]))
+    builder.build(docmodel, ["Some content\n"], {}, raise_if_invalid=False)
+    return builder
+
+
+def test_split_archive_path(archive_path):
+    assert split_archive_path(os.path.join(archive_path, "code.def")) == (
+        archive_path,
+        "code.def",
+    )
+    assert split_archive_path(os.path.join(archive_path, "styles", "cn.sty")) == (
+        archive_path,
+        "styles/cn.sty",
+    )
+    assert split_archive_path(archive_path) is None
+    assert split_archive_path(os.path.join(TEMPLATE_PATH, "template.tex")) is None
+
+
+def test_build_from_archive(archive_path, tmp_path):
+    target = str(tmp_path / "out")
+    build(target, archive_path)
+    assert sorted(os.listdir(target)) == [
+        "code.def",
+        "curvenote.def",
+        "curvenote.packages.def",
+        "curvenote.passopts.def",
+        "curvenote.setup.def",
+        "main.tex",
+        "styles",
+    ]
+    with open(os.path.join(target, "main.tex")) as file:
+        assert "\\title{A Title}" in file.read()
+    with open(os.path.join(target, "curvenote.setup.def")) as file:
+        assert "% custom code" in file.read()
+
+
+def test_unchanged_assets_are_not_extracted_again(archive_path, tmp_path):
+    target = str(tmp_path / "out")
+    build(target, archive_path)
+    archive = get_archive(archive_path)
+    fs = DiskFileSystem()
+    assert archive.extract(target, fs, exclude=TEMPLATE_ONLY_FILES) == []
+
+    with open(os.path.join(target, "styles", "cn.sty"), "w") as file:
+        file.write("% edited\n")
+    assert archive.extract(target, fs, exclude=TEMPLATE_ONLY_FILES) == [
+        os.path.join(target, "styles", "cn.sty")
+    ]
+
+
+def test_build_matches_folder_build(archive_path, tmp_path):
+    folder = str(tmp_path / "folder")
+    with zipfile.ZipFile(archive_path) as zip_file:
+        zip_file.extractall(folder)
+    from_folder = build(str(tmp_path / "a"), folder, fs=MemoryFileSystem())
+    from_archive = build(str(tmp_path / "a"), archive_path, fs=MemoryFileSystem())
+    assert from_archive.fs.files == from_folder.fs.files
+
+
+def test_changed_archive_is_reread(archive_path, tmp_path):
+    build(str(tmp_path / "out"), archive_path)
+    reads = def_store.stats["reads"]
+
+    write_archive(archive_path, "% changed custom code\n")
+    os.utime(archive_path, ns=(0, 0))
+
+    build(str(tmp_path / "out"), archive_path)
+    assert def_store.stats["reads"] == reads + 1
+    with open(tmp_path / "out" / "curvenote.setup.def") as file:
+        assert "% changed custom code" in file.read()
+
+
+def test_replaced_archive_is_closed(archive_path):
+    archive = get_archive(archive_path)
+    assert get_archive(archive_path) is archive
+
+    write_archive(archive_path, "% changed custom code\n")
+    os.utime(archive_path, ns=(0, 0))
+
+    changed = get_archive(archive_path)
+    assert changed is not archive
+    assert archive.closed
+    assert changed.read("code.def") == b"% changed custom code\n"
+
+
+def test_closed_archive_is_reopened(archive_path):
+    archive = get_archive(archive_path)
+    archive.close()
+    assert archive.read("code.def") == b"% custom code\n"
+    assert not archive.closed
+
+
+def test_public_template_used_in_place(archive_path, tmp_path, monkeypatch):
+    module = importlib.import_module("jtex.PublicTemplateLoader")
+    monkeypatch.setenv("JTEX_NO_CACHE", "1")
+    monkeypatch.setattr(PublicTemplateLoader, "_lookup_link", lambda *_: "link")
+    monkeypatch.setattr(
+        module, "download", lambda link, path: shutil.copyfile(archive_path, path)
+    )
+
+    target = str(tmp_path / "out")
+    options, renderer = PublicTemplateLoader(target).initialise_from_template_api(
+        "public/cn"
+    )
+    assert sorted(os.listdir(target)) == ["code.def", "styles"]
+    assert options.get("config.schema.code") == "code.def"
+    assert "template.tex" in renderer.list_templates()
+
+
+def test_public_template_downloads_share_a_folder(archive_path, tmp_path, monkeypatch):
+    module = importlib.import_module("jtex.PublicTemplateLoader")
+    monkeypatch.setenv("JTEX_NO_CACHE", "1")
+    monkeypatch.setattr(PublicTemplateLoader, "_lookup_link", lambda *_: "link")
+    monkeypatch.setattr(
+        module, "download", lambda link, path: shutil.copyfile(archive_path, path)
+    )
+
+    locations = set()
+    for n in range(3):
+        loader = PublicTemplateLoader(str(tmp_path / f"out{n}"))
+        loader.initialise_from_template_api("public/cn")
+        locations.add(loader.template_location)
+    assert len(locations) == 1
+    assert os.listdir(module.download_folder()) == [os.path.basename(locations.pop())]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch_build_from_archive(archive_path, tmp_path, jobs):
+    items = [
+        BatchItem(
+            DocModel(dict(title=f"Document {n}")),
+            f"Content {n}",
+            str(tmp_path / f"doc{n}"),
+        )
+        for n in range(2)
+    ]
+    with BatchBuilder(template_path=archive_path, jobs=jobs) as builder:
+        results = builder.build(items)
+    assert all(r.ok for r in results)
+    for n in range(2):
+        with open(tmp_path / f"doc{n}" / "curvenote.setup.def") as file:
+            assert "% custom code" in file.read()
+        assert os.path.exists(tmp_path / f"doc{n}" / "styles" / "cn.sty")
@@ -0,0 +1,184 @@
+import io
+import os
+import zipfile
+
+import pytest
+from conftest import StubResponse, StubServer
+
+from jtex.FileSystem import MemoryFileSystem
+from jtex.PublicTemplateLoader import PublicTemplateLoader
+from jtex.TemplateCache import FileLock, TemplateCache, get_default_template_cache
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+TEMPLATE_PATH = os.path.join(DIR, "data", "cn", "template")
+
+
+def zip_folder(folder: str, extra: str = "") -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for filename in sorted(os.listdir(folder)):
+            zip_file.write(os.path.join(folder, filename), filename)
+        if extra:
+            zip_file.writestr("extra.txt", extra)
+    return buffer.getvalue()
+
+
+class TemplateZip:
+    """
+    Serves one zip with an ETag, answering conditional requests with a 304
+    """
+
+    def __init__(self, http_server: StubServer, data: bytes):
+        self.http_server = http_server
+        self.data = data
+        self.etag = '"v1"'
+        self.url = http_server.url("/template.zip")
+        http_server.routes["/template.zip"] = self
+
+    def __call__(self, headers) -> StubResponse:
+        if headers.get("If-None-Match") == self.etag:
+            return StubResponse(304)
+        return StubResponse(200, self.data, {"ETag": self.etag})
+
+    @property
+    def requests(self):
+        return [headers for _, headers in self.http_server.requests]
+
+    def stop(self):
+        self.http_server.stop()
+
+    def update(self, data: bytes, etag: str):
+        self.data = data
+        self.etag = etag
+
+    @property
+    def downloads(self) -> int:
+        return len(self.http_server.requests)
+
+
+@pytest.fixture(name="server")
+def _server(http_server):
+    return TemplateZip(http_server, zip_folder(TEMPLATE_PATH))
+
+
+def checkout(cache: TemplateCache, server: TemplateZip, name="public/cn"):
+    with cache.checkout(name, lambda: server.url) as folder:
+        return folder, sorted(os.listdir(folder))
+
+
+def test_cached_template_is_reused(server, tmp_path):
+    cache = TemplateCache(str(tmp_path), max_age=3600)
+    folder, files = checkout(cache, server)
+    assert "template.tex" in files
+    assert server.downloads == 1
+
+    assert checkout(cache, server) == (folder, files)
+    assert server.downloads == 1
+
+
+def test_stale_template_is_revalidated(server, tmp_path):
+    cache = TemplateCache(str(tmp_path), max_age=0)
+    folder, _ = checkout(cache, server)
+    assert checkout(cache, server)[0] == folder
+    assert server.downloads == 2
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+
+    server.update(zip_folder(TEMPLATE_PATH, extra="v2"), '"v2"')
+    updated, files = checkout(cache, server)
+    assert updated != folder
+    assert "extra.txt" in files
+
+
+def test_offline(server, tmp_path):
+    with pytest.raises(ValueError):
+        checkout(TemplateCache(str(tmp_path), offline=True), server)
+
+    folder, _ = checkout(TemplateCache(str(tmp_path), max_age=0), server)
+    server.stop()
+    assert checkout(TemplateCache(str(tmp_path), offline=True), server)[0] == folder
+    # with the server gone the cached template is used as well
+    assert checkout(TemplateCache(str(tmp_path), max_age=0), server)[0] == folder
+
+
+def test_least_recently_used_are_evicted(server, tmp_path):
+    cache = TemplateCache(str(tmp_path), max_age=3600)
+    first, _ = checkout(cache, server, "public/first")
+    server.update(zip_folder(TEMPLATE_PATH, extra="second"), '"second"')
+    second, _ = checkout(cache, server, "public/second")
+    assert os.path.isdir(first) and os.path.isdir(second)
+
+    cache.max_size = cache.entry("public/second")["size"]
+    server.update(zip_folder(TEMPLATE_PATH, extra="third"), '"third"')
+    third, _ = checkout(cache, server, "public/third")
+    assert not os.path.exists(first)
+    assert cache.entry("public/first") is None
+    assert os.path.isdir(third)
+
+
+def test_pinned_templates_are_not_evicted(server, tmp_path):
+    cache = TemplateCache(str(tmp_path), max_age=3600)
+    with cache.checkout("public/first", lambda: server.url) as first:
+        pin = cache.pin(first)
+    server.update(zip_folder(TEMPLATE_PATH, extra="second"), '"second"')
+    second, _ = checkout(cache, server, "public/second")
+
+    cache.max_size = cache.entry("public/second")["size"]
+    cache.evict(keep="public/second")
+    assert os.path.isdir(first)
+
+    pin.release()
+    cache.evict(keep="public/second")
+    assert not os.path.exists(first)
+    assert os.path.isdir(second)
+
+
+def test_shared_file_locks(tmp_path):
+    path = str(tmp_path / "pins" / "a.lock")
+    with FileLock(path, shared=True):
+        other = FileLock(path, shared=True)
+        assert other.acquire(blocking=False)
+        other.release()
+        assert not FileLock(path).acquire(blocking=False)
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "locks" / "a.lock")
+    with FileLock(path):
+        other = FileLock(path)
+        assert not other.acquire(blocking=False)
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def cache_tree(name: str) -> str:
+    cache = get_default_template_cache()
+    return cache.tree_path(cache.entry(name)["digest"])
+
+
+def test_public_loader_uses_cache(server, tmp_path, monkeypatch):
+    monkeypatch.setenv("JTEX_TEMPLATE_MAX_AGE", "3600")
+    monkeypatch.delenv("JTEX_NO_CACHE", raising=False)
+    monkeypatch.delenv("JTEX_OFFLINE", raising=False)
+    monkeypatch.setattr(PublicTemplateLoader, "_lookup_link", lambda *_: server.url)
+
+    for target in ["a", "b"]:
+        with PublicTemplateLoader(str(tmp_path / target)) as loader:
+            options, renderer = loader.initialise_from_template_api("public/cn")
+            assert not os.path.exists(tmp_path / target / "template.tex")
+            assert loader.template_location == cache_tree("public/cn")
+            assert options.get("config.schema.aside") == "callout"
+    assert server.downloads == 1
+
+
+def test_public_loader_reads_cache_in_memory(server, tmp_path, monkeypatch):
+    monkeypatch.setenv("JTEX_TEMPLATE_MAX_AGE", "3600")
+    monkeypatch.delenv("JTEX_NO_CACHE", raising=False)
+    monkeypatch.delenv("JTEX_OFFLINE", raising=False)
+    monkeypatch.setattr(PublicTemplateLoader, "_lookup_link", lambda *_: server.url)
+
+    fs = MemoryFileSystem()
+    loader = PublicTemplateLoader(str(tmp_path / "out"), fs=fs)
+    options, _ = loader.initialise_from_template_api("public/cn")
+    assert options.get("config.schema.aside") == "callout"
+    assert loader.template_location == cache_tree("public/cn")
+    assert not fs.exists(str(tmp_path / "out" / "template.tex"))
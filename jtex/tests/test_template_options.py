@@ -1,3 +1,6 @@
+import importlib
+import os
+import shutil
 import unittest
 
 import pkg_resources
@@ -5,6 +8,9 @@ import pytest
 
 from jtex.TemplateOptions import TemplateOptions
 
+# the module, jtex.TemplateOptions is the class once jtex is imported
+TemplateOptions_module = importlib.import_module("jtex.TemplateOptions")
+
 DEFAULT_TEMPLATE_PATH = pkg_resources.resource_filename("jtex", "builtin_template")
 
 
@@ -47,3 +53,54 @@ class TestTemplateOptions(unittest.TestCase):
         atags = self.default_options.get_allowed_tags()
         assert isinstance(atags, set)
         assert len(atags) > 0
+
+
+@pytest.fixture(name="template_path")
+def _template_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("JTEX_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("JTEX_NO_CACHE", raising=False)
+    path = tmp_path / "template"
+    shutil.copytree(DEFAULT_TEMPLATE_PATH, path)
+    return str(path)
+
+
+def no_validation(*args, **kwargs):
+    raise AssertionError("template.yml validated again")
+
+
+def test_cached_options_skip_validation(template_path, tmp_path, monkeypatch):
+    first = TemplateOptions(template_path)
+    assert len(os.listdir(tmp_path / "cache" / "options")) == 1
+
+    monkeypatch.setattr(TemplateOptions_module, "Core", no_validation)
+    second = TemplateOptions(template_path)
+    assert second.get("metadata") == first.get("metadata")
+    assert second.config_options == first.config_options
+    assert second.get_allowed_tags() == first.get_allowed_tags()
+
+
+def test_changed_template_yml_is_validated(template_path, monkeypatch):
+    TemplateOptions(template_path)
+    template_yml = os.path.join(template_path, "template.yml")
+    with open(template_yml) as file:
+        config = file.read()
+    with open(template_yml, "w") as file:
+        file.write(config.replace("Plain LaTeX (built-in)", "Changed"))
+
+    assert TemplateOptions(template_path).get("metadata.title") == "Changed"
+    monkeypatch.setattr(TemplateOptions_module, "Core", no_validation)
+    assert TemplateOptions(template_path).get("metadata.title") == "Changed"
+
+
+def test_changed_schema_is_validated(template_path, monkeypatch):
+    TemplateOptions(template_path)
+    monkeypatch.setattr(TemplateOptions_module, "schemas_digest", lambda: "changed")
+    monkeypatch.setattr(TemplateOptions_module, "Core", no_validation)
+    with pytest.raises(AssertionError):
+        TemplateOptions(template_path)
+
+
+def test_no_cache(template_path, tmp_path, monkeypatch):
+    monkeypatch.setenv("JTEX_NO_CACHE", "1")
+    TemplateOptions(template_path)
+    assert not os.path.exists(tmp_path / "cache" / "options")
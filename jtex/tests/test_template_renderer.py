@@ -1,11 +1,16 @@
+import logging
+import os
 import tempfile
+import threading
 from os import path
 
 import pytest
 from dateutil import parser
+from jinja2 import Environment, UndefinedError
 from jinja2.loaders import PackageLoader
 
-from jtex.TemplateRenderer import TemplateRenderer
+from jtex.BytecodeCache import TemplateBytecodeCache
+from jtex.TemplateRenderer import COMPILED_FOLDER, TemplateRenderer, UndefinedPolicy
 
 
 def test_not_initialized_on_construction():
@@ -110,3 +115,199 @@ def test_rendering(renderer):
     assert r"\title{A Paper}" in output
     assert r"\newdate{articleDate}{18}{6}{2021}" in output
     assert r"Lorem ipsum blahdium..." in output
+
+
+def test_bytecode_cache_reused_across_environments():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(path.join(tmp, "a.tex"), "w") as file:
+            file.write("[# for i in items #][-i-][# endfor #]")
+        cache_dir = path.join(tmp, "cache")
+
+        first = TemplateRenderer(TemplateBytecodeCache(cache_dir))
+        first.use_from_folder(tmp)
+        assert first.render(dict(items=[1, 2]), "", "a.tex") == "12"
+        cached = os.listdir(cache_dir)
+        assert len(cached) == 1
+
+        second = TemplateRenderer(TemplateBytecodeCache(cache_dir))
+        second.use_from_folder(tmp)
+        assert second.jinja is not None
+        bucket = second.bytecode_cache.get_bucket(
+            second.jinja, "a.tex", None, "[# for i in items #][-i-][# endfor #]"
+        )
+        assert bucket.code is not None
+        assert second.render(dict(items=[3]), "", "a.tex") == "3"
+        assert os.listdir(cache_dir) == cached
+
+
+def test_bytecode_cache_keyed_on_syntax():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TemplateBytecodeCache(tmp)
+        renderer = TemplateRenderer(cache)
+        renderer.reset_environment()
+        assert renderer.jinja is not None
+        key = cache.get_key(renderer.jinja, "a.tex", "[-x-]")
+        assert key == cache.get_key(renderer.jinja, "a.tex", "[-x-]")
+        assert key != cache.get_key(renderer.jinja, "a.tex", "[-y-]")
+        assert key != cache.get_key(Environment(), "a.tex", "[-x-]")
+
+
+def test_bytecode_cache_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["a.tex", "b.tex", "c.tex"]:
+            with open(path.join(tmp, name), "w") as file:
+                file.write(f"{name} [-x-]")
+        cache_dir = path.join(tmp, "cache")
+
+        renderer = TemplateRenderer(TemplateBytecodeCache(cache_dir, max_size=1))
+        renderer.use_from_folder(tmp)
+        for name in ["a.tex", "b.tex", "c.tex"]:
+            renderer.render(dict(x=1), "", name)
+
+        assert len(os.listdir(cache_dir)) == 0
+
+
+def test_compiled_templates():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(path.join(tmp, "template.tex"), "w") as file:
+            file.write("[# for i in items #][-i-]|[# endfor #]")
+
+        source = TemplateRenderer()
+        source.use_from_folder(tmp)
+        assert source.compile_templates(path.join(tmp, COMPILED_FOLDER)) == [
+            "template.tex"
+        ]
+
+        compiled = TemplateRenderer()
+        assert compiled.use_compiled(tmp)
+        assert compiled.list_templates() == ["template.tex"]
+        assert compiled.render(dict(items=[1, 2]), "") == "1|2|"
+
+        with open(path.join(tmp, "template.tex"), "w") as file:
+            file.write("changed")
+        assert not TemplateRenderer().use_compiled(tmp)
+
+
+def test_undefined_silent_summary(renderer):
+    T = "[-doc.missing.title-][-doc.missing.title-][-other.name-]"
+
+    summary = {}
+    output = renderer.render_from_string(T, dict(doc=dict()), undefined_summary=summary)
+
+    assert output == "NoneNoneNone"
+    assert summary == dict(missing=2, other=1)
+
+
+def test_undefined_summary_per_render(renderer):
+    summary = {}
+    renderer.render_from_string("[-a.b-]", dict(), undefined_summary=summary)
+    assert summary == dict(a=1)
+    renderer.render_from_string("[-x-]", dict(x=1), undefined_summary=summary)
+    assert summary == dict()
+
+
+def test_undefined_printed_and_tested(renderer):
+    T = "[-doc.title-][# if doc.x #]y[# endif #][-foo-]|[-doc.a.b-]"
+
+    summary = {}
+    output = renderer.render_from_string(T, dict(doc=dict()), undefined_summary=summary)
+
+    assert output == "|None"
+    assert summary == dict(title=1, x=1, foo=1, a=1)
+
+
+def test_undefined_iterated(renderer):
+    T = "[# for i in items #][-i-][# endfor #][-items | length-]"
+
+    summary = {}
+    assert renderer.render_from_string(T, dict(), undefined_summary=summary) == "0"
+    assert summary == dict(items=2)
+
+
+def test_undefined_log_once(caplog):
+    renderer = TemplateRenderer(undefined_policy=UndefinedPolicy.log_once)
+    renderer.reset_environment()
+
+    summary = {}
+    with caplog.at_level(logging.WARNING):
+        renderer.render_from_string(
+            "[-a.b-][-a.b-][-a.b-]", dict(), undefined_summary=summary
+        )
+
+    assert len([r for r in caplog.records if "undefined variable" in r.message]) == 1
+    assert summary == dict(a=3)
+
+
+def test_undefined_log_once_printed_and_tested(caplog):
+    renderer = TemplateRenderer(undefined_policy=UndefinedPolicy.log_once)
+    renderer.reset_environment()
+
+    summary = {}
+    with caplog.at_level(logging.WARNING):
+        renderer.render_from_string(
+            "[-title-][# if title #]y[# endif #]", dict(), undefined_summary=summary
+        )
+
+    assert len([r for r in caplog.records if "undefined variable" in r.message]) == 1
+    assert summary == dict(title=2)
+
+
+def test_undefined_strict():
+    renderer = TemplateRenderer(undefined_policy=UndefinedPolicy.strict)
+    renderer.reset_environment()
+
+    with pytest.raises(UndefinedError):
+        renderer.render_from_string("[-title-]", dict())
+    assert renderer.render_from_string("[-title-]", dict(title="A")) == "A"
+
+
+def test_undefined_summary_when_streaming():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(path.join(tmp, "template.tex"), "w") as file:
+            file.write("[-doc.a.b-] [-CONTENT-]")
+        renderer = TemplateRenderer()
+        renderer.use_from_folder(tmp)
+        summary = {}
+        pieces = renderer.generate(dict(doc=dict()), "body", undefined_summary=summary)
+        assert "".join(pieces) == "None body"
+        assert summary == dict(a=1)
+
+
+def test_undefined_summary_per_thread(renderer):
+    barrier = threading.Barrier(2)
+    summaries = [{}, {}]
+
+    def render(idx: int):
+        barrier.wait()
+        for _ in range(50):
+            renderer.render_from_string(
+                f"[-a{idx}.b-]" * (idx + 1), dict(), undefined_summary=summaries[idx]
+            )
+
+    threads = [threading.Thread(target=render, args=(idx,)) for idx in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert summaries == [dict(a0=1), dict(a1=2)]
+
+
+def test_render_from_string_compiles_once(renderer):
+    T = "[# for i in items #][-i-][# endfor #]"
+
+    assert renderer.render_from_string(T, dict(items=[1])) == "1"
+    assert renderer.render_from_string(T, dict(items=[1, 2])) == "12"
+    assert renderer.render_from_string("[-x-]", dict(x="y")) == "y"
+
+    stats = renderer.string_cache_stats
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+
+
+def test_render_from_string_cache_bounded():
+    renderer = TemplateRenderer(string_cache_size=2)
+    renderer.reset_environment()
+    for n in range(5):
+        assert renderer.render_from_string(f"{n}[-x-]", dict(x="!")) == f"{n}!"
+    assert renderer.string_cache_stats["size"] == 2
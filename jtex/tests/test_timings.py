@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import tempfile
+
+from jtex.Timings import Timings, timed, timed_iter
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def test_phases_are_accumulated():
+    with Timings() as timings:
+        for _ in range(3):
+            with timed("a"):
+                pass
+        assert list(timed_iter("b", iter("xy"))) == ["x", "y"]
+
+    report = timings.to_dict()
+    assert list(report["phases"]) == ["a", "b"]
+    assert report["phases"]["a"]["count"] == 3
+    assert report["phases"]["b"]["count"] == 3
+    assert report["wall"] >= report["phases"]["a"]["wall"]
+
+
+def test_timed_is_a_no_op_without_timings():
+    timings = Timings()
+    with timed("a"):
+        pass
+    items = iter("xy")
+    assert timed_iter("b", items) is items
+    assert timings.phases == {}
+
+
+def test_cli_render_timings():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report_path = os.path.join(tmp_dir, "timings.json")
+        CLI_CMD = (
+            f"jtex render "
+            f"{os.path.join(DIR, 'data', 'cn', 'main.tex')} "
+            f"--output-path {os.path.join(tmp_dir, 'out')} "
+            f"--template-path {os.path.join(DIR, 'data', 'cn', 'template')} "
+            f"--timings {report_path}"
+        )
+        ret_val = subprocess.run(CLI_CMD, shell=True)
+        assert ret_val.returncode == 0
+
+        with open(report_path) as file:
+            report = json.load(file)
+    for phase in [
+        "read_content",
+        "parse_front_matter",
+        "docmodel_validation",
+        "template.fetch",
+        "template_options_validation",
+        "defs.compose",
+        "defs.serialize",
+        "defs.write",
+        "render",
+        "transforms",
+        "assets.glob",
+    ]:
+        assert phase in report["phases"], phase
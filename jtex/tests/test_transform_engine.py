@@ -0,0 +1,76 @@
+import pickle
+import re
+
+import pytest
+
+from jtex.options import RegexTransform, SchemaOptionDefs
+from jtex.options.NatbibSchemaOption import citep_transform
+from jtex.TransformEngine import TransformEngine
+
+
+def sequential(transforms, content):
+    for transform in transforms:
+        content = transform(content)
+    return content
+
+
+TRANSFORMS = [
+    citep_transform,
+    RegexTransform(r"\\textbf{(\w+)}", r"\\bf{\1}x"),
+    RegexTransform(r"(?P<word>colou?r)", r"[\g<word>]", flags=re.IGNORECASE),
+    RegexTransform(r"^%% (.*)$", r"% \1", flags=re.MULTILINE),
+]
+
+
+@pytest.fixture(
+    params=[
+        "",
+        "nothing to do",
+        "a \\citep{x} and \\textbf{bold} in Colour\n%% comment\n",
+        "\\citep{\\citep{\\textbf{a}}} color COLOR\n",
+    ],
+    name="content",
+)
+def _content(request):
+    return request.param
+
+
+def test_fused_matches_sequential(content):
+    engine = TransformEngine(TRANSFORMS)
+    assert engine(content) == sequential(TRANSFORMS, content)
+
+
+def test_earliest_transform_wins_at_a_position():
+    engine = TransformEngine(
+        [
+            RegexTransform("ab", "1"),
+            RegexTransform("abc", "2"),
+            RegexTransform("c", "3"),
+        ]
+    )
+    assert engine("abc abc") == "13 13"
+
+
+def test_mixed_transforms_are_all_applied():
+    engine = TransformEngine(
+        [citep_transform, RegexTransform(r"(a)\1", "b"), str.upper]
+    )
+    assert engine("\\citep{aa}") == "\\CITE{B}"
+
+
+def test_engine_pickles(content):
+    engine = pickle.loads(pickle.dumps(TransformEngine(TRANSFORMS)))
+    assert engine(content) == sequential(TRANSFORMS, content)
+
+
+def test_transforms_are_registered_by_name(monkeypatch):
+    monkeypatch.setattr(SchemaOptionDefs, "_registered_transforms", {})
+    bold = SchemaOptionDefs.register_transform("bold", r"\\textbf{", r"\\bf{")
+    with pytest.raises(ValueError):
+        SchemaOptionDefs.register_transform("bold", "a", "b")
+
+    defs = SchemaOptionDefs(transforms=["bold", str.upper])
+    assert defs.transforms == [bold, str.upper]
+    assert TransformEngine(defs.transforms)("\\textbf{a}") == "\\BF{A}"
+    with pytest.raises(ValueError):
+        SchemaOptionDefs(transforms=["missing"])
@@ -1,9 +1,25 @@
+import datetime
+import hashlib
 import logging
-from typing import Dict, Optional, Tuple
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 
-import requests
 import yaml
 
+from .Downloader import get_downloader
+
 
 def just_log_errors(message_func):
     """
@@ -43,19 +59,315 @@ def log_and_raise_errors(message_func):
     return decorator
 
 
-def download(url, save_path, chunk_size=128):
+class LRUCache:
+    """
+    A small thread safe least recently used cache with hit/miss accounting
+
+    on_evict is called with the key and value of each item dropped to keep
+    within max_size or replaced by a new value for its key.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("LRUCache max_size must be at least 1")
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            replaced = self._items.get(key)
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if replaced is not None and replaced is not value:
+                self._evicted(key, replaced)
+            while len(self._items) > self.max_size:
+                evicted, evicted_value = self._items.popitem(last=False)
+                logging.info("LRUCache - evicted %s", evicted)
+                self._evicted(evicted, evicted_value)
+
+    def _evicted(self, key: Hashable, value: Any):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                return self.get(key)
+            self.misses += 1
+            value = factory()
+            self.put(key, value)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self._items.keys())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            hits=self.hits, misses=self.misses, size=len(self), max_size=self.max_size
+        )
+
+
+def fingerprint(contents: Iterable[Tuple[str, str]]) -> str:
+    """
+    Stable hash over (name, content) pairs, independent of their order
+    """
+    hasher = hashlib.sha256()
+    for name, content in sorted(contents):
+        hasher.update(name.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(content.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_digest(content: str) -> str:
+    """
+    sha256 of text as written to an output, utf-8 encoded
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    sha256 of a file's bytes, read in chunks
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def same_content(path: str, size: int, digest: str) -> bool:
+    """
+    True if the file at path exists with the given size and sha256, the size is
+    checked first so most changed files are detected without reading them
+    """
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        return file_digest(path) == digest
+    except OSError:
+        return False
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Write content to path unless the file already holds exactly that content,
+    leaving its mtime untouched. Returns True if the file was written.
+    """
+    data = content.encode("utf-8")
+    if same_content(path, len(data), hashlib.sha256(data).hexdigest()):
+        return False
+    with open(path, "wb") as file:
+        file.write(data)
+    return True
+
+
+class ChangeTrackingWriter:
+    """
+    Text file writer for streamed output that only replaces the target if the
+    content changed
+
+    Output goes to a temporary file next to path while its size and hash are
+    tracked, on close it is moved over path or discarded if path already held
+    the same content. `changed` reports which happened and `digest` is the
+    sha256 of the content written.
+    """
+
+    def __init__(self, path: str, buffering: int = -1):
+        self.path = path
+        self.changed = False
+        self.digest = ""
+        self._tmp_path = f"{path}.jtex-tmp"
+        self._hasher = hashlib.sha256()
+        self._size = 0
+        self._file = open(self._tmp_path, "wb", buffering=buffering)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self._file.close()
+            os.remove(self._tmp_path)
+            return
+        self.close()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self._hasher.update(data)
+        self._size += len(data)
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+        self.digest = self._hasher.hexdigest()
+        if same_content(self.path, self._size, self.digest):
+            os.remove(self._tmp_path)
+            self.changed = False
+        else:
+            os.replace(self._tmp_path, self.path)
+            self.changed = True
+
+
+def copy_if_changed(src: str, dst: str) -> bool:
+    """
+    Copy src to dst with its mtime, unless dst is already an identical copy.
+    Files of equal size and exactly equal mtime, as a previous copy leaves
+    them, are taken as unchanged without reading either, otherwise equal sized
+    files are compared by content. Returns True if the file was copied.
+    """
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+        if src_stat.st_size == dst_stat.st_size and (
+            dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+            or file_digest(src) == file_digest(dst)
+        ):
+            return False
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+    return True
+
+
+def get_cache_dir(*parts: str) -> str:
+    """
+    Location of jtex's on-disk caches, JTEX_CACHE_DIR or ~/.cache/jtex by default
+    """
+    root = os.getenv("JTEX_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "jtex"
+    )
+    return os.path.join(root, *parts)
+
+
+def download(url, save_path, sha256=None):
     """
     Download a file from a url and save to the save_path provided
     """
-    resp = requests.get(url, stream=True)
-    with open(save_path, "wb") as file:
-        for chunk in resp.iter_content(chunk_size=chunk_size):
-            file.write(chunk)
+    return get_downloader().download(url, save_path, sha256=sha256)
 
 
 FM_DELIM = "% ---"
 FM_LINE = "% "
 
+# libyaml's parser and emitter, when PyYAML was built with it
+CFullLoader = getattr(yaml, "CFullLoader", None)
+CDumper = getattr(yaml, "CDumper", None)
+
+# the emitters only differ in how they fold double quoted scalars, written for
+# anything outside printable ascii, stay well clear of the 80 column width
+C_DUMP_WIDTH = 72
+C_DUMP_SCALARS = (bool, int, float, type(None), datetime.date)
+LINE_BREAKS = ("\n", "\r", "\x85", "\u2028", "\u2029")
+
+
+def escaped_length(text: str) -> int:
+    """
+    Upper bound on the length of text written as a double quoted scalar
+    """
+    length = 2
+    for ch in text:
+        if " " <= ch <= "~":
+            length += 2 if ch in '"\\' else 1
+        elif ch <= "\xff":
+            length += 4
+        elif ch <= "\uffff":
+            length += 6
+        else:
+            length += 10
+    return length
+
+
+def c_dump_safe(data: Any, column: int = 0) -> bool:
+    """
+    True if libyaml writes data exactly as the python emitter does
+
+    Strings of printable ascii are always written the same, other strings are
+    double quoted and only fine if they cannot reach the line width, column
+    is an upper bound on where a value at this depth starts.
+    """
+    if isinstance(data, str):
+        if data.isascii() and data.isprintable():
+            return True
+        if any(br in data for br in LINE_BREAKS):
+            return False
+        return column + escaped_length(data) <= C_DUMP_WIDTH
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(key, str):
+                if not (key.isascii() and key.isprintable()) or len(key) > 64:
+                    return False
+            elif not isinstance(key, C_DUMP_SCALARS):
+                return False
+            if not c_dump_safe(value, column + len(str(key)) + 4):
+                return False
+        return True
+    if type(data) is list:
+        return all(c_dump_safe(item, column + 2) for item in data)
+    return isinstance(data, C_DUMP_SCALARS)
+
+
+def load_yaml(text: str) -> Any:
+    """
+    yaml.load with the FullLoader, parsed by libyaml when available
+    """
+    if CFullLoader is not None:
+        try:
+            return yaml.load(text, Loader=CFullLoader)
+        except yaml.YAMLError:
+            # let the python parser decide, and word the error
+            pass
+    return yaml.load(text, Loader=yaml.FullLoader)
+
+
+def dump_yaml(data: Any) -> str:
+    """
+    yaml.dump, emitted by libyaml when available and the output is identical
+    """
+    if CDumper is not None and c_dump_safe(data):
+        return yaml.dump(data, Dumper=CDumper)
+    return yaml.dump(data)
+
 
 def parse_front_matter(content: str) -> Tuple[Optional[Dict], str]:
     if len(content) == 0 or content.count(FM_DELIM) < 2:
@@ -79,16 +391,66 @@ def parse_front_matter(content: str) -> Tuple[Optional[Dict], str]:
     rest = "\n".join(lines[idx:])
 
     return (
-        yaml.load("\n".join(fm_lines), Loader=yaml.FullLoader),
+        load_yaml("\n".join(fm_lines)),
         rest if len(rest) > 0 else "",
     )
 
 
+class ContentBody:
+    """
+    The content after the front matter of a file, read from disk on demand
+    """
+
+    def __init__(self, path: str, offset: int):
+        self.path = path
+        # position in the text stream of the file, as returned by tell
+        self.offset = offset
+
+    def read(self) -> str:
+        with open(self.path, "r") as file:
+            file.seek(self.offset)
+            return file.read()
+
+    def __str__(self) -> str:
+        return self.read()
+
+
+def read_front_matter(path: str) -> Tuple[Optional[Dict], ContentBody]:
+    """
+    The front matter and body of a content file, as parse_front_matter returns
+    them for its content, reading only as far as the closing delimiter
+
+    The body is not read until asked for. Files without a closing delimiter
+    line are read to the end, as parse_front_matter would, and have no body.
+    """
+    with open(path, "r") as file:
+        lines: List[str] = []
+        opened = False
+        while True:
+            line = file.readline()
+            if line == "":
+                return parse_front_matter("".join(lines))[0], ContentBody(
+                    path, file.tell()
+                )
+            lines.append(line)
+            if not line.startswith(FM_DELIM):
+                continue
+            if not opened:
+                opened = True
+                start = len(lines)
+                continue
+            fm_lines = [
+                (l[:-1] if l.endswith("\n") else l)[len(FM_LINE) :]
+                for l in lines[start:-1]
+            ]
+            return load_yaml("\n".join(fm_lines)), ContentBody(path, file.tell())
+
+
 def stringify_front_matter(data: Dict):
     if len(data.keys()) == 0:
         return ""
 
-    raw_fm = yaml.dump(data)
+    raw_fm = dump_yaml(data)
     lines = raw_fm.split("\n")
 
     front_matter_lines = [f"{FM_DELIM}"]